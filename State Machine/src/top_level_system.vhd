@@ -4,7 +4,11 @@ use ieee.numeric_std.all;
 
 entity top_level_system is
   generic (
-            DC_WIDTH   : natural := 8
+            DC_WIDTH   : natural := 8;
+            -- counter limits, made generics so simulation can run on a scaled time base:
+            SELF_TEST_COUNT : natural := 300_000_000; -- cycles per self-test ROM entry (3 s)
+            TEN_MS_COUNT    : natural := 1_000_000;   -- cycles per velocity update (10 ms)
+            SEG7_COUNT      : natural := 50_000       -- cycles per seven-segment digit (0.5 ms)
           );
   port (
           mclk     : in  std_logic;
@@ -34,6 +38,9 @@ architecture rtl of top_level_system is
   end component;
 
   component seg7ctrl is 
+    generic (
+           MAX_COUNT : natural
+         );
     port ( 
            mclk : in std_logic; -- 100MHz, positive flank
            reset : in std_logic; -- Asynchronous reset, active high
@@ -45,6 +52,9 @@ architecture rtl of top_level_system is
   end component; 
 
   component velocity_reader is
+    generic(
+          TEN_MS_COUNT : natural
+        );
     port(
           mclk      : in std_logic; 
           reset     : in std_logic; 
@@ -62,6 +72,9 @@ architecture rtl of top_level_system is
   end component;
 
   component self_test_module
+    generic (
+           threesec : natural
+         );
     port (
            mclk        : in  std_logic;
            reset      : in  std_logic;
@@ -111,6 +124,9 @@ begin
           );
 
   vr : velocity_reader
+  generic map(
+            TEN_MS_COUNT => TEN_MS_COUNT
+          )
   port map(
             mclk      => mclk,
             reset     => reset,
@@ -120,6 +136,9 @@ begin
           );
 
   seg7ctrl_inst : seg7ctrl
+  generic map (
+             MAX_COUNT  => SEG7_COUNT
+           )
   port map (
              mclk       => mclk,
              reset      => reset,
@@ -130,6 +149,9 @@ begin
            );
 
   self_test_inst : self_test_module
+  generic map (
+             threesec    => SELF_TEST_COUNT
+           )
   port map (
              mclk        => mclk,
              reset      => reset,
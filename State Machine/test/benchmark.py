@@ -0,0 +1,154 @@
+'''
+benchmark.py : Simulation performance benchmarks with trend tracking.
+
+  Runs fixed scenarios with a fixed seed through the regression runner, one
+  at a time so they do not compete for the CPU, and appends one record per
+  scenario to a history file (JSON lines):
+
+    pwm      : tb_pwm, ordinary tests and fault injection
+    decoder  : tb_quadrature_decoder, 100 rotations and a random walk
+    system   : tb_system at full time scale (main_test, per_cycle_test)
+    velocity : tb_system self_test_sweep at TIME_SCALE=1000, a long run of
+               (scaled) 10 ms velocity ticks
+
+  A record holds the wall time, simulated ns per wall second (results.xml),
+  the peak RSS of the simulator and the wakeups of the profiled testbench
+  coroutines (TB_PROFILE=counts, see profiling.py). A metric worse than the
+  median of the last --window passing records of the scenario on the same
+  host by more than --threshold is flagged as a regression.
+
+  usage:
+    python benchmark.py                              # run all, compare, append
+    python benchmark.py --scenario pwm --threshold 0.2
+    python benchmark.py --report                     # print the history only
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import regression
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+OUT_DIR = os.path.join(TEST_DIR, 'benchmark')
+HISTORY_FILE = os.path.join(TEST_DIR, 'benchmark_history.jsonl')
+PROFILE_FILE = 'profile.jsonl'
+SEED = 1
+
+# scenario: (bench, TESTCASE or None for all tests, TIME_SCALE)
+SCENARIOS = {
+    'pwm': ('tb_pwm', None, 1),
+    'decoder': ('tb_quadrature_decoder', None, 1),
+    'system': ('tb_system', None, 1),
+    'velocity': ('tb_system', 'self_test_sweep', 1000),
+}
+
+# metric: +1 when higher is worse, -1 when lower is worse
+METRICS = {'wall_s': 1, 'sim_ns_per_s': -1, 'peak_rss_kb': 1, 'wakeups': 1}
+
+def measure(name, out_dir=OUT_DIR):
+    ''' Runs one scenario and returns its record. Runs in a fresh worker process,
+        so the peak RSS of its children is the simulator's own. '''
+    bench, testcase, time_scale = SCENARIOS[name]
+    job = regression.make_jobs([bench], [SEED], 1, {}, time_scale)[0]
+    job.env.update({'TB_PROFILE': 'counts', 'TB_PROFILE_FILE': PROFILE_FILE})
+    if testcase: job.env['TESTCASE'] = testcase
+    job, results, wall, error = regression.run_job(job, out_dir)
+
+    cases = list(ET.parse(results).getroot().iter('testcase')) if os.path.isfile(results) else []
+    failed = error is not None or not cases or any(
+        case.find('failure') is not None or case.find('error') is not None for case in cases)
+    sim_ns = sum(float(case.get('sim_time_ns', 0)) for case in cases)
+    wakeups = 0
+    profile = os.path.join(out_dir, job.name, PROFILE_FILE)
+    if os.path.isfile(profile):
+        with open(profile) as f:
+            wakeups = sum(json.loads(line)['wakeups'] for line in f if line.strip())
+    return {'scenario': name, 'tests': len(cases), 'failed': failed,
+            'wall_s': round(wall, 3), 'sim_ns': sim_ns, 'sim_ns_per_s': round(sim_ns/wall if wall else 0, 1),
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, 'wakeups': wakeups}
+
+def git_commit():
+    ''' Short hash of HEAD, with + when the tree has local changes '''
+    def git(*args):
+        return subprocess.run(['git'] + list(args), cwd=TEST_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    return commit + ('+' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+def load_history(path):
+    if not os.path.isfile(path): return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def regressions(record, history, window, threshold):
+    ''' Returns [(metric, value, baseline, relative change)] worse than threshold '''
+    previous = [r for r in history if r['scenario'] == record['scenario'] and r['host'] == record['host']
+                and not r['failed']][-window:]
+    if not previous: return []
+    found = []
+    for metric, sign in METRICS.items():
+        baseline = float(np.median([r[metric] for r in previous]))
+        if baseline <= 0: continue
+        change = (record[metric] - baseline)/baseline
+        if sign*change > threshold:
+            found.append((metric, record[metric], baseline, change))
+    return found
+
+def print_history(history, scenarios, last=10):
+    print("{s:<10} {c:<10} {d:<17} {w:>9} {n:>12} {r:>10} {k:>10}".format(
+        s='scenario', c='commit', d='date', w='wall_s', n='sim_ns/s', r='rss_kb', k='wakeups'))
+    for name in scenarios:
+        for r in [r for r in history if r['scenario'] == name][-last:]:
+            print("{s:<10} {c:<10} {d:<17} {w:>9.2f} {n:>12.0f} {r:>10} {k:>10}{f}".format(
+                s=name, c=r['commit'], d=r['date'], w=r['wall_s'], n=r['sim_ns_per_s'],
+                r=r['peak_rss_kb'], k=r['wakeups'], f='  FAILED' if r['failed'] else ''))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="scenario to run (default: all)")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON lines history file")
+    parser.add_argument('--window', type=int, default=5, help="previous records in the baseline median")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change flagged as a regression")
+    parser.add_argument('--no-append', action='store_true', help="compare only, do not record the run")
+    parser.add_argument('--report', action='store_true', help="print the history and exit")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    history = load_history(args.history)
+    if args.report:
+        print_history(history, scenarios)
+        return 0
+
+    regression.analyze()
+    stamp = {'date': time.strftime('%Y-%m-%d %H:%M'), 'commit': git_commit(), 'host': platform.node()}
+    records, flagged = [], []
+    for name in scenarios:
+        # A fresh process per scenario: RUSAGE_CHILDREN then only covers this simulation
+        with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+            record = dict(stamp, **pool.submit(measure, name).result())
+        records.append(record)
+        print("{s:<10} {t} tests{f}, {w:.2f}s wall, {n:.0f} sim ns/s, {r} kB peak RSS, {k} wakeups".format(
+            s=name, t=record['tests'], f=' FAILED' if record['failed'] else '', w=record['wall_s'],
+            n=record['sim_ns_per_s'], r=record['peak_rss_kb'], k=record['wakeups']))
+        for metric, value, baseline, change in regressions(record, history, args.window, args.threshold):
+            flagged.append(name)
+            print("    REGRESSION {m}: {v:g} vs baseline {b:g} ({c:+.1%})".format(m=metric, v=value, b=baseline, c=change))
+
+    if not args.no_append:
+        with open(args.history, 'a') as f:
+            for record in records: f.write(json.dumps(record) + "\n")
+    failed = [r['scenario'] for r in records if r['failed']]
+    if failed: print("Failing scenarios: " + ', '.join(failed))
+    return 1 if flagged or failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
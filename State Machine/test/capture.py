@@ -0,0 +1,138 @@
+'''
+capture.py : Selective, windowed waveform capture driven from the testbench.
+
+  A full GHW dump of top_level_system costs simulator time and disk space
+  for every signal of the design. WaveCapture records only the signals a
+  testbench asks for (with an EdgeRecorder) and keeps only the windows it
+  is told about:
+
+    trigger(t)           : pre_us before to post_us after a time, e.g. an error
+    watch(messages)      : a trigger for every MessageQueue error
+    open() ... close()   : a window around a phase, e.g. one FaultInjector step
+
+  Records older than pre_us that are outside all windows are dropped when
+  the buffer fills, so memory stays bounded on long runs. (Errors reported
+  late, like TB_MONITOR=trace does at check(), only get what is left.)
+  save() writes one column pair per signal to an .npz file, load_capture()
+  reads it back as edge_trace SignalTraces.
+
+  Set TB_CAPTURE=<file>.npz to enable it in the testbenches (one file per
+  test, <file>_<test>.npz), TB_CAPTURE_WINDOW_US for the margins, and run
+  make WAVE=0 to skip the full GHW dump.
+
+  usage (summary of a capture file):
+    python capture.py capture_test_sequencer.npz
+'''
+import os
+import sys
+
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+from edge_trace import EdgeRecorder, SignalTrace
+
+CAPTURE_FILE = os.environ.get('TB_CAPTURE')
+WINDOW_US = float(os.environ.get('TB_CAPTURE_WINDOW_US', 20))
+
+class WaveCapture(EdgeRecorder):
+    ''' EdgeRecorder that only keeps the changes inside capture windows.
+        Times are in ps, windows are [start, end] with end None while open. '''
+    def __init__(self, signals, filename, signed=(), pre_us=WINDOW_US, post_us=WINDOW_US, capacity=1 << 18):
+        EdgeRecorder.__init__(self, signals, signed, capacity)
+        self.filename = filename
+        self.pre = int(pre_us*1e6)
+        self.post = int(post_us*1e6)
+        self.windows = []
+
+    def trigger(self, time=None):
+        ''' Adds a window around time (ps, default now) '''
+        if time is None: time = get_sim_time('ps')
+        self.windows.append([max(time - self.pre, 0), time + self.post])
+
+    def watch(self, messages):
+        ''' Triggers a window for every error put in a MessageQueue (times in ns) '''
+        messages.listeners.append(lambda error_type, time: self.trigger(int(time*1000)))
+
+    def open(self):
+        ''' Opens a window from pre_us before now, returns it for close() '''
+        window = [max(get_sim_time('ps') - self.pre, 0), None]
+        self.windows.append(window)
+        return window
+
+    def close(self, window):
+        window[1] = get_sim_time('ps') + self.post
+
+    def grow(self):
+        ''' Drops what no window can need any more before growing the buffers '''
+        self.prune(get_sim_time('ps'))
+        if self.size > len(self.time)//2:
+            EdgeRecorder.grow(self)
+
+    def prune(self, now):
+        ''' Keeps the records whose value is held at some time in a window or after now - pre_us '''
+        n = self.size
+        times, sig = self.time[:n], self.sig[:n]
+        # Each record holds its value until the next record of the same signal
+        order = np.lexsort((times, sig))
+        held = np.full(n, np.iinfo(np.int64).max)
+        same = sig[order][1:] == sig[order][:-1]
+        held[order[:-1][same]] = times[order][1:][same]
+        windows = self.merged_windows(now, [[now - self.pre, now]])
+        # First window ending at or after each record, kept if it starts before the value is replaced
+        first = np.searchsorted(windows[:, 1], times, side='left')
+        keep = windows[np.minimum(first, len(windows) - 1), 0] < held
+        kept = np.flatnonzero(keep)
+        self.size = len(kept)
+        for name in ('time', 'sig', 'val'):
+            buf = getattr(self, name)
+            buf[:self.size] = buf[kept]
+
+    def merged_windows(self, now, extra=()):
+        ''' Sorted, non-overlapping [start, end] windows up to now, open ones ending now '''
+        windows = sorted([start, min(now if end is None else end, now)] for start, end in self.windows + list(extra))
+        merged = []
+        for start, end in windows:
+            if merged and start <= merged[-1][1]: merged[-1][1] = max(merged[-1][1], end)
+            else: merged.append([start, end])
+        return np.array(merged, dtype=np.int64).reshape(-1, 2)
+
+    def save(self, filename=None):
+        ''' Writes the windows to an .npz file: windows, and <signal>/times, <signal>/values
+            per signal, each window starting with the value held at its start '''
+        windows = self.merged_windows(get_sim_time('ps'))
+        columns = {'windows': windows}
+        for name in self.names:
+            trace = self.signal(name)
+            times, values = [], []
+            for start, end in windows.tolist():
+                lo, hi = np.searchsorted(trace.times, [start, end], side='right')
+                times += [[start], trace.times[lo:hi]]
+                values += [trace.value_at([start]), trace.values[lo:hi]]
+            columns[name + '/times'] = np.concatenate(times).astype(np.int64) if times else np.zeros(0, np.int64)
+            columns[name + '/values'] = np.concatenate(values).astype(np.int64) if values else np.zeros(0, np.int64)
+        np.savez(filename or self.filename, **columns)
+        return windows
+
+def load_capture(filename):
+    ''' Returns (windows, {signal: SignalTrace}) from a file written by WaveCapture.save '''
+    with np.load(filename) as data:
+        names = sorted({key.rsplit('/', 1)[0] for key in data.files if '/' in key})
+        traces = {name: SignalTrace(data[name + '/times'], data[name + '/values']) for name in names}
+        return data['windows'], traces
+
+def make_capture(signals, test, signed=()):
+    ''' A started WaveCapture writing <TB_CAPTURE>_<test>.npz, or None when TB_CAPTURE is not set '''
+    if not CAPTURE_FILE: return None
+    root, ext = os.path.splitext(CAPTURE_FILE)
+    capture = WaveCapture(signals, '{r}_{t}{e}'.format(r=root, t=test, e=ext or '.npz'), signed)
+    capture.start()
+    return capture
+
+if __name__ == '__main__':
+    windows, traces = load_capture(sys.argv[1])
+    print("{n} windows, {t:.1f} us captured".format(n=len(windows), t=(windows[:, 1] - windows[:, 0]).sum()/1e6))
+    for start, end in windows.tolist():
+        print("    {s:.3f} us .. {e:.3f} us".format(s=start/1e6, e=end/1e6))
+    for name, trace in traces.items():
+        print("{n:<24} {c:>8} changes".format(n=name, c=len(trace)))
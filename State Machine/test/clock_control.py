@@ -0,0 +1,63 @@
+'''
+clock_control.py : Clock driver that can be paused or slowed down.
+
+  cocotb's Clock cannot be stopped, so a fault that holds the DUT static
+  for milliseconds still costs two Python wakeups per clock period.
+  ClockController drives the same 50:50 clock, but can pause it or switch
+  to a coarse period, and always resumes on the original edge grid so edge
+  indices (time/period) stay valid for models and scoreboards.
+'''
+from cocotb import start_soon
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from profiling import profile
+
+class ClockController():
+    ''' 50:50 clock on clk with rising edges at origin + k*period '''
+    def __init__(self, clk, period_ns):
+        self.clk = clk
+        self.period_ps = period_ns*1000
+        self.origin = get_sim_time('ps')
+        self.task = None
+        self.resume()
+
+    def next_edge(self, period_ps):
+        ''' First rising edge time on the grid at or after now '''
+        now = get_sim_time('ps')
+        return self.origin - (-(now - self.origin)//period_ps)*period_ps
+
+    async def run(self, period_ps, first):
+        now = get_sim_time('ps')
+        if first > now:
+            self.clk.value = 0
+            await Timer(first - now, 'ps')
+        half = period_ps//2
+        high = Timer(half, 'ps')
+        low = Timer(period_ps - half, 'ps')
+        while True:
+            self.clk.value = 1
+            await high
+            self.clk.value = 0
+            await low
+
+    def pause(self):
+        ''' Stops the clock, leaving it low '''
+        if self.task is not None:
+            self.task.kill()
+            self.task = None
+        self.clk.value = 0
+
+    def resume(self, factor=1):
+        ''' (Re)starts the clock, factor > 1 runs it at a coarse period (a multiple of the
+            nominal one) that still lands on the nominal edge grid '''
+        if self.task is not None:
+            self.task.kill()
+        period = self.period_ps*factor
+        self.task = start_soon(profile(self.run(period, self.next_edge(period))))
+
+    async def hold(self, time, units='ns'):
+        ''' Pauses the clock for a while, then resumes at the nominal period '''
+        self.pause()
+        await Timer(time, units)
+        self.resume()
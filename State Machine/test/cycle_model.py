@@ -0,0 +1,216 @@
+'''
+cycle_model.py : Simulator free cycle model of top_level_system.
+
+  Runs the whole design on per-cycle NumPy arrays instead of GHDL:
+
+    input_synchronizer -> quadrature_decoder -> velocity_reader -> seg7ctrl
+    self_test_module -> pwm (REV_IDLE/FORW_IDLE/REVERSE/FORWARD) -> output_synchronizer
+
+  Index k of every array is rising mclk edge k: inputs hold the value
+  sampled at edge k, outputs the value registered at edge k. Reset is held
+  for edges 0 .. release-1. The encoder path reuses golden_model.py, the
+  rest is closed form or, for the pwm state machine, stepped once per
+  constant duty cycle segment, so a run costs a few NumPy passes over the
+  arrays and reaches millions of cycles per second.
+
+  State that reset does not clear (the seg7ctrl counter and the
+  self_test_module enable) is passed to run(). tb_system.differential_test
+  replays windows of an exploration profile's encoder stimulus in GHDL and
+  compares the traces cycle by cycle (DIFF_SEED, DIFF_PROFILE, DIFF_CYCLES).
+
+  usage (random encoder and ROM profiles, reports short circuits):
+    python cycle_model.py --cycles 10000000 --profiles 10 --seed 1 --time-scale 1000
+'''
+import argparse
+import time
+
+import numpy as np
+
+import golden_model
+from motor_plant import QUADRATURE
+from time_scale import TimeScale
+
+ROM_FILE = "pwm_values.txt"
+ROM_ENTRIES = 20
+PWM_COUNTER_BITS = 14        # counter_width = dc_width + 6
+PWM_PULSE_SHIFT = 6          # r_count(counter_width-1 downto 6)
+
+# pwm states in declaration order
+REV_IDLE, FORW_IDLE, REVERSE, FORWARD = range(4)
+# next_state[present_state][duty_sign]
+NEXT_STATE = np.array([[FORW_IDLE, REVERSE],      # REV_IDLE
+                       [FORWARD, REV_IDLE],       # FORW_IDLE
+                       [REV_IDLE, FORW_IDLE],     # REVERSE
+                       [FORWARD, FORW_IDLE]])     # FORWARD
+
+# bin2ssd (seg7_pkg.vhd), abcdefg for each hex digit
+SEG7 = np.array([0b1111110, 0b0110000, 0b1101101, 0b1111001, 0b0110011, 0b1011011, 0b1011111, 0b1110000,
+                 0b1111111, 0b1111011, 0b1110111, 0b0011111, 0b1001110, 0b0111101, 0b1001111, 0b1000111],
+                dtype=np.uint8)
+
+def rom_values(filename=ROM_FILE, entries=ROM_ENTRIES):
+    ''' Duty cycles in the order self_test_module outputs them.
+        initialize_ROM fills the descending memory_array from the top,
+        so the last line of the file is output first. '''
+    with open(filename) as f:
+        lines = [line.strip() for line in f if line.strip()][:entries]
+    return np.array([int(line, 2) for line in lines], dtype=np.int64)[::-1]
+
+def hold(n, edges, values, initial=0, dtype=np.int64):
+    ''' Dense array of n edges where values[i] is held from edges[i] (sorted) on '''
+    edges = np.asarray(edges, dtype=np.int64)
+    keep = edges < n
+    bounds = np.concatenate(([0], edges[keep], [n]))
+    return np.repeat(np.concatenate(([initial], np.asarray(values)[keep])).astype(dtype), np.diff(bounds))
+
+def pwm_states(sign, release, changes):
+    ''' present_state after each edge. sign[k] is the duty sign seen at edge k,
+        changes the edges (sorted) where it may differ from the edge before. '''
+    n = len(sign)
+    state = np.full(n, REV_IDLE, dtype=np.int8)
+    bounds = [release] + [c for c in changes if release < c < n] + [n]
+    present = REV_IDLE
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if a >= b: continue
+        s = int(sign[a])
+        # Every state reaches the cycle of its input within 3 steps, the cycle is 1 or 3 long
+        seq = []
+        for _ in range(min(b - a, 6)):
+            present = NEXT_STATE[present][s]
+            seq.append(present)
+        state[a:a + len(seq)] = seq
+        if b - a > 6:
+            state[a + 6:b] = np.array(seq[3:6], dtype=np.int8)[np.arange(b - a - 6) % 3]
+            present = int(state[b - 1])
+    return state
+
+class SystemModel():
+    ''' Cycle model of top_level_system for one set of generics and ROM contents '''
+    def __init__(self, scale=None, rom=None):
+        self.scale = scale or TimeScale()
+        self.rom = rom_values() if rom is None else np.asarray(rom, dtype=np.int64)
+
+    def run(self, sa, sb, release=2, seg7_counter=0, self_test_enabled=True):
+        ''' Returns {signal name: array} of the registered values after each edge.
+            Outputs of edges before release depend on state from before edge 0. '''
+        sa = np.asarray(sa, dtype=np.int8)
+        sb = np.asarray(sb, dtype=np.int8)
+        n = len(sa)
+        assert release >= 2, "reset must be held for the input synchronizer latency"
+        trace = self.encoder_path(sa, sb, release)
+        trace.update(self.seg7(trace['velocity_internal'], release, seg7_counter))
+        trace.update(self.motor_path(n, release, self_test_enabled))
+        return trace
+
+    def encoder_path(self, sa, sb, release):
+        ''' input_synchronizer, quadrature_decoder and velocity_reader '''
+        n = len(sa)
+        changed = np.flatnonzero((sa[1:] != sa[:-1]) | (sb[1:] != sb[:-1])) + 1
+        edges = np.concatenate(([0], changed))
+        inc, dec = golden_model.decode_quadrature(edges, sa[edges], sb[edges], release)
+        ten_ms = self.scale.ten_ms_count
+        n_ticks = golden_model.tick_count(release, n - 1, ten_ms)
+        ticks, velocity = golden_model.velocity_reader(inc, dec, release, n_ticks, ten_ms)
+        pos_inc = np.zeros(n, dtype=np.int8)
+        pos_dec = np.zeros(n, dtype=np.int8)
+        pos_inc[inc[inc < n]] = 1
+        pos_dec[dec[dec < n]] = 1
+        return {'pos_inc_int': pos_inc, 'pos_dec_int': pos_dec,
+                'velocity_internal': hold(n, ticks, velocity, dtype=np.int16)}
+
+    def seg7(self, velocity, release, counter):
+        ''' seg7ctrl: c toggles when the (not reset) counter wraps, abcdefg is registered '''
+        n = len(velocity)
+        count = self.scale.seg7_count
+        first = (count - 1 - counter) % count       # edges after release until the first toggle
+        j = np.arange(-release, n - release, dtype=np.int64)
+        c = np.where(j >= first, (j - first)//count + 1, 0) & 1
+        c[:release] = 0
+        # abcdefg is registered from the velocity and c_reg before the edge
+        shown = np.concatenate(([0], velocity[:-1])).astype(np.int64) & 0xFF
+        c_before = np.concatenate(([0], c[:-1]))
+        digit = np.where(c_before == 0, shown >> 4, shown & 0xF)
+        return {'c': c.astype(np.int8), 'abcdefg': SEG7[digit]}
+
+    def motor_path(self, n, release, enabled):
+        ''' self_test_module, pwm and output_synchronizer '''
+        count = self.scale.self_test_count
+        loads = release + count - 1 + count*np.arange(len(self.rom) if enabled else 0, dtype=np.int64)
+        duty = hold(n, loads, self.rom, dtype=np.uint8)
+        signed = duty.astype(np.int8).astype(np.int64)
+
+        # pwm sees the duty cycle registered at the edge before
+        sign = np.concatenate(([0], signed[:-1] < 0)).astype(np.int8)
+        state = pwm_states(sign, release, (loads + 1).tolist())
+        r_count = np.zeros(n, dtype=np.int64)
+        r_count[release:] = np.arange(1, n - release + 1, dtype=np.int64) & ((1 << PWM_COUNTER_BITS) - 1)
+        pulse = (r_count >> PWM_PULSE_SHIFT) < 2*np.abs(signed)
+        en = ((state == FORWARD) | (state == REVERSE)) & pulse
+        dir = (state == FORWARD) | (state == FORW_IDLE)
+
+        # output_synchronizer: two flip-flops
+        delay = lambda x: np.concatenate(([0, 0], x[:-2])).astype(np.int8)
+        return {'duty_cycle': duty, 'dir_out': delay(dir), 'en_out': delay(en)}
+
+def random_encoder(rng, n, max_speed=0.25, segments=16):
+    ''' (sa, sb) for an encoder with random piecewise constant speed, in positions per cycle '''
+    bounds = np.sort(rng.choice(np.arange(1, n), segments - 1, replace=False)) if segments > 1 else []
+    speed = hold(n, bounds, rng.uniform(-max_speed, max_speed, segments - 1),
+                 rng.uniform(-max_speed, max_speed), dtype=np.float64)
+    step = np.floor(np.cumsum(speed)).astype(np.int64) % 4
+    quadrature = np.array(QUADRATURE, dtype=np.int8)
+    return quadrature[step, 0], quadrature[step, 1]
+
+def random_rom(rng, entries=ROM_ENTRIES):
+    ''' Random duty cycles (8 bit two's complement, as read from the ROM file) '''
+    return rng.integers(0, 256, entries)
+
+def profile_stimulus(seed, profile, cycles):
+    ''' (rom, sa, sb) of one random exploration profile '''
+    rng = np.random.default_rng([seed, profile])
+    rom = random_rom(rng)
+    sa, sb = random_encoder(rng, cycles)
+    return rom, sa, sb
+
+def short_circuits(trace, release=2):
+    ''' Edges where dir_out changes while en_out is high the cycle before, at or after '''
+    dir, en = trace['dir_out'], trace['en_out']
+    changes = np.flatnonzero(dir[1:] != dir[:-1]) + 1
+    changes = changes[changes >= release + 2]
+    after = np.minimum(changes + 1, len(en) - 1)
+    return changes[(en[changes - 1] == 1) | (en[changes] == 1) | (en[after] == 1)]
+
+def explore(cycles, profiles, seed, scale):
+    ''' Runs random encoder and ROM profiles, returns one summary dict per profile '''
+    results = []
+    for profile in range(profiles):
+        rom, sa, sb = profile_stimulus(seed, profile, cycles)
+        model = SystemModel(scale, rom)
+        wall = time.perf_counter()
+        trace = model.run(sa, sb)
+        wall = time.perf_counter() - wall
+        shorts = short_circuits(trace)
+        results.append({'profile': profile, 'cycles_per_s': cycles/wall,
+                        'short_circuits': len(shorts), 'first_short': int(shorts[0]) if len(shorts) else None,
+                        'saturated_cycles': int(np.count_nonzero(trace['velocity_internal'] == golden_model.SATURATED)),
+                        'pulses': int(trace['pos_inc_int'].sum() + trace['pos_dec_int'].sum())})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Random exploration with the top_level_system cycle model")
+    parser.add_argument('--cycles', type=int, default=10_000_000, help="cycles per profile")
+    parser.add_argument('--profiles', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--time-scale', type=int, default=None, help="TIME_SCALE (default: environment)")
+    args = parser.parse_args()
+
+    scale = TimeScale(args.time_scale)
+    print("{c} cycles per profile, time scale 1/{f}".format(c=args.cycles, f=scale.factor))
+    print("{:>8} {:>12} {:>10} {:>12} {:>10} {:>10}".format(
+        'profile', 'cycles/s', 'pulses', 'saturated', 'shorts', 'first'))
+    for r in explore(args.cycles, args.profiles, args.seed, scale):
+        print("{profile:>8} {cycles_per_s:>12.3g} {pulses:>10} {saturated_cycles:>12} "
+              "{short_circuits:>10} {first:>10}".format(first=str(r['first_short']), **r))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+edge_trace.py : Lightweight edge recorder for cocotb testbenches.
+
+  Instead of one forever-looping coroutine per check, a single recorder
+  wakes on any edge of the watched signals and appends
+  (integer ps timestamp, signal id, value) to preallocated NumPy buffers.
+  Checks are then run afterwards as vectorized passes over the trace.
+'''
+from cocotb import start_soon
+from cocotb.triggers import Edge, First, ReadOnly
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+from profiling import profile
+
+# Value recorded when a signal cannot be resolved to an integer (X, U, Z...)
+UNRESOLVED = -1
+
+def read_value(signal, signed=False):
+    ''' Returns the integer value of a signal, or UNRESOLVED '''
+    try:
+        if signed: return signal.value.signed_integer
+        return signal.value.integer
+    except ValueError:
+        return UNRESOLVED
+
+class EdgeRecorder():
+    ''' Records value changes of a set of signals into array-backed buffers.
+
+        signals is a dict of {name: handle}; names listed in signed are
+        read as two's complement. Buffers grow by doubling when full.
+    '''
+    def __init__(self, signals, signed=(), capacity=1 << 16):
+        self.names = list(signals)
+        self.handles = [signals[name] for name in self.names]
+        self.signed = [name in signed for name in self.names]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.time = np.empty(capacity, dtype=np.int64)
+        self.sig = np.empty(capacity, dtype=np.uint8)
+        self.val = np.empty(capacity, dtype=np.int16)
+        self.size = 0
+        self.last = [None] * len(self.handles)
+        self.running = False
+
+    def start(self):
+        ''' Records the initial values and starts the recording coroutine '''
+        self.sample(get_sim_time('ps'))
+        self.running = True
+        start_soon(profile(self.record()))
+
+    def stop(self):
+        self.running = False
+
+    def append(self, time, sig, val):
+        if self.size == len(self.time):
+            self.grow()
+        self.time[self.size] = time
+        self.sig[self.size] = sig
+        self.val[self.size] = val
+        self.size += 1
+
+    def grow(self):
+        capacity = 2 * len(self.time)
+        for name in ('time', 'sig', 'val'):
+            buf = getattr(self, name)
+            new = np.empty(capacity, dtype=buf.dtype)
+            new[:self.size] = buf[:self.size]
+            setattr(self, name, new)
+
+    def sample(self, time):
+        ''' Appends every signal whose value differs from the last recorded one '''
+        for i, handle in enumerate(self.handles):
+            value = read_value(handle, self.signed[i])
+            if value != self.last[i]:
+                self.last[i] = value
+                self.append(time, i, value)
+
+    async def record(self):
+        edges = [Edge(handle) for handle in self.handles]
+        while self.running:
+            await First(*edges)
+            await ReadOnly()          # Let all delta cycles settle before sampling
+            self.sample(get_sim_time('ps'))
+
+    def signal(self, name):
+        ''' Returns (times, values) of all recorded changes of one signal '''
+        n = self.size
+        mask = self.sig[:n] == self.ids[name]
+        return SignalTrace(self.time[:n][mask], self.val[:n][mask])
+
+class SignalTrace():
+    ''' Change times (ps) and values of a single signal, with vectorized lookups '''
+    def __init__(self, times, values):
+        self.times = times
+        self.values = values
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_at(self, t):
+        ''' Index of the last change at or before each time in t (-1 if none) '''
+        return np.searchsorted(self.times, t, side='right') - 1
+
+    def value_at(self, t, default=UNRESOLVED):
+        ''' Value held at (after settling) each time in t '''
+        idx = self.index_at(t)
+        out = np.where(idx >= 0, self.values[np.maximum(idx, 0)], default)
+        return out.astype(np.int64)
+
+    def last_change_before(self, t):
+        ''' Time of the last change strictly before each time in t (-inf -> int64 min) '''
+        idx = np.searchsorted(self.times, t, side='left') - 1
+        return np.where(idx >= 0, self.times[np.maximum(idx, 0)], np.iinfo(np.int64).min)
+
+    def next_change_after(self, t):
+        ''' Time of the first change strictly after each time in t (int64 max if none) '''
+        idx = np.searchsorted(self.times, t, side='right')
+        safe = np.minimum(idx, max(len(self.times) - 1, 0))
+        if len(self.times) == 0:
+            return np.full(np.shape(t), np.iinfo(np.int64).max)
+        return np.where(idx < len(self.times), self.times[safe], np.iinfo(np.int64).max)
+
+    def edges(self, rising=None):
+        ''' Times of changes, optionally only to 1 (rising) or to 0 (falling).
+            The initial sample is not an edge. '''
+        times, values = self.times[1:], self.values[1:]
+        if rising is None: return times
+        return times[values == (1 if rising else 0)]
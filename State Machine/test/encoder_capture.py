@@ -0,0 +1,184 @@
+'''
+encoder_capture.py : Recorded encoder captures replayed as SA/SB stimulus.
+
+  A capture is a list of (timestamp, SA, SB) samples logged from the real
+  motor, glitches and contact bounce included. Both formats are read through
+  a memory map one chunk at a time, so captures larger than RAM stream in
+  constant memory:
+
+    .npy : structured array of RECORD (time in ps, sa, sb), see write_capture
+    .csv : time,sa,sb lines with an optional header, time in time_unit
+
+  replay() drives a capture from one coroutine with absolute Timer waits,
+  waking only where SA or SB change. Changes that land exactly on a rising
+  mclk edge are moved 1 ps later, so the edge that samples them is never a
+  race. With resample_period, each change is moved to the middle of the clock
+  period before the edge that samples it, and glitches no edge sees are dropped.
+  StreamDecoder runs golden_model.decode_quadrature over the driven chunks.
+
+  usage (summary of a capture, optionally converted to .npy):
+    python encoder_capture.py motor.csv --unit us --output motor.npy
+'''
+import argparse
+import io
+import mmap
+import os
+
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+import golden_model
+
+RECORD = np.dtype([('time', '<i8'), ('sa', 'u1'), ('sb', 'u1')])
+UNITS = {'fs': 1e-3, 'ps': 1, 'ns': 1e3, 'us': 1e6, 'ms': 1e9, 's': 1e12}
+
+def write_capture(filename, times_ps, sa, sb):
+    ''' Writes a capture as .csv (time in ps) or as .npy records '''
+    if filename.endswith('.csv'):
+        np.savetxt(filename, np.column_stack((times_ps, sa, sb)).astype(np.int64), fmt='%d',
+                   delimiter=',', header='time_ps,sa,sb', comments='')
+        return
+    records = np.empty(len(times_ps), dtype=RECORD)
+    records['time'], records['sa'], records['sb'] = times_ps, sa, sb
+    np.save(filename, records)
+
+class EncoderCapture():
+    ''' A capture file, read in chunks of (times in ps, sa, sb) arrays '''
+    def __init__(self, filename, time_unit='ps'):
+        self.filename = filename
+        self.scale = UNITS[time_unit]
+
+    def chunks(self, chunk=1 << 16):
+        if self.filename.endswith('.csv'):
+            yield from self.csv_chunks(chunk)
+            return
+        records = np.load(self.filename, mmap_mode='r')
+        for i in range(0, len(records), chunk):
+            part = records[i:i + chunk]
+            yield np.array(part['time'], dtype=np.int64), part['sa'].astype(np.int8), part['sb'].astype(np.int8)
+
+    def csv_chunks(self, chunk):
+        ''' Parses the mapped file about chunk lines at a time, cut at line ends '''
+        if os.path.getsize(self.filename) == 0: return
+        with open(self.filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            if data[:1] not in b'0123456789+-.':       # Header line
+                pos = data.find(b'\n') + 1 or len(data)
+            line = max(data.find(b'\n', pos) + 1 - pos, 1)
+            while pos < len(data):
+                end = data.find(b'\n', min(pos + chunk*line, len(data) - 1))
+                end = len(data) if end < 0 else end + 1
+                rows = np.loadtxt(io.BytesIO(data[pos:end]), delimiter=',', ndmin=2)
+                pos = end
+                if len(rows):
+                    yield (np.rint(rows[:, 0]*self.scale).astype(np.int64),
+                           rows[:, 1].astype(np.int8), rows[:, 2].astype(np.int8))
+
+def resample(times, sa, sb, period_ps):
+    ''' Moves every change half a period before the rising edge (k*period_ps) that
+        first samples it, keeping only the last value sampled at each edge '''
+    edges = times//period_ps + 1
+    last = np.append(edges[1:] != edges[:-1], True)
+    return edges[last]*period_ps - period_ps//2, sa[last], sb[last]
+
+async def replay(sa, sb, capture, period_ps, resample_period=False, chunk=1 << 16, on_chunk=None):
+    ''' Drives a capture onto sa/sb, starting now. on_chunk(times, sa, sb) gets the
+        changes of each chunk (absolute ps) before they are driven.
+        Returns the number of changes driven. '''
+    origin = get_sim_time('ps')
+    start, last, driven = None, (-1, -1), 0
+    for times, a, b in capture.chunks(chunk):
+        if start is None: start = int(times[0])
+        times = times - start + origin
+        times = np.where(times % period_ps == 0, times + 1, times)
+        if resample_period:
+            times, a, b = resample(times, a, b, period_ps)
+        # Only changes of SA or SB need a wakeup
+        changed = (a != np.append(last[0], a[:-1])) | (b != np.append(last[1], b[:-1]))
+        times, a, b = times[changed], a[changed], b[changed]
+        if not len(times): continue
+        last = (a[-1], b[-1])
+        if on_chunk: on_chunk(times, a, b)
+        for time, va, vb in zip(times.tolist(), a.tolist(), b.tolist()):
+            now = get_sim_time('ps')
+            if time > now:
+                await Timer(time - now, 'ps')
+            sa.value = va
+            sb.value = vb
+        driven += len(times)
+    return driven
+
+class StreamDecoder():
+    ''' golden_model.decode_quadrature over consecutive chunks of input changes (absolute ps).
+        Changes sampled at the last edge of a chunk wait for the next one, where a
+        later change may still replace them. '''
+    def __init__(self, period_ns, first_edge, sync_stages=2):
+        self.period_ps = period_ns*1000
+        self.first_edge = first_edge
+        self.sync_stages = sync_stages
+        self.position = 0
+        self.pending = (np.zeros(0, np.int64), np.zeros(0, np.int8), np.zeros(0, np.int8))
+        self.inc, self.dec = [], []
+
+    def add(self, times, sa, sb):
+        self.decode(np.asarray(times, dtype=np.int64)//self.period_ps + 1, sa, sb)
+
+    def decode(self, edges, sa, sb, final=False):
+        edges, sa, sb = (np.concatenate((p, new)) for p, new in zip(self.pending, (edges, sa, sb)))
+        if not len(edges): return
+        effective = np.maximum(edges + self.sync_stages, self.first_edge)
+        keep = np.ones(len(edges), dtype=bool) if final else effective < effective[-1]
+        self.pending = (edges[~keep], sa[~keep], sb[~keep])
+        if not np.any(keep): return
+        inc, dec = golden_model.decode_quadrature(edges[keep], sa[keep], sb[keep], self.first_edge,
+                                                  self.sync_stages, self.position)
+        self.position = (self.position + len(inc) - len(dec)) % 4
+        self.inc.append(inc)
+        self.dec.append(dec)
+
+    def finish(self):
+        ''' Returns (inc_edges, dec_edges) of everything added '''
+        self.decode(np.zeros(0, np.int64), np.zeros(0, np.int8), np.zeros(0, np.int8), final=True)
+        return (np.concatenate([np.zeros(0, np.int64)] + self.inc).astype(np.int64),
+                np.concatenate([np.zeros(0, np.int64)] + self.dec).astype(np.int64))
+
+def summary(capture, period_ps, chunk=1 << 16):
+    ''' Samples, SA/SB changes, duration (ps) and pulses shorter than a clock period '''
+    samples = changes = glitches = 0
+    first = previous = None
+    last = (-1, -1)
+    for times, a, b in capture.chunks(chunk):
+        if first is None: first = int(times[0])
+        changed = (a != np.append(last[0], a[:-1])) | (b != np.append(last[1], b[:-1]))
+        at = times[changed] if previous is None else np.concatenate(([previous], times[changed]))
+        glitches += int(np.count_nonzero(np.diff(at) < period_ps))
+        samples += len(times)
+        changes += int(np.count_nonzero(changed))
+        last, previous = (a[-1], b[-1]), int(at[-1])
+    return samples, changes, (previous - first) if first is not None else 0, glitches
+
+def main():
+    parser = argparse.ArgumentParser(description="Summary and conversion of encoder captures")
+    parser.add_argument('capture', help=".npy or .csv capture")
+    parser.add_argument('--unit', default='ps', choices=sorted(UNITS), help="time unit of a .csv capture")
+    parser.add_argument('--period-ns', type=int, default=10, help="mclk period, for the glitch count")
+    parser.add_argument('--output', help="write the capture as .npy (time in ps)")
+    args = parser.parse_args()
+
+    capture = EncoderCapture(args.capture, args.unit)
+    samples, changes, duration, glitches = summary(capture, args.period_ns*1000)
+    print("{s} samples, {c} changes over {d:.6f} s, {g} changes less than a clock period apart".format(
+        s=samples, c=changes, d=duration/1e12, g=glitches))
+    if args.output:
+        # Records are appended chunk by chunk to a memory-mapped .npy
+        records = np.lib.format.open_memmap(args.output, mode='w+', dtype=RECORD, shape=(samples,))
+        i = 0
+        for times, a, b in capture.chunks():
+            records['time'][i:i + len(times)], records['sa'][i:i + len(times)], records['sb'][i:i + len(times)] = times, a, b
+            i += len(times)
+        records.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+'''
+functional_coverage.py : Functional coverage of the pwm state machine.
+
+  Coverage points (integer counters, one NumPy array each):
+
+    state      : clock edges spent in REV_IDLE, FORW_IDLE, REVERSE, FORWARD
+    transition : the 8 arcs of next_state, including the REV_IDLE <-> FORW_IDLE flips
+    duty       : duty cycle bins (eighths of the signed range, zero on its own)
+    duty_state : cross of the new duty bin and the state when it is applied
+    pulse      : en pulses per duty bin
+    reset      : reset asserted in an idle state, or in an active state with en low/high
+
+  Sampling is event driven: one coroutine wakes on edges of duty_cycle,
+  reset and en. The state machine only depends on reset and the duty sign,
+  so between two events the states and arcs of every clock edge are added
+  in closed form (the state settles into a cycle of 1 or 3 within 3 edges).
+
+  Set TB_COVERAGE to a .json file to save the counters of a run. Runs of
+  several seeds merge into one report:
+    python functional_coverage.py regression/tb_pwm_*/coverage.json
+'''
+import json
+import sys
+
+from cocotb import start_soon
+from cocotb.triggers import Edge, First, ReadOnly
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+from cycle_model import FORWARD, NEXT_STATE, REV_IDLE, REVERSE
+from edge_trace import read_value
+from profiling import profile
+
+STATES = ['REV_IDLE', 'FORW_IDLE', 'REVERSE', 'FORWARD']
+ARCS = [(a, int(NEXT_STATE[a][s])) for a in range(4) for s in range(2)]
+DUTY_BINS = ['-8/8', '-7/8', '-6/8', '-5/8', '-4/8', '-3/8', '-2/8', '-1/8', '0',
+             '+1/8', '+2/8', '+3/8', '+4/8', '+5/8', '+6/8', '+7/8', '+8/8']
+RESET_BINS = ['idle', 'active en=0', 'active en=1']
+POINTS = {'state': (len(STATES),), 'transition': (len(ARCS),), 'duty': (len(DUTY_BINS),),
+          'duty_state': (len(DUTY_BINS), len(STATES)), 'pulse': (len(DUTY_BINS),), 'reset': (len(RESET_BINS),)}
+
+def duty_bin(duty, width=8):
+    ''' Bin of a signed duty cycle: eighths of the range on each side, with 0 in its own bin '''
+    eighth = 1 << (width - 4)
+    if duty > 0: return 9 + (duty - 1)//eighth
+    return 8 + duty//eighth if duty < 0 else 8
+
+class PwmCoverage():
+    ''' Coverage counters of one pwm instance. Edges are counted from origin (ps),
+        the first rising mclk edge. '''
+    def __init__(self, period_ns=10, width=8, origin=0):
+        self.period_ps = period_ns*1000
+        self.width = width
+        self.origin = origin
+        self.counts = {name: np.zeros(shape, dtype=np.int64) for name, shape in POINTS.items()}
+        self.arc = {arc: i for i, arc in enumerate(ARCS)}
+        self.state = REV_IDLE           # present_state's initial value
+        self.next = 0                   # first edge not yet counted
+        self.sign = 0
+        self.reset = 0
+        self.duty = 0
+        self.running = False
+
+    def start(self, duty_cycle, reset, en):
+        ''' Starts the sampling coroutine on the pwm ports '''
+        self.running = True
+        start_soon(profile(self.sample(duty_cycle, reset, en)))
+
+    def stop(self):
+        self.running = False
+
+    async def sample(self, duty_cycle, reset, en):
+        edges = [Edge(duty_cycle), Edge(reset), Edge(en)]
+        self.inputs(get_sim_time('ps'), read_value(duty_cycle, signed=True), read_value(reset))
+        last_en = read_value(en)
+        while self.running:
+            await First(*edges)
+            await ReadOnly()
+            now = get_sim_time('ps')
+            duty, rst, pulse = read_value(duty_cycle, signed=True), read_value(reset), read_value(en)
+            if rst == 1 and self.reset != 1:
+                self.advance(now)
+                active = self.state in (FORWARD, REVERSE)
+                self.counts['reset'][1 + (last_en == 1) if active else 0] += 1
+            if pulse == 1 and last_en != 1:
+                self.counts['pulse'][duty_bin(self.duty, self.width)] += 1
+            last_en = pulse
+            if duty != self.duty or rst != self.reset:
+                self.inputs(now, duty, rst)
+
+    def edge(self, time):
+        ''' Index of the last rising edge at or before time '''
+        return (time - self.origin)//self.period_ps
+
+    def advance(self, time):
+        ''' Counts the edges up to time with the current inputs '''
+        n = self.edge(time) + 1 - self.next
+        if n <= 0: return
+        self.next += n
+        if self.reset == 1:
+            self.counts['state'][REV_IDLE] += n
+            self.state = REV_IDLE
+            return
+        # Settle explicitly, then add whole turns of the (1 or 3 edge) cycle
+        steps = []
+        for _ in range(min(n, 6)):
+            steps.append((self.state, int(NEXT_STATE[self.state][self.sign])))
+            self.state = steps[-1][1]
+        turns, rest = divmod(n - len(steps), 3)
+        cycle = steps[-3:] if len(steps) >= 3 else []
+        for weight, arcs in ((1, steps), (turns, cycle), (1, cycle[:rest])):
+            for present, next in arcs:
+                self.counts['state'][next] += weight
+                self.counts['transition'][self.arc[(present, next)]] += weight
+        if rest: self.state = cycle[rest - 1][1]
+
+    def inputs(self, time, duty, reset):
+        ''' New duty cycle or reset, seen from the next edge on '''
+        self.advance(time)
+        if duty != self.duty:
+            b = duty_bin(duty, self.width)
+            self.counts['duty'][b] += 1
+            self.counts['duty_state'][b, self.state] += 1
+        self.duty = duty
+        self.sign = int(duty < 0)
+        self.reset = reset
+
+    def steer(self, candidates, duty_of=lambda x: x):
+        ''' Candidates whose duty bin (and cross with the present state) is hit least '''
+        self.advance(get_sim_time('ps'))
+        score = lambda c: (self.counts['duty'][duty_bin(duty_of(c), self.width)],
+                           self.counts['duty_state'][duty_bin(duty_of(c), self.width), self.state])
+        best = min(score(c) for c in candidates)
+        return [c for c in candidates if score(c) == best]
+
+    def to_dict(self):
+        self.advance(get_sim_time('ps'))
+        return {name: counts.tolist() for name, counts in self.counts.items()}
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+def merge(runs):
+    ''' Sums the counters of several runs (dicts as written by save) '''
+    merged = {name: np.zeros(shape, dtype=np.int64) for name, shape in POINTS.items()}
+    for run in runs:
+        for name in merged:
+            merged[name] += np.array(run[name], dtype=np.int64)
+    return merged
+
+def report(counts, runs=1):
+    ''' Returns the coverage report lines: bins hit per point, then the empty bins '''
+    labels = {'state': STATES, 'transition': ['{a} -> {b}'.format(a=STATES[a], b=STATES[b]) for a, b in ARCS],
+              'duty': DUTY_BINS, 'pulse': DUTY_BINS, 'reset': RESET_BINS,
+              'duty_state': ['{d} x {s}'.format(d=d, s=s) for d in DUTY_BINS for s in STATES]}
+    lines = ["Functional coverage of {r} run(s)".format(r=runs)]
+    total = hit = 0
+    for name, point in counts.items():
+        flat = np.asarray(point).ravel()
+        total += len(flat)
+        hit += np.count_nonzero(flat)
+        lines.append("  {n:<12} {h:>4}/{t:<4} {p:6.1f}%".format(
+            n=name, h=np.count_nonzero(flat), t=len(flat), p=100*np.count_nonzero(flat)/len(flat)))
+    lines.append("  {n:<12} {h:>4}/{t:<4} {p:6.1f}%".format(n='total', h=hit, t=total, p=100*hit/total))
+    for name, point in counts.items():
+        holes = [labels[name][i] for i in np.flatnonzero(np.asarray(point).ravel() == 0)]
+        if holes: lines.append("  uncovered {n}: {h}".format(n=name, h=', '.join(holes)))
+    return lines
+
+if __name__ == '__main__':
+    runs = []
+    for filename in sys.argv[1:]:
+        with open(filename) as f:
+            runs.append(json.load(f))
+    print("\n".join(report(merge(runs), len(runs))))
@@ -0,0 +1,107 @@
+'''
+ghw_check.py : Post-simulation checks on a GHW dump.
+
+  Re-checks a finished run without simulating again, so the live
+  simulation can stay lean:
+
+    pwm      : the tb_pwm trace checks (reset, short circuit, timeout,
+               direction, duty cycle and period) on en, dir, duty_cycle and
+               reset of a pwm scope
+    velocity : velocity_internal of a top_level_system scope against
+               golden_model.py, for every reset release in the dump
+
+  Times are converted to clock edges with the tb convention: rising edges
+  at k*PERIOD_NS, inputs written mid-cycle.
+
+  usage:
+    python ghw_check.py top_level_system.ghw --time-scale 1000
+    python ghw_check.py pwm.ghw --pwm pwm --velocity "" --export errors.json
+'''
+import argparse
+import logging
+import sys
+
+import numpy as np
+
+import golden_model
+from ghw_reader import GhwReader
+from pwm_agent import DumpMonitor, MessageQueue, PERIOD_NS
+from time_scale import TimeScale
+
+def pwm_check(dump, scope, messages, log):
+    ''' Queues the tb_pwm check errors for the pwm signals under scope '''
+    paths = ['{s}.{n}'.format(s=scope, n=name) for name in ('en', 'dir', 'duty_cycle', 'reset')]
+    traces = dump.traces(paths, signed=[paths[2]])
+    missing = [p for p in paths if p not in traces]
+    if missing:
+        raise KeyError("signals not found in dump: {m}".format(m=', '.join(missing)))
+    DumpMonitor(log, messages, *(traces[p] for p in paths), dump.end_ps).check()
+
+def velocity_check(dump, scope, scale, log, period_ns=PERIOD_NS):
+    ''' Returns [(tick edge, expected, measured)] where velocity differs from the golden model '''
+    paths = ['{s}.{n}'.format(s=scope, n=name) for name in ('reset', 'sa', 'sb', 'velocity_internal')]
+    traces = dump.traces(paths)
+    missing = [p for p in paths if p not in traces]
+    if missing:
+        raise KeyError("signals not found in dump: {m}".format(m=', '.join(missing)))
+    reset, sa, sb, velocity = (traces[p] for p in paths)
+    period = period_ns*1000
+
+    times = np.union1d(sa.times, sb.times)
+    a, b = sa.value_at(times), sb.value_at(times)
+    resolved = (a >= 0) & (b >= 0)
+    times, a, b = times[resolved], a[resolved], b[resolved]
+    sampled = times//period + 1          # First rising edge that samples each change
+
+    mismatches, compared = [], 0
+    rises = reset.edges(rising=True)
+    for fall in reset.edges(rising=False).tolist():
+        # Up to the next reset (asynchronous in velocity_reader) or the end of the dump
+        end = int(rises[np.searchsorted(rises, fall)]) if np.any(rises > fall) else dump.end_ps
+        first_edge = fall//period + 1
+        last_edge = (end - period//2)//period
+        keep = times < end
+        inc, dec = golden_model.decode_quadrature(sampled[keep], a[keep], b[keep], first_edge)
+        n_ticks = golden_model.tick_count(first_edge, last_edge, scale.ten_ms_count)
+        ticks, expected = golden_model.velocity_reader(inc, dec, first_edge, n_ticks, scale.ten_ms_count)
+        measured = velocity.value_at(ticks*period + period//2)
+        differ = np.flatnonzero(measured != expected)
+        mismatches += list(zip(ticks[differ].tolist(), expected[differ].tolist(), measured[differ].tolist()))
+        compared += len(ticks)
+    log.info("Velocity: {n} ticks compared over {r} reset releases, {m} mismatches".format(
+        n=compared, r=len(reset.edges(rising=False)), m=len(mismatches)))
+    for edge, expected, measured in mismatches[:20]:
+        log.info("    edge {e}: expected velocity {x}, measured {m}".format(e=edge, x=expected, m=measured))
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-simulation checks on a GHW dump")
+    parser.add_argument('dump', help="GHW file")
+    parser.add_argument('--pwm', default='top_level_system.pwm_inst', help="pwm scope ('' to skip)")
+    parser.add_argument('--velocity', default='top_level_system', help="top_level_system scope ('' to skip)")
+    parser.add_argument('--time-scale', type=int, default=None, help="TIME_SCALE of the run (default: environment)")
+    parser.add_argument('--time-resolution', default=None, help="GHDL time resolution of the dump (default ps)")
+    parser.add_argument('--export', help="write the pwm check errors to a .json or .csv file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    log = logging.getLogger("ghw_check")
+    failed = False
+    with GhwReader(args.dump, args.time_resolution) as dump:
+        if args.pwm:
+            messages = MessageQueue()
+            pwm_check(dump, args.pwm.lower(), messages, log)
+            for kind, time, message in messages.messages():
+                log.info("Error found: {k} @{t}ns \n{m}".format(k=kind, t=time, m=str(message).split('\n')[0]))
+            for kind, count in messages.counts.items():
+                if count > len(messages.buffers[kind]):
+                    log.info("    {n} older {k} errors were dropped".format(n=count - len(messages.buffers[kind]), k=kind))
+            if args.export: messages.export(args.export)
+            failed |= not messages.empty()
+        if args.velocity:
+            failed |= bool(velocity_check(dump, args.velocity.lower(), TimeScale(args.time_scale), log))
+    log.info("FAILED" if failed else "PASSED")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,510 @@
+'''
+ghw_reader.py : Streaming reader for GHDL's GHW waveform dumps.
+
+  The makefile always passes --wave=$(TOPLEVEL).ghw. This reader
+  memory-maps the dump and decodes it section by section (string table,
+  types, hierarchy, snapshot and cycles, as written by GHDL's grt-waves).
+  Only the signals asked for are kept: the hierarchy is walked on demand
+  and value changes of other signals are skipped over, so memory follows
+  the size of the selected traces, not the size of the dump.
+
+    dump = GhwReader("top_level_system.ghw")
+    traces = dump.traces(['top_level_system.reset', 'top_level_system.velocity_internal'])
+    traces['top_level_system.reset'].edges(rising=False)    # SignalTrace, times in ps
+
+  Vectors of std_logic become integers (two's complement for signed), X/U/Z
+  and friends read as edge_trace.UNRESOLVED, like EdgeRecorder.
+
+  GHW stores times in GHDL's time resolution, which the file does not record.
+  Our cocotb runs dump in ps (compare top_level_system.ghw with results.xml);
+  pass time_resolution (or set GHW_TIME_RESOLUTION) for other setups.
+
+  usage (lists the signals of a dump):
+    python ghw_reader.py top_level_system.ghw
+'''
+import fnmatch
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from edge_trace import SignalTrace, UNRESOLVED
+
+MAGIC = b'GHDLwave\n'
+
+# ghdl_rtik, the type kinds used in the TYP section
+RTIK_TYPE_B2, RTIK_TYPE_E8, RTIK_TYPE_E32, RTIK_TYPE_I32, RTIK_TYPE_I64 = 22, 23, 24, 25, 26
+RTIK_TYPE_F64, RTIK_TYPE_P32, RTIK_TYPE_P64 = 27, 28, 29
+RTIK_TYPE_ARRAY, RTIK_TYPE_RECORD = 31, 32
+RTIK_SUBTYPE_SCALAR, RTIK_SUBTYPE_ARRAY = 34, 35
+RTIK_SUBTYPE_UNBOUNDED_ARRAY, RTIK_SUBTYPE_RECORD, RTIK_SUBTYPE_UNBOUNDED_RECORD = 37, 38, 39
+
+# ghw_hie_kind, the entries of the HIE section
+HIE_EOH, HIE_DESIGN, HIE_BLOCK, HIE_GENERATE_IF, HIE_GENERATE_FOR = 0, 1, 3, 4, 5
+HIE_INSTANCE, HIE_PACKAGE, HIE_PROCESS, HIE_GENERIC, HIE_EOS = 6, 7, 13, 14, 15
+HIE_SIGNAL, HIE_PORT_LINKAGE = 16, 21
+SCOPES = (HIE_DESIGN, HIE_BLOCK, HIE_GENERATE_IF, HIE_GENERATE_FOR, HIE_INSTANCE, HIE_PACKAGE, HIE_GENERIC)
+
+# How the value of a scalar signal is encoded
+VALUE_BYTE, VALUE_LEB, VALUE_F64 = 1, 2, 3
+
+# std_ulogic literals 'U','X','0','1','Z','W','L','H','-' as bits
+STD_ULOGIC_BIT = np.array([UNRESOLVED, UNRESOLVED, 0, 1, UNRESOLVED, UNRESOLVED, UNRESOLVED, UNRESOLVED, UNRESOLVED])
+SIGNED_TYPES = ('signed', 'unresolved_signed')
+
+# ps per GHW time step for each GHDL time resolution
+PS_PER_STEP = {'fs': 0.001, 'ps': 1, 'ns': 1000, 'us': 1e6}
+
+class GhwError(Exception):
+    ''' The file is not a GHW dump this reader understands '''
+
+class GhwType():
+    ''' One entry of the TYP section '''
+    def __init__(self, kind, name, **fields):
+        self.kind = kind
+        self.name = name
+        self.__dict__.update(fields)
+
+    @property
+    def base(self):
+        ''' The type a subtype is derived from (the type itself for base types) '''
+        return self.__dict__.get('base_type') or self
+
+    @property
+    def scalars(self):
+        ''' Number of scalar signals in an object of this type '''
+        if self.kind in (RTIK_SUBTYPE_ARRAY,):
+            return self.length*self.element.scalars
+        if self.kind in (RTIK_TYPE_RECORD, RTIK_SUBTYPE_RECORD):
+            return sum(t.scalars for _, t in self.fields)
+        if self.kind in (RTIK_TYPE_ARRAY, RTIK_SUBTYPE_UNBOUNDED_ARRAY, RTIK_SUBTYPE_UNBOUNDED_RECORD):
+            raise GhwError("unbounded type {n} has no scalars".format(n=self.name))
+        return 1
+
+class GhwSignal():
+    ''' A signal or port of the hierarchy with the scalar signal ids of its elements '''
+    def __init__(self, path, kind, type, ids):
+        self.path = path
+        self.kind = kind
+        self.type = type
+        self.ids = ids
+
+    @property
+    def signed(self):
+        return self.type.kind == RTIK_SUBTYPE_ARRAY and self.type.base.name in SIGNED_TYPES
+
+class GhwReader():
+    ''' Memory mapped GHW file. The header sections are decoded on open, the
+        hierarchy and the value changes are decoded while they are iterated. '''
+    def __init__(self, filename, time_resolution=None):
+        self.ps_per_step = PS_PER_STEP[time_resolution or os.environ.get('GHW_TIME_RESOLUTION', 'ps')]
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise GhwError("{f} is not a GHW file".format(f=filename))
+        header = self.data[9:16]
+        if header[1] != 0 or header[2] > 1:
+            raise GhwError("unsupported GHW version {a}.{b}".format(a=header[1], b=header[2]))
+        self.version = header[2]
+        self.endian = '<' if header[3] == 1 else '>'
+        self.pos = 16
+        self.strings = [None]
+        self.types = []
+        self.scalar_types = None     # GhwType of every scalar signal id, filled by the hierarchy walk
+        self.hierarchy = None        # Offset of the HIE entries
+        while self.hierarchy is None:
+            tag = self.tag()
+            if tag == b'STR\0': self.read_strings()
+            elif tag == b'TYP\0': self.read_types()
+            elif tag == b'WKT\0': self.read_well_known_types()
+            elif tag == b'HIE\0': self.read_hierarchy_header()
+            else: raise GhwError("unexpected section {t} at {p}".format(t=tag, p=self.pos - 4))
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Primitive decoding, all from self.pos
+    def tag(self):
+        self.pos += 4
+        return self.data[self.pos - 4:self.pos]
+
+    def expect(self, tag):
+        if self.tag() != tag:
+            raise GhwError("expected {t} at {p}".format(t=tag, p=self.pos - 4))
+
+    def i32(self):
+        self.pos += 4
+        return struct.unpack(self.endian + 'i', self.data[self.pos - 4:self.pos])[0]
+
+    def i64(self):
+        self.pos += 8
+        return struct.unpack(self.endian + 'q', self.data[self.pos - 8:self.pos])[0]
+
+    def f64(self):
+        self.pos += 8
+        return struct.unpack(self.endian + 'd', self.data[self.pos - 8:self.pos])[0]
+
+    def byte(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def uleb(self):
+        data, pos = self.data, self.pos
+        value = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            value |= (b & 0x7f) << shift
+            shift += 7
+            if b < 0x80: break
+        self.pos = pos
+        return value
+
+    def sleb(self):
+        data, pos = self.data, self.pos
+        value = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            value |= (b & 0x7f) << shift
+            shift += 7
+            if b < 0x80: break
+        self.pos = pos
+        if b & 0x40: value -= 1 << shift
+        return value
+
+    def string(self):
+        return self.strings[self.uleb()]
+
+    def type_id(self):
+        return self.types[self.uleb() - 1]
+
+    # Header sections
+    def read_strings(self):
+        ''' STR: strings are stored with the length of the prefix shared with the previous one '''
+        self.i32()
+        count = self.i32()
+        self.i32()      # total size
+        data, pos = self.data, self.pos
+        previous, shared = b'', 0
+        for _ in range(count):
+            end = pos
+            while not (data[end] < 32 or 128 <= data[end] < 160):
+                end += 1
+            text = previous[:shared] + data[pos:end]
+            c = data[end]
+            pos = end + 1
+            shared, shift = c & 0x1f, 5
+            while c >= 128:
+                c = data[pos]
+                pos += 1
+                shared |= (c & 0x1f) << shift
+                shift += 5
+            self.strings.append(text.decode('latin-1'))
+            previous = text
+        self.pos = pos
+        self.expect(b'EOS\0')
+
+    def read_range(self):
+        kind = self.byte()
+        if kind & 0x7f in (RTIK_TYPE_B2, RTIK_TYPE_E8):
+            left, right = self.byte(), self.byte()
+        elif kind & 0x7f in (RTIK_TYPE_I32, RTIK_TYPE_P32, RTIK_TYPE_I64, RTIK_TYPE_P64):
+            left, right = self.sleb(), self.sleb()
+        elif kind & 0x7f == RTIK_TYPE_F64:
+            left, right = self.f64(), self.f64()
+        else:
+            raise GhwError("unexpected range kind {k} at {p}".format(k=kind, p=self.pos - 1))
+        downto = bool(kind & 0x80)
+        length = max((left - right) if downto else (right - left), -1) + 1
+        return (left, right, downto, length)
+
+    def read_bounds(self, base):
+        ''' Bounds of an array subtype (and of unbounded elements) '''
+        array = base.base
+        while array.kind == RTIK_SUBTYPE_UNBOUNDED_ARRAY: array = array.base_type.base
+        ranges = [self.read_range() for _ in range(len(array.dims))]
+        element = array.element
+        if self.unbounded(element): element = self.read_type_bounds(element)
+        return ranges, element
+
+    def unbounded(self, t):
+        return t.kind in (RTIK_TYPE_ARRAY, RTIK_SUBTYPE_UNBOUNDED_ARRAY, RTIK_SUBTYPE_UNBOUNDED_RECORD) or (
+            t.kind == RTIK_TYPE_RECORD and any(self.unbounded(f) for _, f in t.fields))
+
+    def read_type_bounds(self, base):
+        if base.base.kind == RTIK_TYPE_ARRAY:
+            ranges, element = self.read_bounds(base)
+            return GhwType(RTIK_SUBTYPE_ARRAY, None, base_type=base.base, ranges=ranges, element=element,
+                           length=int(np.prod([r[3] for r in ranges])))
+        fields = [(name, self.read_type_bounds(t) if self.unbounded(t) else t) for name, t in base.base.fields]
+        return GhwType(RTIK_SUBTYPE_RECORD, None, base_type=base.base, fields=fields)
+
+    def read_types(self):
+        ''' TYP: type declarations, referenced by 1-based index '''
+        self.i32()
+        count = self.i32()
+        for _ in range(count):
+            kind = self.byte()
+            if kind in (RTIK_TYPE_B2, RTIK_TYPE_E8):
+                name = self.string()
+                t = GhwType(kind, name, literals=[self.string() for _ in range(self.uleb())], wkt=0)
+            elif kind in (RTIK_TYPE_I32, RTIK_TYPE_I64, RTIK_TYPE_F64):
+                t = GhwType(kind, self.string())
+            elif kind in (RTIK_TYPE_P32, RTIK_TYPE_P64):
+                name = self.string()
+                units = [(self.string(), self.sleb()) for _ in range(self.uleb())] if self.version else []
+                t = GhwType(kind, name, units=units)
+            elif kind == RTIK_SUBTYPE_SCALAR:
+                name = self.string()
+                base = self.type_id()
+                t = GhwType(kind, name, base_type=base, range=self.read_range())
+            elif kind == RTIK_TYPE_ARRAY:
+                name = self.string()
+                element = self.type_id()
+                t = GhwType(kind, name, element=element, dims=[self.type_id() for _ in range(self.uleb())])
+            elif kind == RTIK_SUBTYPE_ARRAY:
+                name = self.string()
+                base = self.type_id()
+                ranges, element = self.read_bounds(base)
+                t = GhwType(kind, name, base_type=base.base, ranges=ranges, element=element,
+                            length=int(np.prod([r[3] for r in ranges])))
+            elif kind == RTIK_SUBTYPE_UNBOUNDED_ARRAY:
+                name = self.string()
+                t = GhwType(kind, name, base_type=self.type_id())
+            elif kind == RTIK_TYPE_RECORD:
+                name = self.string()
+                t = GhwType(kind, name, fields=[(self.string(), self.type_id()) for _ in range(self.uleb())])
+            elif kind == RTIK_SUBTYPE_RECORD:
+                name = self.string()
+                base = self.type_id()
+                t = self.read_type_bounds(base) if self.unbounded(base) else GhwType(
+                    kind, name, base_type=base.base, fields=base.base.fields)
+                t.name = name
+            elif kind == RTIK_SUBTYPE_UNBOUNDED_RECORD:
+                name = self.string()
+                t = GhwType(kind, name, base_type=self.type_id())
+            else:
+                raise GhwError("unsupported type kind {k} at {p}".format(k=kind, p=self.pos - 1))
+            self.types.append(t)
+        if self.byte() != 0:
+            raise GhwError("type section not terminated at {p}".format(p=self.pos - 1))
+
+    def read_well_known_types(self):
+        ''' WKT: marks boolean, bit and std_ulogic '''
+        self.i32()
+        while True:
+            wkt = self.byte()
+            if wkt == 0: break
+            self.type_id().wkt = wkt
+
+    def read_hierarchy_header(self):
+        self.i32()
+        self.scopes = self.i32()
+        self.signal_count = self.i32()
+        self.scalar_count = self.i32()
+        self.hierarchy = self.pos
+
+    # Hierarchy
+    def walk(self):
+        ''' Yields a GhwSignal for every signal and port, in file order.
+            Also records the type of every scalar signal for the value decoder. '''
+        self.pos = self.hierarchy
+        scalar_types = [None]*(self.scalar_count + 1)
+        path = []
+        while True:
+            kind = self.byte()
+            if kind == HIE_EOH: break
+            if kind == HIE_EOS:
+                path.pop()
+                continue
+            name = self.string()
+            if kind in SCOPES:
+                if kind == HIE_GENERATE_FOR:
+                    iterator = self.type_id()
+                    name = "{n}({v})".format(n=name, v=self.read_value(iterator.base))
+                path.append(name)
+            elif HIE_SIGNAL <= kind <= HIE_PORT_LINKAGE:
+                t = self.type_id()
+                ids = []
+                self.read_signal_ids(t, ids, scalar_types)
+                position = self.pos
+                yield GhwSignal('.'.join(path + [name]), kind, t, ids)
+                self.pos = position
+            elif kind != HIE_PROCESS:
+                raise GhwError("unexpected hierarchy kind {k} at {p}".format(k=kind, p=self.pos - 1))
+        self.expect(b'EOH\0')
+        self.scalar_types = scalar_types
+        self.values = self.pos
+
+    def read_signal_ids(self, t, ids, scalar_types):
+        if t.kind == RTIK_SUBTYPE_ARRAY:
+            for _ in range(t.length): self.read_signal_ids(t.element, ids, scalar_types)
+        elif t.kind in (RTIK_TYPE_RECORD, RTIK_SUBTYPE_RECORD):
+            for _, field in t.fields: self.read_signal_ids(field, ids, scalar_types)
+        else:
+            sig = self.uleb()
+            if scalar_types[sig] is None: scalar_types[sig] = t.base
+            ids.append(sig)
+
+    def read_value(self, t):
+        if t.kind in (RTIK_TYPE_B2, RTIK_TYPE_E8): return self.byte()
+        if t.kind == RTIK_TYPE_F64: return self.f64()
+        return self.sleb()
+
+    def find(self, patterns):
+        ''' GhwSignals whose path matches one of the fnmatch patterns (case insensitive) '''
+        patterns = [p.lower() for p in patterns]
+        return [s for s in self.walk() if any(fnmatch.fnmatchcase(s.path.lower(), p) for p in patterns)]
+
+    # Value changes
+    def stream(self, ids, chunk=1 << 18):
+        ''' Yields (times, ids, values) arrays of up to chunk changes of the scalar
+            signals in ids, times in GHW steps. The first batch starts with the snapshot values. '''
+        if self.scalar_types is None:
+            for _ in self.walk(): pass
+        encoding = np.zeros(self.scalar_count + 1, dtype=np.uint8)
+        for sig, t in enumerate(self.scalar_types):
+            if t is None: continue
+            encoding[sig] = (VALUE_BYTE if t.kind in (RTIK_TYPE_B2, RTIK_TYPE_E8)
+                             else VALUE_F64 if t.kind == RTIK_TYPE_F64 else VALUE_LEB)
+        encoding = encoding.tolist()
+        wanted = bytearray(self.scalar_count + 1)
+        for sig in ids: wanted[sig] = 1
+
+        times, sigs, values = [], [], []
+        data = self.data
+        self.pos = self.values
+        while True:
+            tag = self.tag()
+            if tag == b'SNP\0':
+                self.i32()
+                now = self.i64()
+                for sig in range(1, self.scalar_count + 1):
+                    if not encoding[sig]: continue
+                    value = self.read_encoded(encoding[sig])
+                    if wanted[sig]:
+                        times.append(now); sigs.append(sig); values.append(value)
+                self.expect(b'ESN\0')
+                self.end = now
+            elif tag == b'CYC\0':
+                now = self.i64()
+                pos = self.pos
+                while True:
+                    sig = 0
+                    while True:
+                        # Inlined uleb: delta to the next changed signal, 0 ends the cycle
+                        b = data[pos]; pos += 1
+                        delta, shift = b & 0x7f, 7
+                        while b >= 0x80:
+                            b = data[pos]; pos += 1
+                            delta |= (b & 0x7f) << shift
+                            shift += 7
+                        if delta == 0: break
+                        sig += delta
+                        kind = encoding[sig]
+                        if kind == VALUE_BYTE:
+                            value = data[pos]; pos += 1
+                        else:
+                            self.pos = pos
+                            value = self.read_encoded(kind)
+                            pos = self.pos
+                        if wanted[sig]:
+                            times.append(now); sigs.append(sig); values.append(value)
+                            if len(times) >= chunk:
+                                yield self.batch(times, sigs, values)
+                                times, sigs, values = [], [], []
+                    self.pos = pos
+                    step = self.sleb()
+                    pos = self.pos
+                    if step == -1: break
+                    now += step
+                self.expect(b'ECY\0')
+                self.end = now
+            elif tag == b'DIR\0':
+                self.i32()
+                entries = self.i32()
+                self.pos += 8*entries     # (section tag, offset) pairs
+                self.expect(b'EOD\0')
+            elif tag == b'TAI\0':
+                break
+            else:
+                raise GhwError("unexpected section {t} at {p}".format(t=tag, p=self.pos - 4))
+            if self.pos >= len(data): break
+        if times: yield self.batch(times, sigs, values)
+
+    @property
+    def end_ps(self):
+        ''' Time of the last cycle in the dump, known once the values were streamed '''
+        return int(self.end*self.ps_per_step)
+
+    def read_encoded(self, kind):
+        if kind == VALUE_BYTE: return self.byte()
+        if kind == VALUE_F64: return self.f64()
+        return self.sleb()
+
+    def batch(self, times, sigs, values):
+        return (np.array(times, dtype=np.int64), np.array(sigs, dtype=np.int64),
+                np.array(values, dtype=np.float64 if any(isinstance(v, float) for v in values) else np.int64))
+
+    def traces(self, paths, signed=(), chunk=1 << 18):
+        ''' {path: SignalTrace} for signals matching paths (fnmatch patterns), times in ps.
+            std_logic vectors are combined into integers, as two's complement for
+            signed types and for paths matching signed. '''
+        signals = self.find(paths)
+        for s in signals:
+            s.twos_complement = s.signed or any(fnmatch.fnmatchcase(s.path.lower(), p.lower()) for p in signed)
+        ids = sorted({sig for s in signals for sig in s.ids})
+        per_id = {sig: ([], []) for sig in ids}
+        for times, sigs, values in self.stream(ids, chunk):
+            order = np.argsort(sigs, kind='stable')
+            bounds = np.searchsorted(sigs[order], ids + [max(ids) + 1]) if ids else []
+            for i, sig in enumerate(ids):
+                members = order[bounds[i]:bounds[i + 1]]
+                per_id[sig][0].append(times[members])
+                per_id[sig][1].append(values[members])
+        scalars = {sig: (np.concatenate(t), np.concatenate(v)) for sig, (t, v) in per_id.items()}
+        return {s.path: self.combine(s, scalars) for s in signals}
+
+    def combine(self, signal, scalars):
+        ''' SignalTrace of a signal from the changes of its scalar elements '''
+        std_logic = [self.scalar_types[sig].__dict__.get('wkt') == 3 for sig in signal.ids]
+        if len(signal.ids) == 1:
+            times, values = scalars[signal.ids[0]]
+            if std_logic[0]: values = STD_ULOGIC_BIT[values]
+            return self.trace(times, values)
+        if not all(std_logic):
+            raise GhwError("{p}: only std_logic vectors can be combined".format(p=signal.path))
+        times = np.unique(np.concatenate([scalars[sig][0] for sig in signal.ids]))
+        value = np.zeros(len(times), dtype=np.int64)
+        resolved = np.ones(len(times), dtype=bool)
+        for sig in signal.ids:      # Leftmost element first, that is the MSB
+            bit = STD_ULOGIC_BIT[SignalTrace(*scalars[sig]).value_at(times, default=0)]
+            resolved &= bit != UNRESOLVED
+            value = 2*value + np.maximum(bit, 0)
+        if signal.twos_complement:
+            half = 1 << (len(signal.ids) - 1)
+            value = np.where(value >= half, value - 2*half, value)
+        return self.trace(times, np.where(resolved, value, UNRESOLVED))
+
+    def trace(self, times, values):
+        ''' SignalTrace in ps with repeated values dropped '''
+        keep = np.concatenate(([True], values[1:] != values[:-1])) if len(values) else np.ones(0, dtype=bool)
+        times = times[keep]
+        if self.ps_per_step >= 1: times = times*int(self.ps_per_step)
+        else: times = times//int(round(1/self.ps_per_step))
+        return SignalTrace(times, values[keep])
+
+if __name__ == '__main__':
+    with GhwReader(sys.argv[1]) as dump:
+        for s in dump.walk():
+            print("{p:<60} {t:<24} {n:>4} scalars".format(p=s.path, t=str(s.type.name or s.type.base.name), n=len(s.ids)))
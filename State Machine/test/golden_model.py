@@ -0,0 +1,100 @@
+'''
+golden_model.py : Reference models of the encoder path of top_level_system.
+
+  The models work on whole stimulus arrays with NumPy instead of stepping
+  clock by clock. All times are rising mclk edge indices.
+
+    decode_quadrature : input_synchronizer + quadrature_decoder
+    velocity_reader   : 10 ms tick, 10-entry moving sum, /8 scaling and
+                        -127 saturation of velocity_reader.vhd
+'''
+import numpy as np
+
+#design constants (velocity_reader.vhd)
+TEN_MS_COUNT = 1_000_000
+SHIFT_LENGTH = 10            # pos_shift(9 downto 0)
+MAX_POS_COUNT = 35           # max_pos_count : (pos_count'left-1)**2 - 1
+MIN_POS_COUNT = -36          # min_pos_count : -((pos_count'left-1)**2)
+MOVING_SUM_BITS = 12         # signed(COUNT_WIDTH+4 downto 0)
+SATURATION_LIMIT = 800-1
+SATURATED = -127
+
+# Position within one quadrature cycle for each (sa & sb) encoder value: 00 -> 01 -> 11 -> 10
+QUAD_POSITION = np.array([0, 1, 3, 2])
+
+def wrap_signed(values, bits):
+    ''' Truncates integers to a signed bit width, like resize/overflow in VHDL '''
+    half = 1 << (bits - 1)
+    return (np.asarray(values, dtype=np.int64) + half) % (2*half) - half
+
+def decode_quadrature(edges, sa, sb, first_edge=0, sync_stages=2, initial=0):
+    ''' Returns (inc_edges, dec_edges): edges where pos_inc/pos_dec are registered high.
+
+        edges[i] is the first rising edge that samples the new (sa[i], sb[i]) at the
+        DUT input. The decoder reacts sync_stages edges later and is held in S0
+        ("00") until first_edge, the first edge with reset deasserted. initial is
+        the decoder position (QUAD_POSITION) before the first change, when
+        decoding a stimulus in consecutive pieces.
+    '''
+    edges = np.maximum(np.asarray(edges, dtype=np.int64) + sync_stages, first_edge)
+    position = QUAD_POSITION[2*np.asarray(sa, dtype=np.int64) + np.asarray(sb, dtype=np.int64)]
+    # Only the last input seen at each edge matters
+    last = np.append(edges[1:] != edges[:-1], True)
+    edges, position = edges[last], position[last]
+
+    previous = np.concatenate(([initial], position[:-1]))
+    step = (position - previous) % 4
+    if np.any(step == 2):
+        # Illegal transitions leave the state unchanged, fall back to stepping through the changes
+        step = np.zeros_like(position)
+        state = initial
+        for i, p in enumerate(position.tolist()):
+            s = (p - state) % 4
+            if s in (1, 3):
+                step[i] = s
+                state = p
+    return edges[step == 1], edges[step == 3]
+
+def position_counts(inc_edges, dec_edges, first_edge, n_ticks, ten_ms_count=TEN_MS_COUNT):
+    ''' Returns pos_count as shifted into pos_shift(0) at each of the n_ticks 10 ms ticks '''
+    counted = np.concatenate((inc_edges, dec_edges)).astype(np.int64) + 1   # pos_inc/dec are counted one edge later
+    delta = np.concatenate((np.ones(len(inc_edges), np.int64), -np.ones(len(dec_edges), np.int64)))
+    order = np.argsort(counted, kind='stable')
+    counted, delta = counted[order], delta[order]
+
+    # Tick j happens at first_edge + j*ten_ms_count and shifts the count of edges [tick j-1, tick j)
+    window = (counted - first_edge)//ten_ms_count + 1
+    keep = (counted >= first_edge) & (window < n_ticks)
+    counted, delta, window = counted[keep], delta[keep], window[keep]
+    counts = np.bincount(window, weights=delta, minlength=n_ticks).astype(np.int64)
+
+    # Windows where the running count hits max_pos_count/min_pos_count restart counting from zero
+    running = np.cumsum(delta)
+    start = np.searchsorted(window, window)
+    running = running - running[start] + delta[start]
+    for j in np.unique(window[(running >= MAX_POS_COUNT) | (running <= MIN_POS_COUNT)]):
+        count = 0
+        lo, hi = np.searchsorted(window, [j, j + 1])
+        for d in delta[lo:hi].tolist():
+            count = d if count in (MAX_POS_COUNT, MIN_POS_COUNT) else count + d
+        last_edge = counted[hi - 1]
+        tick = first_edge + j*ten_ms_count
+        if count in (MAX_POS_COUNT, MIN_POS_COUNT) and last_edge < tick - 1:
+            count = 0
+        counts[j] = count
+    return counts
+
+def velocity_reader(inc_edges, dec_edges, first_edge, n_ticks, ten_ms_count=TEN_MS_COUNT):
+    ''' Returns (tick_edges, velocity): velocity output after each 10 ms tick '''
+    counts = position_counts(inc_edges, dec_edges, first_edge, n_ticks, ten_ms_count)
+    total = np.concatenate(([0], np.cumsum(counts)))
+    moving_sum = total[1:] - total[np.maximum(np.arange(1, n_ticks + 1) - SHIFT_LENGTH, 0)]
+    moving_sum = wrap_signed(moving_sum, MOVING_SUM_BITS)
+    velocity = np.where(np.abs(moving_sum) > SATURATION_LIMIT, SATURATED,
+                        wrap_signed(np.fix(moving_sum/8), 8))
+    tick_edges = first_edge + ten_ms_count*np.arange(n_ticks, dtype=np.int64)
+    return tick_edges, velocity.astype(np.int64)
+
+def tick_count(first_edge, last_edge, ten_ms_count=TEN_MS_COUNT):
+    ''' Number of 10 ms ticks from first_edge up to and including last_edge '''
+    return max((last_edge - first_edge)//ten_ms_count + 1, 0)
@@ -0,0 +1,151 @@
+'''
+motor_plant.py : Event driven DC motor + quadrature encoder plant.
+
+  The motor speed follows a first-order model driven by the H-bridge
+  signals:  d(speed)/dt = (u*MAX_SPEED - speed)/TAU, u = 0 when en is low,
+  +1/-1 for dir high/low while en is high. Between input changes speed and
+  position have closed form solutions, so the plant computes the time of
+  the next encoder edge directly and sleeps until then, or until en/dir
+  change. It never ticks on mclk.
+
+  Position is counted in encoder positions: 200 pulses/rev gives 800
+  positions/rev (see velocity_reader.vhd), forward is 00 -> 01 -> 11 -> 10.
+'''
+import math
+
+from cocotb import start_soon
+from cocotb.triggers import Edge, First, Timer
+from cocotb.utils import get_sim_time
+
+from edge_trace import read_value
+from profiling import profile
+from stimulus import CyclePlan
+
+POSITIONS_PER_REV = 800
+MAX_RPM = 150
+MAX_SPEED = MAX_RPM*POSITIONS_PER_REV/60     # positions per second at full voltage
+TAU_S = 0.05                                 # mechanical time constant
+
+# (sa, sb) for position modulo 4
+QUADRATURE = [(0, 0), (0, 1), (1, 1), (1, 0)]
+
+class MotorModel():
+    ''' First-order motor with closed form integration. Times in seconds, position in encoder positions. '''
+    def __init__(self, tau=TAU_S, max_speed=MAX_SPEED):
+        self.tau = tau
+        self.max_speed = max_speed
+        self.speed = 0.0
+        self.position = 0.0
+        self.target = 0.0      # steady state speed for the present input
+
+    def set_input(self, u):
+        self.target = u*self.max_speed
+
+    def position_after(self, dt):
+        return (self.position + self.target*dt
+                + (self.speed - self.target)*self.tau*(1 - math.exp(-dt/self.tau)))
+
+    def advance(self, dt):
+        decay = math.exp(-dt/self.tau)
+        self.position += self.target*dt + (self.speed - self.target)*self.tau*(1 - decay)
+        self.speed = self.target + (self.speed - self.target)*decay
+
+    def turning_point(self):
+        ''' Time where speed crosses zero, or None if it keeps its sign '''
+        if self.speed == 0 or self.target == 0 or (self.speed > 0) == (self.target > 0):
+            return None
+        return self.tau*math.log((self.speed - self.target)/(-self.target))
+
+    def time_to(self, position):
+        ''' Shortest time until the motor reaches position, math.inf if never '''
+        turn = self.turning_point()
+        segments = [(0.0, turn), (turn, math.inf)] if turn else [(0.0, math.inf)]
+        for start, end in segments:
+            t = self.solve(position, start, end)
+            if t is not None: return t
+        return math.inf
+
+    def solve(self, position, start, end):
+        ''' Bisection on a segment where position is monotonic '''
+        p_start = self.position_after(start)
+        if end == math.inf:
+            # Grow the segment until it brackets the position, or give up when converged
+            end = start + self.tau
+            while not min(p_start, self.position_after(end)) <= position <= max(p_start, self.position_after(end)):
+                if end > start + 50*self.tau and self.target == 0: return None
+                if end > start + 1e6*self.tau: return None
+                end = start + 2*(end - start)
+        p_end = self.position_after(end)
+        if not min(p_start, p_end) <= position <= max(p_start, p_end): return None
+        rising = p_end >= p_start
+        while end - start > 1e-13:
+            mid = (start + end)/2
+            if (self.position_after(mid) < position) == rising: start = mid
+            else: end = mid
+        return end
+
+class MotorPlant():
+    ''' Closes the loop: reads en/dir, drives sa/sb. Edges are written mid-cycle and
+        recorded as a CyclePlan for golden_model.py. time_scale speeds up the motor
+        to match a scaled design (see time_scale.py). '''
+    def __init__(self, dut, en, dir, sa, sb, period_ns=10, time_scale=1, tau=TAU_S, max_speed=MAX_SPEED):
+        self.dut = dut
+        self.en, self.dir, self.sa, self.sb = en, dir, sa, sb
+        self.period_ps = period_ns*1000
+        self.model = MotorModel(tau/time_scale, max_speed*time_scale)
+        self.step = 0            # encoder position last driven on sa/sb
+        self.cycles, self.sa_values, self.sb_values = [], [], []
+        self.wakeups = 0
+        self.task = start_soon(profile(self.run()))
+
+    def input(self):
+        if read_value(self.en) != 1: return 0
+        return 1 if read_value(self.dir) == 1 else -1
+
+    def next_edge(self):
+        ''' (time in seconds, direction) of the next encoder edge. One position of
+            hysteresis keeps a motor resting on a boundary from chattering. '''
+        up = self.model.time_to(self.step + 1)
+        down = self.model.time_to(self.step - 1)
+        return (up, 1) if up <= down else (down, -1)
+
+    def mid_cycle(self, time_ps):
+        ''' First mid-cycle point at or after time_ps, away from the clock edges '''
+        half = self.period_ps//2
+        return -(-(time_ps - half)//self.period_ps)*self.period_ps + half
+
+    def write(self, now_ps):
+        sa, sb = QUADRATURE[self.step % 4]
+        self.sa.value, self.sb.value = sa, sb
+        self.cycles.append(now_ps//self.period_ps)
+        self.sa_values.append(sa)
+        self.sb_values.append(sb)
+
+    async def run(self):
+        last = get_sim_time('ps')
+        self.write(last)
+        while True:
+            self.model.set_input(self.input())
+            dt, direction = self.next_edge()
+            changed = [Edge(self.en), Edge(self.dir)]
+            if dt == math.inf:
+                await First(*changed)
+                timer = None
+            else:
+                at = max(self.mid_cycle(last + math.ceil(dt*1e12)), last + 1)
+                timer = Timer(at - last, 'ps')
+                result = await First(timer, *changed)
+            self.wakeups += 1
+            now = get_sim_time('ps')
+            self.model.advance((now - last)*1e-12)
+            last = now
+            if timer is not None and result is timer:
+                self.step += direction
+                self.write(now)
+
+    def plan(self, end):
+        ''' The encoder edges driven so far, as a CyclePlan ending at edge end '''
+        return CyclePlan(self.cycles, end, SA=self.sa_values, SB=self.sb_values)
+
+    def stop(self):
+        self.task.kill()
@@ -0,0 +1,128 @@
+'''
+profiling.py : Opt-in per-coroutine profiling of the testbench coroutines.
+
+  Set TB_PROFILE=1 to enable. Coroutines started through profile() are
+  stepped by a thin wrapper that counts their wakeups and the Python CPU
+  time spent in each step, per coroutine and per trigger type that woke
+  them. Steps of a profiled coroutine awaited by another profiled
+  coroutine are only charged (CPU time and wakeup) to the inner one.
+  TB_PROFILE=counts only counts wakeups, TB_PROFILE_FILE appends the
+  totals of every report as a JSON line (used by benchmark.py).
+
+    start_soon(profile(self.check_duty_cycle()))
+    await profile(stimuli.run())
+    ...
+    profiler.report(dut)      # ranked table at the end of a test
+'''
+import json
+import os
+import time
+
+from cocotb.utils import get_sim_time
+
+class Stats():
+    def __init__(self):
+        self.wakeups = 0
+        self.cpu = 0.0
+
+    def add(self, cpu, wakeups):
+        self.wakeups += wakeups
+        self.cpu += cpu
+
+class Profiler():
+    ''' Collects wakeups and CPU time per coroutine name and per trigger type '''
+    def __init__(self, enabled=False, timed=True, filename=None):
+        self.enabled = enabled
+        self.clock = time.thread_time if timed else (lambda: 0.0)
+        self.filename = filename
+        self.stack = []        # [CPU time, steps] of nested profiled steps, per active step
+        self.coroutines = {}
+        self.triggers = {}
+        self.sim_start = 0
+        self.wall_start = time.perf_counter()
+
+    def start(self):
+        ''' Clears the statistics, call at the start of a test '''
+        self.coroutines = {}
+        self.triggers = {}
+        self.sim_start = get_sim_time('ns')
+        self.wall_start = time.perf_counter()
+
+    def charge(self, name, trigger, cpu, wakeups=1):
+        self.coroutines.setdefault(name, Stats()).add(cpu, wakeups)
+        self.triggers.setdefault(trigger, Stats()).add(cpu, wakeups)
+
+    def report(self, dut, top=20):
+        ''' Logs the coroutines and trigger types ranked by CPU time '''
+        if not self.enabled: return
+        sim = get_sim_time('ns') - self.sim_start
+        wall = time.perf_counter() - self.wall_start
+        total = sum(stats.cpu for stats in self.coroutines.values())
+        lines = ["Profile: sim time {s:.0f} ns, wall time {w:.2f} s, ratio {r:.0f} ns/s, "
+                 "{c:.2f} s CPU in profiled coroutines".format(s=sim, w=wall, r=sim/wall if wall else 0, c=total)]
+        for title, table in (('coroutine', self.coroutines), ('woken by', self.triggers)):
+            lines.append("  {n:<44} {k:>10} {c:>10} {p:>6} {u:>10}".format(
+                n=title, k='wakeups', c='cpu ms', p='%', u='us/wakeup'))
+            ranked = sorted(table.items(), key=lambda item: (item[1].cpu, item[1].wakeups), reverse=True)[:top]
+            for name, stats in ranked:
+                lines.append("  {n:<44} {k:>10} {c:>10.1f} {p:>6.1f} {u:>10.1f}".format(
+                    n=name[:44], k=stats.wakeups, c=stats.cpu*1e3, p=100*stats.cpu/total if total else 0,
+                    u=1e6*stats.cpu/stats.wakeups if stats.wakeups else 0))
+        dut._log.info("\n".join(lines))
+        if self.filename:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps({'sim_ns': sim, 'wall_s': wall, 'cpu_s': total,
+                                    'wakeups': sum(stats.wakeups for stats in self.coroutines.values()),
+                                    'coroutines': {name: stats.wakeups for name, stats in self.coroutines.items()}}) + "\n")
+
+class Profiled():
+    ''' Awaitable that steps a coroutine and charges each step to the profiler '''
+    def __init__(self, profiler, coro, name):
+        self.profiler = profiler
+        self.coro = coro
+        self.name = name
+
+    def __await__(self):
+        profiler, coro = self.profiler, self.coro
+        value, error, woken_by = None, None, 'start'
+        while True:
+            profiler.stack.append([0.0, 0])
+            start = profiler.clock()
+            try:
+                trigger = coro.throw(error) if error is not None else coro.send(value)
+            except StopIteration as stop:
+                self.step_done(start, woken_by)
+                return stop.value
+            except BaseException:
+                self.step_done(start, woken_by)
+                raise
+            self.step_done(start, woken_by)
+            woken_by = type(trigger).__name__
+            try:
+                value, error = (yield trigger), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+    def step_done(self, start, woken_by):
+        ''' Charges the step's own CPU time; the wakeup goes to the innermost profiled coroutine '''
+        elapsed = self.profiler.clock() - start
+        nested, steps = self.profiler.stack.pop()
+        if self.profiler.stack:
+            self.profiler.stack[-1][0] += elapsed
+            self.profiler.stack[-1][1] += 1
+        self.profiler.charge(self.name, woken_by, elapsed - nested, 0 if steps else 1)
+
+PROFILE_MODE = os.environ.get('TB_PROFILE', '')
+profiler = Profiler(enabled=PROFILE_MODE not in ('', '0'), timed=PROFILE_MODE != 'counts',
+                    filename=os.environ.get('TB_PROFILE_FILE'))
+
+def profile(coro, name=None):
+    ''' Wraps a coroutine for profiling, or returns it unchanged when profiling is off '''
+    if not profiler.enabled: return coro
+    return run_profiled(Profiled(profiler, coro, name or coro.__qualname__))
+
+async def run_profiled(profiled):
+    return await profiled
@@ -0,0 +1,473 @@
+'''
+pwm_agent.py : PWM monitor and checkers, reusable on any bench with a pulse_width_modulator.
+
+  The agents are bound to the pwm ports by signal name, so the same checks run
+  on the pwm entity itself (tb_pwm) and on en_out/dir_out of top_level_system
+  (tb_system):
+
+    monitor = make_monitor(dut, messages, {'en': 'en_out', 'dir': 'dir_out'})
+
+    Monitor      : live checks, one coroutine per check (TB_MONITOR=live, default)
+    TraceMonitor : one EdgeRecorder, checks run as vectorized NumPy passes
+                   when check() is called (TB_MONITOR=trace)
+    DumpMonitor  : the TraceMonitor checks on the traces of a GHW dump
+
+  Errors are queued in a MessageQueue, per check type and sim time.
+'''
+from types import SimpleNamespace
+
+from cocotb import start_soon
+from cocotb.triggers import ClockCycles, Edge, First, FallingEdge, RisingEdge
+from cocotb.triggers import ReadOnly, Timer, with_timeout
+from cocotb.utils import get_sim_time
+from cocotb.result import SimTimeoutError
+
+import csv
+import json
+import math
+import os
+import numpy as np
+
+from edge_trace import EdgeRecorder
+from profiling import profile
+from tb_log import tb_logger
+
+# Conversion to pico-seconds made easy
+ps_conv = {'fs': 0.001, 'ps': 1, 'ns': 1000, 'us': 1e6, 'ms':1e9}
+
+#design constants
+PERIOD_NS = 10
+PWM_TIMEOUT_MS = 12
+TOO_FAST_PWM_US= 143
+
+#check_types
+RESET_TYPE = "Reset"
+SHORT_CIRCUIT_TYPE = "Short circuit"
+TIMEOUT_TYPE = "Timeout"
+DIRECTION_TYPE = "Direction"
+DUTY_CYCLE_TYPE = "Duty cycle"
+REPORT_ERROR = "Report error"
+
+MONITOR_MODE = os.environ.get("TB_MONITOR", "live")
+
+# Ports of pulse_width_modulator, the agents look them up by these names unless renamed
+PWM_PORTS = ('mclk', 'reset', 'duty_cycle', 'en', 'dir')
+
+def bind(dut, names=None):
+    ''' Handles of the pwm ports. names maps ports to other signal names of dut, e.g. {'en': 'en_out'} '''
+    names = dict({port: port for port in PWM_PORTS}, **(names or {}))
+    return SimpleNamespace(**{port: getattr(dut, name) for port, name in names.items()})
+
+class LazyMessage():
+    ''' Message template that is only formatted when printed '''
+    def __init__(self, template, **fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+class RingBuffer():
+    ''' Bounded buffer of (time, item) in time order, oldest entries are overwritten '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = [0]*capacity
+        self.items = [None]*capacity
+        self.head = 0       # index of the oldest entry
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, time, item):
+        index = (self.head + self.size) % self.capacity
+        self.times[index], self.items[index] = time, item
+        if self.size < self.capacity: self.size += 1
+        else: self.head = (self.head + 1) % self.capacity
+
+    def __getitem__(self, i):
+        index = (self.head + i) % self.capacity
+        return self.times[index], self.items[index]
+
+    def bisect(self, time):
+        ''' Logical index of the first entry at or after time '''
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high)//2
+            if self[mid][0] < time: low = mid + 1
+            else: high = mid
+        return low
+
+    def window(self, t0=None, t1=None):
+        ''' Entries with t0 <= time <= t1 '''
+        first = 0 if t0 is None else self.bisect(t0)
+        last = self.size if t1 is None else self.bisect(math.nextafter(t1, math.inf))
+        return [self[i] for i in range(first, last)]
+
+class MessageQueue():
+    ''' Message queue is used to store and pass assertion errors with text and traceback.
+        Errors are kept per check type in bounded ring buffers indexed by sim time (ns).
+        Messages are formatted only when reported or exported. '''
+    # colouring \033[...m  see https://stackabuse.com/how-to-print-colored-text-in-python/
+    CAPACITY = 1000
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}
+        self.counts = {}     # errors reported per type, including overwritten ones
+        self.listeners = []  # called with (error_type, time) for every error, e.g. WaveCapture.watch
+
+    def clear(self):
+        self.buffers.clear()
+        self.counts.clear()
+
+    def empty(self):
+        return not any(self.buffers.values())
+
+    def qsize(self):
+        return sum(len(buffer) for buffer in self.buffers.values())
+
+    def put_message(self, error_type, message, time=None):
+        ''' Stores a message, time (ns) defaults to the current sim time '''
+        if time is None: time = get_sim_time('ns')
+        if error_type not in self.buffers:
+            self.buffers[error_type] = RingBuffer(self.capacity)
+            self.counts[error_type] = 0
+        self.buffers[error_type].append(time, message)
+        self.counts[error_type] += 1
+        for listener in self.listeners:
+            listener(error_type, time)
+
+    def messages(self, error_type=None, t0=None, t1=None):
+        ''' Returns [(error_type, time, message)] in time order, optionally for one type and a time window '''
+        types = list(self.buffers) if error_type is None else [error_type]
+        found = [(kind, time, message) for kind in types if kind in self.buffers
+                 for time, message in self.buffers[kind].window(t0, t1)]
+        return sorted(found, key=lambda msg: msg[1])
+
+    def occurred(self, error_type, t0=None, t1=None):
+        ''' True if an error of error_type was reported within [t0, t1] ns '''
+        return error_type in self.buffers and len(self.buffers[error_type].window(t0, t1)) > 0
+
+    def check_queue(self, dut, t0=None, t1=None):
+        ''' Checks that no assertion errors were reported (within [t0, t1] ns) '''
+        found = self.messages(t0=t0, t1=t1)
+        if not found:
+            dut._log.info("\033[1;32m No errors in found!\x1b[0m")
+        else:
+            for msg in found:
+                dut._log.info(
+                    "\033[1;31mError found: {error_type}\033[0m\033[1m @{time}ns\033[0m \n{exception}".format(
+                    error_type = msg[0],
+                    time = msg[1],
+                    exception = str(msg[2]).split('\n')[0])) #Print only first line    
+            for error_type, count in self.counts.items():
+                if count > len(self.buffers[error_type]):
+                    dut._log.info("    {n} older {t} errors were dropped".format(
+                        n=count - len(self.buffers[error_type]), t=error_type))
+            error = found[-1][2]
+            if not isinstance(error, BaseException): error = AssertionError(str(error))
+            raise error  # Provide traceback for the last error reported 
+
+    def find_error(self, dut, error_type, t0=None, t1=None):
+        ''' Searches for a specific error (within [t0, t1] ns), the other entries are kept '''
+        if self.empty():
+            raise AssertionError("NO_QUEUE")
+        found = self.messages(error_type, t0, t1)
+        if found:
+            dut._log.info(
+                "    Found error: {error_type} @ {time}ns... ".format(
+                    error_type = found[0][0],
+                    time = found[0][1])) 
+            return
+        #raise only if none of the stored messages are of the correct type 
+        raise AssertionError("{err} error sought, but not found!".format(err=error_type))
+
+    def export_json(self, filename):
+        ''' Writes all stored errors and the per type counters as JSON '''
+        with open(filename, 'w') as f:
+            json.dump({'counts': self.counts,
+                       'errors': [{'type': kind, 'time_ns': time, 'message': str(message)}
+                                  for kind, time, message in self.messages()]}, f, indent=1)
+
+    def export(self, filename):
+        if filename.endswith('.csv'): self.export_csv(filename)
+        else: self.export_json(filename)
+
+    def export_csv(self, filename):
+        ''' Writes all stored errors as type,time_ns,message rows '''
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['type', 'time_ns', 'message'])
+            for kind, time, message in self.messages():
+                writer.writerow([kind, time, str(message).split('\n')[0]])
+
+class SignalEventMonitor():
+    """ Tracks a signal's last events.  """
+    def __init__(self, signal):
+        self.signal = signal
+        self.last_event = get_sim_time('ps')
+        self.last_rise = self.last_event
+        self.last_fall = self.last_event
+        start_soon(profile(self.update()))
+      
+    async def update(self):
+        while True:
+            await Edge(self.signal)
+            await ReadOnly()          # ReadOnly allows edge-edge measurment
+            self.last_event = get_sim_time('ps')
+            if self.signal == 1: self.last_rise = self.last_event
+            else: self.last_fall = self.last_event
+            
+    def stable_interval(self, units='ps'):
+        last_event_c = self.last_event/ps_conv[units]  # convert last_event to the prefix in use
+        stable = get_sim_time(units) - last_event_c    # calculate stable interval
+        return stable
+  
+class Monitor:
+    """ Contains and run all checks for signals in and out of DUT """
+    def __init__(self, dut, messages, names=None):
+        self.dut = dut
+        self.pwm = bind(dut, names)
+        self.messages = messages
+        self.log = tb_logger(dut)
+        start_soon(profile(self.run()))
+        
+    async def run(self):
+        ''' start all checks '''
+        await Timer(1, 'ns')   # Settle uninitialized values
+        self.dut._log.info("Starting monitoring events")
+        self.en_mon  = SignalEventMonitor(self.pwm.en)
+        self.duty_mon = SignalEventMonitor(self.pwm.duty_cycle)
+        self.reset_mon = SignalEventMonitor(self.pwm.reset)
+        start_soon(profile(self.check_reset()))
+        start_soon(profile(self.check_short_circuit()))
+        start_soon(profile(self.check_timeout()))
+        start_soon(profile(self.check_direction()))
+        start_soon(profile(self.check_duty_cycle()))
+
+    def check(self):
+        ''' Live checks report as they go, nothing is pending '''
+    
+    async def check_reset(self):
+        ''' Checks that PWM pulse (en) is deasserted when reset is applied '''
+        while True:
+            await FallingEdge(self.pwm.reset) 
+            try: assert self.pwm.en.value == 0, "PWM enable has not been deasserted during reset"
+            except AssertionError as e:
+                self.messages.put_message(RESET_TYPE, e)
+            self.dut._log.info("Completed: Reset test")
+
+    async def check_short_circuit(self):
+        ''' Checks that we are not short-circuiting the half-bridge by switching direction while pulsing '''
+        while True:
+            await Edge(self.pwm.dir)
+            try: 
+                if self.pwm.reset.value == 0:
+                    assert self.pwm.en.value == 0, "HALF-BRIDGE SHORT CIRCUITED: en active when changing direction"
+                    assert self.en_mon.stable_interval('ns') > PERIOD_NS-1, (
+                        "SHORT CIRCUIT DANGER: en deactivated less than one cycle before dir change")
+                    wait_task = Timer(PERIOD_NS-1, 'ns')
+                    event_task = Edge(self.pwm.en)
+                    result = await First(wait_task, event_task)
+                    assert result == wait_task, (
+                      "SHORT CICUIT DANGER: En was not stable for {per} {uni}"
+                      .format(per=PERIOD_NS, uni='ns'))
+            except AssertionError as e:
+                self.messages.put_message(SHORT_CIRCUIT_TYPE, e)
+
+    async def check_timeout(self):
+        ''' Checks that the PWM signal is actually driven within a reasonable timeframe'''
+        while True:
+            if self.pwm.duty_cycle.value == 0 : 
+                await Edge(self.pwm.duty_cycle)
+            try:
+                await with_timeout(Edge(self.pwm.en), PWM_TIMEOUT_MS, 'ms')
+            except SimTimeoutError:
+                self.messages.put_message(TIMEOUT_TYPE, "PWM signal is static, TB timed out ")
+                
+    async def check_direction(self):
+        ''' Checks that the pwm drives the motor in the correct direction'''
+        while True:    
+            await Edge(self.pwm.duty_cycle) 
+            await ClockCycles(self.pwm.mclk, 2)   # Trigger two clock edges after duty cycle was changed
+            await ReadOnly()                      # Wait for all signals to settle (all delta delays)
+            try:
+                duty = int(self.pwm.duty_cycle.value.signed_integer) # Numpy compatibility 
+                if np.int8(duty) > 0: 
+                    assert self.pwm.dir.value == 1, (
+                      "DIR is not '1' within 2 clock cycles of positive duty cycle: {DU} = {D}"
+                      .format(DU=np.int8(duty), D=self.pwm.duty_cycle.value))
+                if np.int8(duty) < 0:  
+                    assert self.pwm.dir.value == 0, (
+                      "DIR is not '0' within 2 clock cycles of negative duty cycle: {DU} = {D}"
+                      .format(DU=np.int8(duty), D=self.pwm.duty_cycle.value))
+            except AssertionError as e:
+                self.messages.put_message(DIRECTION_TYPE, e)
+                
+    async def check_duty_cycle(self):
+        ''' Checks that pwm pulses are not happening too fast for the PMOD module '''
+        await RisingEdge(self.pwm.en)
+        while True:
+            # Wait until we have a full period after reset
+            if self.pwm.reset.value == 1: 
+                 await FallingEdge(self.pwm.reset)
+                 await RisingEdge(self.pwm.en)
+            await RisingEdge(self.pwm.en)
+            
+            # Find the interval/period
+            start = self.en_mon.last_rise/ps_conv['us']
+            interval =  get_sim_time('us') - start
+            
+            try:
+                # Trigger only when duty cycle has been stable for the last period
+                if self.duty_mon.stable_interval('us') > interval:  
+                    assert interval > TOO_FAST_PWM_US, (
+                      "PWM period too short!: {iv:.2f}us, f={f:.3f}kHz   Minimum period: {per} us, ({maxf:.2f}kHz) "
+                      .format(iv=interval, f=(1000/interval), per=TOO_FAST_PWM_US, maxf=(1000/TOO_FAST_PWM_US))) 
+                      
+                    # Calculate duty cycle   
+                    mid = self.en_mon.last_fall/ps_conv['us']
+                    high = mid-start
+                    measured_duty = np.int8((high*100)/interval)
+                    set_duty = np.int8(self.pwm.duty_cycle.value.signed_integer)*100/128
+                    
+                    # Report duty cycle and check correspondens betweem input and output
+                    sign = "-" if self.pwm.dir.value == 0 else " "
+                    self.log.info(
+                      "Duty cycles: Set dc: {S:.1f}%, Measured dc: {Sig}{M:.1f}%, period = {P:.1f}us, f = {F:.2f}kHz",
+                      S=set_duty, Sig = sign, M = measured_duty, P = interval, F = 1000/interval) 
+                    abs_duty = abs(set_duty)
+                    deviation = np.int8(abs(abs_duty - measured_duty))
+                    assert deviation < 5, (                         
+                      "Set and measured duty cycle deviates by more than 5% ({D}%) "
+                      .format(D=deviation))
+            except AssertionError as e:
+                self.messages.put_message(DUTY_CYCLE_TYPE, e)
+
+class TraceMonitor:
+    """ Records en, dir, duty_cycle and reset and runs the Monitor checks offline.
+        check() analyzes the trace and reports errors that occured since the previous call. """
+    def __init__(self, dut, messages, names=None):
+        self.dut = dut
+        self.log = tb_logger(dut)
+        self.messages = messages
+        self.checked_ps = -1
+        pwm = bind(dut, names)
+        self.recorder = EdgeRecorder(
+            {'en': pwm.en, 'dir': pwm.dir, 'duty_cycle': pwm.duty_cycle, 'reset': pwm.reset},
+            signed=('duty_cycle',))
+        start_soon(profile(self.run()))
+
+    async def run(self):
+        await Timer(1, 'ns')   # Settle uninitialized values
+        self.dut._log.info("Starting edge recording")
+        self.recorder.start()
+
+    def check(self):
+        ''' Runs all checks as vectorized passes and queues errors in time order '''
+        if self.recorder.size == 0: return
+        traces = (self.recorder.signal(name) for name in ('en', 'dir', 'duty_cycle', 'reset'))
+        self.check_traces(*traces, get_sim_time('ps'))
+
+    def check_traces(self, en, dir, duty, reset, now):
+        ''' Queues the errors found in the traces between the previous call and now (ps) '''
+        errors = (self.check_reset(en, reset) + self.check_short_circuit(en, dir, reset)
+                + self.check_timeout(en, duty, now) + self.check_direction(dir, duty)
+                + self.check_duty_cycle(en, duty, reset))
+        errors.sort(key=lambda error: error[0])
+        for time, error_type, message in errors:
+            if self.checked_ps < time <= now:
+                self.messages.put_message(error_type, message, time/ps_conv['ns'])
+        self.checked_ps = now
+
+    def check_reset(self, en, reset):
+        ''' PWM enable shall be deasserted when reset is released '''
+        falls = reset.edges(rising=False)
+        bad = falls[en.value_at(falls) != 0]
+        return [(t, RESET_TYPE, "PWM enable has not been deasserted during reset") for t in bad]
+
+    def check_short_circuit(self, en, dir, reset):
+        ''' en shall be low and stable one cycle before and after each dir change '''
+        changes = dir.edges()
+        changes = changes[reset.value_at(changes) == 0]
+        guard = (PERIOD_NS-1)*ps_conv['ns']
+        active = en.value_at(changes) != 0
+        last_en = en.times[np.maximum(en.index_at(changes), 0)]
+        too_late = ~active & (changes - last_en <= guard)
+        too_soon = ~active & ~too_late & (en.next_change_after(changes) < changes + guard)
+        errors = [(t, SHORT_CIRCUIT_TYPE, "HALF-BRIDGE SHORT CIRCUITED: en active when changing direction")
+                  for t in changes[active]]
+        errors += [(t, SHORT_CIRCUIT_TYPE, "SHORT CIRCUIT DANGER: en deactivated less than one cycle before dir change")
+                   for t in changes[too_late]]
+        errors += [(t, SHORT_CIRCUIT_TYPE, LazyMessage("SHORT CICUIT DANGER: En was not stable for {per} {uni}",
+                    per=PERIOD_NS, uni='ns')) for t in changes[too_soon]]
+        return errors
+
+    def check_timeout(self, en, duty, now):
+        ''' en shall change within PWM_TIMEOUT_MS whenever the duty cycle is nonzero '''
+        timeout = int(PWM_TIMEOUT_MS*ps_conv['ms'])
+        started = (duty.values[1:] != 0) & (duty.values[:-1] == 0)
+        anchors = np.unique(np.concatenate((en.times, duty.times[1:][started])))
+        anchors = anchors[duty.value_at(anchors) != 0]
+        deadline = np.minimum(en.next_change_after(anchors) - 1, now)
+        count = np.maximum((deadline - anchors)//timeout, 0)
+        times = np.repeat(anchors, count) + timeout*(np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count) + 1)
+        return [(t, TIMEOUT_TYPE, "PWM signal is static, TB timed out ") for t in times]
+
+    def check_direction(self, dir, duty):
+        ''' dir shall follow the duty cycle sign within two clock cycles '''
+        period = PERIOD_NS*ps_conv['ns']
+        changes = duty.edges()
+        sampled = (changes//period + 2)*period    # Second rising clock edge after the change
+        duties = duty.value_at(sampled)
+        dirs = dir.value_at(sampled)
+        errors = [(t, DIRECTION_TYPE, LazyMessage("DIR is not '1' within 2 clock cycles of positive duty cycle: {DU}", DU=d))
+                  for t, d in zip(sampled[(duties > 0) & (dirs != 1)], duties[(duties > 0) & (dirs != 1)])]
+        errors += [(t, DIRECTION_TYPE, LazyMessage("DIR is not '0' within 2 clock cycles of negative duty cycle: {DU}", DU=d))
+                   for t, d in zip(sampled[(duties < 0) & (dirs != 0)], duties[(duties < 0) & (dirs != 0)])]
+        return errors
+
+    def check_duty_cycle(self, en, duty, reset):
+        ''' Checks PWM period and duty cycle for every full period with a stable duty cycle '''
+        rises = en.edges(rising=True)
+        start, end = rises[:-1], rises[1:]
+        # Full periods outside reset where the duty cycle was stable since the period started
+        valid = ((reset.value_at(start) == 0) & (reset.index_at(end) == reset.index_at(start))
+                 & (duty.times[np.maximum(duty.index_at(end), 0)] < start))
+        start, end = start[valid], end[valid]
+        interval = (end - start)/ps_conv['us']
+        too_fast = interval <= TOO_FAST_PWM_US
+        errors = [(t, DUTY_CYCLE_TYPE, LazyMessage(
+                   "PWM period too short!: {iv:.2f}us, f={f:.3f}kHz   Minimum period: {per} us, ({maxf:.2f}kHz) ",
+                   iv=iv, f=(1000/iv), per=TOO_FAST_PWM_US, maxf=(1000/TOO_FAST_PWM_US)))
+                  for t, iv in zip(end[too_fast], interval[too_fast])]
+        start, end, interval = start[~too_fast], end[~too_fast], interval[~too_fast]
+        falls = en.edges(rising=False)
+        mid = falls[np.maximum(np.searchsorted(falls, end) - 1, 0)] if len(falls) else start
+        high = (mid - start)/ps_conv['us']
+        measured = (high*100/interval).astype(np.int8)
+        set_duty = duty.value_at(end).astype(np.int8).astype(float)*100/128
+        deviation = np.abs(np.abs(set_duty) - measured).astype(np.int8)
+        bad = deviation >= 5
+        self.log.info("Checked {n} PWM periods, {b} deviating".format(n=len(end) + int(too_fast.sum()), b=int(bad.sum())))
+        errors += [(t, DUTY_CYCLE_TYPE, LazyMessage("Set and measured duty cycle deviates by more than 5% ({D}%) ", D=d))
+                   for t, d in zip(end[bad], deviation[bad])]
+        return errors
+
+class DumpMonitor(TraceMonitor):
+    """ Runs the TraceMonitor checks on the traces of a finished simulation (see ghw_check.py) """
+    def __init__(self, log, messages, en, dir, duty, reset, end):
+        self.log = tb_logger(log)
+        self.messages = messages
+        self.checked_ps = -1
+        self.traces = (en, dir, duty, reset)
+        self.end = end
+
+    def check(self):
+        self.check_traces(*self.traces, self.end)
+
+def make_monitor(dut, messages, names=None, mode=None):
+    ''' Creates the monitor selected by mode (default MONITOR_MODE), bound to the pwm ports by name '''
+    if (mode or MONITOR_MODE) == "trace": return TraceMonitor(dut, messages, names)
+    return Monitor(dut, messages, names)
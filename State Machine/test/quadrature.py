@@ -0,0 +1,84 @@
+'''
+quadrature.py : Quadrature encoder stimulus shared by the testbenches.
+
+  quadrature_plan() precomputes a whole encoder profile as a CyclePlan, so
+  the same arrays are driven into the DUT and handed to golden_model.py:
+
+    step_cycles : clock cycles between encoder steps (scalar or per step),
+                  rpm_cycles() converts an RPM profile
+    direction   : +1 forward (00 -> 01 -> 11 -> 10), -1 reverse (scalar or per step)
+    jitter      : each step moved by up to +-jitter cycles, order is kept
+    illegal     : steps replaced by a jump of two positions (both inputs
+                  change at once), which the decoder shall ignore
+
+  rotations_plan() and rpm_profile_plan() are the ready-made profiles of the
+  scenario sessions (see session.py).
+
+  QuadratureDriver binds the encoder inputs by signal name (sa/sb of
+  quadrature_decoder, SA/SB of top_level_system) and drives plans with
+  stimulus.drive_timed: one absolute Timer wait per change, no per-cycle
+  wakeups.
+'''
+import numpy as np
+
+from motor_plant import POSITIONS_PER_REV, QUADRATURE
+from stimulus import CyclePlan, drive_timed
+
+# (sa, sb) for position modulo 4
+SA, SB = np.array(QUADRATURE, dtype=np.int64).T
+
+def rpm_cycles(rpm, period_ns, positions_per_rev=POSITIONS_PER_REV):
+    ''' Clock cycles between encoder steps at rpm (scalar or per step). On a scaled
+        run (TIME_SCALE) pass PERIOD_NS*factor, the real time of one cycle. '''
+    ns_per_step = 60e9/(np.maximum(np.abs(rpm), 1e-9)*positions_per_rev)
+    return np.maximum(np.rint(ns_per_step/period_ns), 1).astype(np.int64)
+
+def quadrature_plan(start, steps, step_cycles, direction=1, jitter=0, illegal=(), rng=None,
+                    position=0, tail=0, names=('sa', 'sb')):
+    ''' CyclePlan of steps encoder steps after edge start, from position (0..3).
+        Step i is written step_cycles[0] + .. + step_cycles[i] edges after start,
+        the plan ends tail edges after the last step. '''
+    interval, direction = (np.broadcast_to(np.asarray(x, dtype=np.int64), (steps,)) for x in (step_cycles, direction))
+    cycles = start + np.cumsum(interval)
+    if jitter:
+        rng = rng or np.random.default_rng()
+        cycles = np.maximum(cycles + rng.integers(-jitter, jitter + 1, steps), start + 1)
+        # At least one edge between steps, so every step is sampled
+        order = np.arange(steps)
+        cycles = np.maximum.accumulate(cycles - order) + order
+    moves = np.where(direction < 0, -1, 1)
+    moves[np.asarray(illegal, dtype=np.int64)] = 2
+    positions = (position + np.cumsum(moves)) % 4
+    end = (cycles[-1] if steps else start) + tail
+    return CyclePlan(cycles, end, **{names[0]: SA[positions], names[1]: SB[positions]})
+
+def rotations_plan(start, rng, rotations=10, step_cycles=2, direction=1, jitter=0, illegal=0, tail=0,
+                   names=('sa', 'sb')):
+    ''' Whole rotations at a fixed step rate, with illegal random steps replaced by jumps '''
+    steps = 4*rotations
+    return quadrature_plan(start, steps, step_cycles, direction, jitter, rng.choice(steps, illegal, replace=False),
+                           rng, tail=tail, names=names)
+
+def rpm_profile_plan(start, rng, period_ns, rpm, steps, jitter=0, illegal=0, tail=0, min_rpm=20,
+                     names=('sa', 'sb')):
+    ''' steps encoder steps at a speed going linearly from rpm[0] to rpm[1] (or constant rpm).
+        Speeds below min_rpm are run at min_rpm, the direction follows the sign. '''
+    profile = np.linspace(*np.broadcast_to(np.asarray(rpm, dtype=np.float64), (2,)), steps)
+    return quadrature_plan(start, steps, rpm_cycles(np.maximum(np.abs(profile), min_rpm), period_ns),
+                           np.where(profile < 0, -1, 1), jitter, rng.choice(steps, illegal, replace=False),
+                           rng, tail=tail, names=names)
+
+class QuadratureDriver():
+    ''' Drives quadrature plans onto the encoder inputs of dut, bound by signal name '''
+    def __init__(self, dut, names=('sa', 'sb'), period_ns=10):
+        self.names = tuple(names)
+        self.handles = {name: getattr(dut, name) for name in self.names}
+        self.period_ns = period_ns
+
+    def plan(self, start, steps, step_cycles, **kwargs):
+        ''' quadrature_plan on this driver's signal names '''
+        return quadrature_plan(start, steps, step_cycles, names=self.names, **kwargs)
+
+    async def drive(self, plan, **handles):
+        ''' Drives plan, and the other plan signals given as handles (e.g. reset=dut.reset) '''
+        await drive_timed(dict(self.handles, **handles), plan, self.period_ns)
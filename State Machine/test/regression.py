@@ -0,0 +1,245 @@
+'''
+regression.py : Parallel multi-seed regression runner for the GHDL testbenches.
+
+  Fans (testbench module, toplevel, seed, generics) jobs out over a process
+  pool. The VHDL sources are analyzed once into a shared library (only what
+  changed since the last run, see vhdl_cache.py); every job
+  then gets its own build and results directory, so jobs never share
+  elaboration output, waveforms or results.xml.
+
+  usage:
+    python regression.py                         # every bench, one random seed
+    python regression.py --bench tb_pwm --seeds 8 --jobs 4
+    python regression.py --bench tb_pwm --seed 1743776067    # replay a failing seed
+    python regression.py --bench tb_system -g DC_WIDTH=8
+    python regression.py --bench tb_system --time-scale 10000
+    python regression.py --scenarios default      # one scenario session per bench and seed
+    python regression.py --no-wave                # no .ghw dumps (as WAVE=0 with make)
+
+  The merged report is written to regression/results.xml, the functional
+  coverage of the tb_pwm seeds is merged into one report (see
+  functional_coverage.py).
+'''
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import functional_coverage
+import vhdl_cache
+from time_scale import TimeScale
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+OUT_DIR = os.path.join(TEST_DIR, 'regression')
+SHARED_DIR = vhdl_cache.CACHE_DIR
+STD = '08'
+
+# Full waveform dump per job, like the makefile's WAVE ?= 1
+WAVE = os.environ.get('WAVE', '1') != '0'
+
+# Functional coverage counters written by tb_pwm in every job directory
+COVERAGE_FILE = 'coverage.json'
+
+# Files the DUT reads at elaboration, copied into every job directory
+DATA_FILES = ['pwm_values.txt']
+
+# bench name: (python module, VHDL toplevel)
+BENCHES = {
+    'tb_pwm': ('tb_pwm', 'pwm'),
+    'tb_quadrature_decoder': ('tb_quadrature_decoder', 'quadrature_decoder'),
+    'tb_system': ('tb_system', 'top_level_system'),
+}
+
+class Job():
+    ''' One simulator run '''
+    def __init__(self, bench, seed, generics=None, env=None):
+        self.bench = bench
+        self.module, self.toplevel = BENCHES[bench]
+        self.seed = int(seed)
+        self.generics = dict(generics or {})
+        self.env = dict(env or {})
+
+    @property
+    def name(self):
+        generics = ''.join('_{k}{v}'.format(k=k, v=v) for k, v in sorted(self.generics.items()))
+        return '{b}_{s}{g}'.format(b=self.bench, s=self.seed, g=generics)
+
+    def replay(self):
+        ''' Command line that reruns exactly this job '''
+        args = ['python', 'regression.py', '--bench', self.bench, '--seed', str(self.seed)]
+        if 'TIME_SCALE' in self.env:
+            args += ['--time-scale', self.env['TIME_SCALE']]
+        if 'TB_SCENARIOS' in self.env:
+            args += ['--scenarios', self.env['TB_SCENARIOS']]
+        if self.env.get('WAVE') == '0':
+            args += ['--no-wave']
+        for k, v in sorted(self.generics.items()):
+            args += ['-g', '{k}={v}'.format(k=k, v=v)]
+        return ' '.join(args)
+
+def ghdl(args, cwd, log=None, env=None):
+    ''' Runs ghdl and raises with its output on failure '''
+    result = subprocess.run(['ghdl'] + args, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    if log is not None:
+        with open(log, 'a') as f: f.write(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError("ghdl {a} failed:\n{o}".format(a=' '.join(args), o=result.stdout))
+    return result.stdout
+
+def analyze():
+    ''' Brings the shared library in SHARED_DIR up to date with src/*.vhd '''
+    vhdl_cache.update(SHARED_DIR, std=STD)
+
+def cocotb_env(job, job_dir):
+    ''' Environment the cocotb makefiles would set up for a GHDL run '''
+    libpython = subprocess.run(['cocotb-config', '--libpython'], stdout=subprocess.PIPE,
+                               text=True, check=True).stdout.strip()
+    env = dict(os.environ)
+    env.update({
+        'MODULE': job.module,
+        'TOPLEVEL': job.toplevel,
+        'TOPLEVEL_LANG': 'vhdl',
+        'RANDOM_SEED': str(job.seed),
+        'COCOTB_RESULTS_FILE': os.path.join(job_dir, 'results.xml'),
+        'TB_COVERAGE': os.path.join(job_dir, COVERAGE_FILE),
+        'LIBPYTHON_LOC': libpython,
+        'PYTHONPATH': os.pathsep.join([TEST_DIR, env.get('PYTHONPATH', '')]),
+    })
+    env.update(job.env)
+    return env
+
+def run_job(job, out_dir=OUT_DIR):
+    ''' Runs one job in its own directory and returns (job, results.xml path, wall time, error) '''
+    import cocotb.config
+    job_dir = os.path.join(out_dir, job.name)
+    shutil.rmtree(job_dir, ignore_errors=True)
+    os.makedirs(job_dir)
+    # Private copy of the shared library: elaboration output never collides between jobs
+    for lib in glob.glob(os.path.join(SHARED_DIR, '*.cf')) + glob.glob(os.path.join(SHARED_DIR, '*.o')):
+        shutil.copy(lib, job_dir)
+    for data in DATA_FILES:
+        shutil.copy(os.path.join(TEST_DIR, data), job_dir)
+
+    flags = ['--std=' + STD, '--workdir=' + job_dir]
+    generics = ['-g{k}={v}'.format(k=k, v=v) for k, v in job.generics.items()]
+    vpi = '--vpi=' + cocotb.config.lib_name_path('vpi', 'ghdl')
+    wave = ['--wave={t}.ghw'.format(t=job.toplevel)] if job.env.get('WAVE') != '0' else []
+    log = os.path.join(job_dir, 'sim.log')
+    wall = time.perf_counter()
+    error = None
+    try:
+        ghdl(['-e'] + flags + [job.toplevel], cwd=job_dir, log=log)
+        ghdl(['-r'] + flags + [job.toplevel, vpi] + wave + generics,
+             cwd=job_dir, log=log, env=cocotb_env(job, job_dir))
+    except RuntimeError as e:
+        error = str(e).splitlines()[0]
+    return job, os.path.join(job_dir, 'results.xml'), time.perf_counter() - wall, error
+
+def merge_results(outcomes, path):
+    ''' Merges the results.xml of every job into one report.
+        Returns a list of (job, number of failed testcases). '''
+    merged = ET.Element('testsuites', name='regression')
+    summary = []
+    for job, results, wall, error in outcomes:
+        suite = ET.SubElement(merged, 'testsuite', name=job.name, package=job.bench)
+        for key, value in (('bench', job.bench), ('toplevel', job.toplevel), ('random_seed', job.seed),
+                           ('wall_time', '{w:.3f}'.format(w=wall)), ('replay', job.replay())):
+            ET.SubElement(suite, 'property', name=key, value=str(value))
+        for key, value in sorted(job.generics.items()):
+            ET.SubElement(suite, 'property', name='generic_' + key, value=str(value))
+        failed = 0
+        if os.path.isfile(results):
+            for case in ET.parse(results).getroot().iter('testcase'):
+                suite.append(case)
+                failed += case.find('failure') is not None or case.find('error') is not None
+        else:
+            case = ET.SubElement(suite, 'testcase', name='simulation', classname=job.module)
+            ET.SubElement(case, 'error', message=error or 'results.xml not written')
+            failed += 1
+        summary.append((job, failed))
+    ET.ElementTree(merged).write(path)
+    return summary
+
+def print_report(outcomes, summary):
+    print("{j:<40} {t:>6} {f:>6} {s:>12} {w:>8} {r:>12}".format(
+        j='job', t='tests', f='failed', s='sim_time_ns', w='wall_s', r='ratio_time'))
+    for (job, results, wall, error), (_, failed) in zip(outcomes, summary):
+        cases = list(ET.parse(results).getroot().iter('testcase')) if os.path.isfile(results) else []
+        sim_ns = sum(float(case.get('sim_time_ns', 0)) for case in cases)
+        print("{j:<40} {t:>6} {f:>6} {s:>12.0f} {w:>8.2f} {r:>12.0f}".format(
+            j=job.name, t=len(cases), f=failed, s=sim_ns, w=wall, r=sim_ns/wall if wall else 0))
+    runs = []
+    for job, results, wall, error in outcomes:
+        path = os.path.join(os.path.dirname(results), COVERAGE_FILE)
+        if os.path.isfile(path):
+            with open(path) as f: runs.append(json.load(f))
+    if runs:
+        print("\n" + "\n".join(functional_coverage.report(functional_coverage.merge(runs), len(runs))))
+    failing = [job for job, failed in summary if failed]
+    if failing:
+        print("\nFailing seeds, replay with:")
+        for job in failing: print("    " + job.replay())
+
+def make_jobs(benches, seeds, n_seeds, generics, time_scale=1, scenarios=None, wave=WAVE):
+    rng = random.Random()
+    jobs = []
+    for bench in benches:
+        env, bench_generics = {}, dict(generics)
+        if scenarios:
+            # Jobs run in their own directory
+            env['TB_SCENARIOS'] = scenarios if scenarios == 'default' else os.path.abspath(scenarios)
+        if not wave:
+            env['WAVE'] = '0'
+        if time_scale != 1:
+            env['TIME_SCALE'] = str(time_scale)
+            if BENCHES[bench][1] == 'top_level_system':
+                bench_generics.update(TimeScale(time_scale).generics())
+        for seed in (seeds or [rng.randrange(2**31) for _ in range(n_seeds)]):
+            jobs.append(Job(bench, seed, bench_generics, env))
+    return jobs
+
+def parse_generics(pairs):
+    generics = {}
+    for pair in pairs:
+        name, value = pair.split('=', 1)
+        generics[name] = value
+    return generics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bench', action='append', choices=sorted(BENCHES), help="bench to run (default: all)")
+    parser.add_argument('--seed', action='append', type=int, help="exact seed to run (repeatable)")
+    parser.add_argument('--seeds', type=int, default=1, help="number of random seeds per bench")
+    parser.add_argument('-g', '--generic', action='append', default=[], help="NAME=VALUE toplevel generic")
+    parser.add_argument('--time-scale', type=int, default=1, help="divide the slow counters (see time_scale.py)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="parallel simulator processes")
+    parser.add_argument('--scenarios', help="scenario queue (.json or default) run in one launch per job (see session.py)")
+    parser.add_argument('--wave', action=argparse.BooleanOptionalAction, default=WAVE,
+                        help="dump <toplevel>.ghw in every job directory (default: on unless WAVE=0)")
+    args = parser.parse_args(argv)
+
+    benches = args.bench or sorted(BENCHES)
+    jobs = make_jobs(benches, args.seed, args.seeds, parse_generics(args.generic), args.time_scale, args.scenarios,
+                     args.wave)
+    analyze()
+
+    outcomes = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for future in as_completed([pool.submit(run_job, job) for job in jobs]):
+            outcomes.append(future.result())
+    outcomes.sort(key=lambda outcome: outcome[0].name)
+
+    summary = merge_results(outcomes, os.path.join(OUT_DIR, 'results.xml'))
+    print_report(outcomes, summary)
+    return 1 if any(failed for _, failed in summary) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+'''
+rom_tool.py : Self-test ROM files (pwm_values.txt) for self_test_module.
+
+  initialize_ROM reads addr_width lines of data_width binary digits into a
+  descending array, and self_test_module outputs them from the last line to
+  the first, one entry every self_test_count cycles.
+
+    generate : writes a duty cycle profile as a ROM file, in output order
+               ramp     : -max .. +max in equal steps
+               reversal : full scale with the sign flipped every entry
+               random   : uniform over the whole two's complement range
+    verify   : checks files are complete and well formed (and that several
+               copies, like src/ and test/, hold the same entries)
+    expect   : per entry en_out/dir_out expectations from cycle_model.py
+
+  expectations() returns the expected en_out/dir_out of every clock edge of a
+  whole sweep, so a bench can check a recorded sweep in one vectorized pass
+  (tb_system.self_test_sweep).
+
+  usage:
+    python rom_tool.py generate reversal --output pwm_values.txt
+    python rom_tool.py verify pwm_values.txt ../src/pwm_values.txt
+    python rom_tool.py expect pwm_values.txt --time-scale 1000
+'''
+import argparse
+import sys
+
+import numpy as np
+
+import cycle_model
+from cycle_model import ROM_ENTRIES, ROM_FILE, SystemModel
+from time_scale import TimeScale
+
+DATA_WIDTH = 8
+
+def ramp(entries=ROM_ENTRIES, width=DATA_WIDTH, rng=None):
+    top = (1 << (width - 1)) - 1
+    return np.rint(np.linspace(-top, top, entries)).astype(np.int64)
+
+def reversal(entries=ROM_ENTRIES, width=DATA_WIDTH, rng=None):
+    top = (1 << (width - 1)) - 1
+    return top*np.where(np.arange(entries) % 2, -1, 1)
+
+def uniform(entries=ROM_ENTRIES, width=DATA_WIDTH, rng=None):
+    rng = rng or np.random.default_rng()
+    return rng.integers(-(1 << (width - 1)), 1 << (width - 1), entries)
+
+PROFILES = {'ramp': ramp, 'reversal': reversal, 'random': uniform}
+
+def write_rom(filename, duties, width=DATA_WIDTH):
+    ''' Writes signed duty cycles so that self_test_module outputs them in the given order '''
+    with open(filename, 'w') as f:
+        for duty in np.asarray(duties)[::-1].tolist():
+            f.write("{v:0{w}b}\n".format(v=duty & ((1 << width) - 1), w=width))
+
+def verify(filename, entries=ROM_ENTRIES, width=DATA_WIDTH):
+    ''' Returns (errors, warnings) for a ROM file as initialize_ROM reads it '''
+    errors, warnings = [], []
+    with open(filename, 'rb') as f:
+        text = f.read().decode('ascii', errors='replace')
+    lines = text.split('\n')
+    if text.endswith('\n'): lines = lines[:-1]
+    elif text: warnings.append("no newline after the last line")
+    for i, line in enumerate(lines[:entries], 1):
+        line = line.rstrip('\r')
+        if len(line) != width or set(line) - set('01'):
+            errors.append("line {i}: {l!r} is not {w} binary digits".format(i=i, l=line, w=width))
+    if len(lines) < entries:
+        errors.append("{n} lines, initialize_ROM reads {e}".format(n=len(lines), e=entries))
+    elif len(lines) > entries:
+        warnings.append("{n} lines, only the first {e} are read".format(n=len(lines), e=entries))
+    return errors, warnings
+
+def signed(rom, width=DATA_WIDTH):
+    ''' ROM words (unsigned, as cycle_model.rom_values reads them) as signed duty cycles '''
+    rom = np.asarray(rom, dtype=np.int64)
+    return np.where(rom >= 1 << (width - 1), rom - (1 << width), rom)
+
+def expectations(rom, scale, release=2):
+    ''' (trace, table) of a whole sweep with reset held for edges 0 .. release-1.
+        trace holds en_out, dir_out and duty_cycle per edge (cycle_model),
+        table one row per entry: load edge, duty, en/dir high fraction, short circuits. '''
+    count = scale.self_test_count
+    n = release + (len(rom) + 1)*count
+    trace = SystemModel(scale, rom).motor_path(n, release, True)
+    loads = release + count - 1 + count*np.arange(len(rom), dtype=np.int64)
+    # Entry i is on duty_cycle from the edge after its load edge to the next load
+    starts = loads + 1
+    lengths = np.diff(np.append(starts, n))
+    shorts = cycle_model.short_circuits(trace, release)
+    entry_shorts = np.bincount(np.searchsorted(starts, shorts, side='right') - 1, minlength=len(rom))[:len(rom)]
+    table = np.zeros(len(rom), dtype=[('entry', np.int64), ('load_edge', np.int64), ('duty', np.int64),
+                                      ('en', np.float64), ('dir', np.float64), ('short_circuits', np.int64)])
+    table['entry'] = np.arange(len(rom))
+    table['load_edge'] = loads
+    table['duty'] = signed(rom)
+    table['en'] = np.add.reduceat(trace['en_out'].astype(np.int64), starts)/lengths
+    table['dir'] = np.add.reduceat(trace['dir_out'].astype(np.int64), starts)/lengths
+    table['short_circuits'] = entry_shorts
+    return trace, table
+
+def compare(expected, measured, first, table=None):
+    ''' Returns {signal: (differing edges, first differing edge, its entry)} from edge first on,
+        for the signals that differ. measured[name][k] is the value after edge k. '''
+    differ = {}
+    for name, values in measured.items():
+        diff = np.flatnonzero(expected[name][first:].astype(np.int64) != values[first:]) + first
+        if len(diff):
+            entry = int(np.searchsorted(table['load_edge'], diff[0]) - 1) if table is not None else None
+            differ[name] = (len(diff), int(diff[0]), entry)
+    return differ
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate, verify and model self-test ROM files")
+    sub = parser.add_subparsers(dest='command', required=True)
+    gen = sub.add_parser('generate', help="write a duty cycle profile as a ROM file")
+    gen.add_argument('profile', choices=sorted(PROFILES))
+    gen.add_argument('--output', default=ROM_FILE)
+    gen.add_argument('--seed', type=int, default=None, help="seed of the random profile")
+    ver = sub.add_parser('verify', help="check ROM files and compare copies")
+    ver.add_argument('files', nargs='+')
+    exp = sub.add_parser('expect', help="per entry en_out/dir_out expectations")
+    exp.add_argument('file', nargs='?', default=ROM_FILE)
+    exp.add_argument('--time-scale', type=int, default=None, help="TIME_SCALE (default: environment)")
+    for p in (gen, ver, exp):
+        p.add_argument('--entries', type=int, default=ROM_ENTRIES, help="addr_width")
+        p.add_argument('--width', type=int, default=DATA_WIDTH, help="data_width")
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        duties = PROFILES[args.profile](args.entries, args.width, np.random.default_rng(args.seed))
+        write_rom(args.output, duties, args.width)
+        print("{o}: {d}".format(o=args.output, d=' '.join(str(d) for d in duties.tolist())))
+        return 0
+
+    if args.command == 'verify':
+        failed, contents = False, {}
+        for filename in args.files:
+            errors, warnings = verify(filename, args.entries, args.width)
+            print("{f}: {s}".format(f=filename, s='ERROR' if errors else 'ok'))
+            for message in errors: print("    error: " + message)
+            for message in warnings: print("    warning: " + message)
+            failed |= bool(errors)
+            if not errors: contents[filename] = cycle_model.rom_values(filename, args.entries).tolist()
+        if len(set(map(tuple, contents.values()))) > 1:
+            print("copies differ: " + ', '.join(contents))
+            failed = True
+        return 1 if failed else 0
+
+    scale = TimeScale(args.time_scale)
+    _, table = expectations(cycle_model.rom_values(args.file, args.entries), scale)
+    print("{e:>5} {l:>12} {d:>6} {n:>8} {r:>8} {s:>8}".format(e='entry', l='load edge', d='duty', n='en', r='dir', s='shorts'))
+    for row in table:
+        print("{e:>5} {l:>12} {d:>6} {n:>8.3f} {r:>8.3f} {s:>8}".format(
+            e=row['entry'], l=row['load_edge'], d=row['duty'], n=row['en'], r=row['dir'], s=row['short_circuits']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
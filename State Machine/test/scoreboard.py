@@ -0,0 +1,168 @@
+'''
+scoreboard.py : Scoreboards comparing the DUT against golden_model.py.
+
+  The expected values are computed in bulk up front, so the scoreboards
+  only wake when there is something to compare. Seg7Monitor checks the
+  seven-segment display against the same velocity model.
+'''
+from cocotb import start_soon
+from cocotb.triggers import Edge, FallingEdge, ReadOnly, RisingEdge, Timer
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+from cycle_model import SEG7
+from edge_trace import read_value
+from profiling import profile
+from tb_log import tb_logger
+
+class VelocityScoreboard():
+    ''' Samples velocity once after each 10 ms tick and compares it with the model.
+        Without expected values the samples are kept until check(expected).
+        With them, trigger(time in ps) is called on each mismatch as it is sampled. '''
+    def __init__(self, dut, velocity, tick_edges, expected=None, period_ns=10, trigger=None):
+        self.dut = dut
+        self.velocity = velocity
+        self.tick_edges = tick_edges
+        self.expected = expected
+        self.trigger = trigger
+        self.period_ps = period_ns*1000
+        self.mismatches = []
+        self.samples = []
+        start_soon(profile(self.run()))
+
+    @property
+    def sampled(self):
+        return len(self.samples)
+
+    async def run(self):
+        for i, edge in enumerate(self.tick_edges.tolist()):
+            sample = edge*self.period_ps + self.period_ps//2   # Mid-cycle after the tick edge
+            now = get_sim_time('ps')
+            if sample > now:
+                await Timer(sample - now, 'ps')
+            await ReadOnly()
+            self.samples.append(read_value(self.velocity, signed=True))
+            if self.trigger and self.expected is not None and i < len(self.expected) and self.samples[-1] != self.expected[i]:
+                self.trigger(sample)
+
+    def check(self, expected=None):
+        ''' Raises if any sampled velocity differed from the model '''
+        if expected is not None: self.expected = expected
+        measured = np.array(self.samples, dtype=np.int64)
+        expected = self.expected[:len(measured)]
+        differ = np.flatnonzero(measured != expected)
+        self.mismatches = list(zip(self.tick_edges[differ].tolist(), expected[differ].tolist(), measured[differ].tolist()))
+        self.dut._log.info("Velocity scoreboard: {n} ticks compared, {m} mismatches"
+                           .format(n=self.sampled, m=len(self.mismatches)))
+        log = tb_logger(self.dut)
+        for edge, expected, measured in self.mismatches:
+            log.info("    edge {e}: expected velocity {x}, measured {m}", e=edge, x=expected, m=measured)
+        log.summary()
+        assert not self.mismatches, "Velocity differs from golden model at {n} ticks".format(n=len(self.mismatches))
+
+class PulseScoreboard():
+    ''' Records every edge where pos_inc/pos_dec are registered high and compares them with the model.
+        Back-to-back pulses keep the line high, so each high interval counts once per cycle;
+        the recorder still only wakes on the edges of the pulse lines. '''
+    def __init__(self, dut, pos_inc, pos_dec, period_ns=10):
+        self.dut = dut
+        self.period_ps = period_ns*1000
+        self.edges = {'pos_inc': [], 'pos_dec': []}
+        self.rise = {'pos_inc': None, 'pos_dec': None}     # edge of a pulse still high
+        start_soon(profile(self.record(pos_inc, 'pos_inc'), 'PulseScoreboard.record pos_inc'))
+        start_soon(profile(self.record(pos_dec, 'pos_dec'), 'PulseScoreboard.record pos_dec'))
+
+    async def record(self, signal, name):
+        while True:
+            await RisingEdge(signal)
+            self.rise[name] = get_sim_time('ps')//self.period_ps
+            await FallingEdge(signal)
+            # High after edges rise .. fall-1
+            self.edges[name].extend(range(self.rise[name], get_sim_time('ps')//self.period_ps))
+            self.rise[name] = None
+
+    def pulses(self, name):
+        ''' Recorded pulse edges, including a pulse that is still high now '''
+        edges = self.edges[name]
+        if self.rise[name] is not None:
+            edges = edges + list(range(self.rise[name], get_sim_time('ps')//self.period_ps + 1))
+        return np.array(edges, dtype=np.int64)
+
+    def check(self, inc_edges, dec_edges):
+        ''' Raises unless the recorded pulses match the expected edge indices '''
+        for name, expected in (('pos_inc', inc_edges), ('pos_dec', dec_edges)):
+            measured = self.pulses(name)
+            self.dut._log.info("{name}: {m} pulses, {x} expected".format(name=name, m=len(measured), x=len(expected)))
+            assert np.array_equal(measured, expected), (
+              "{name} pulses differ from golden model, first difference at edge {e}"
+              .format(name=name, e=first_difference(measured, expected)))
+
+def first_difference(measured, expected):
+    ''' Returns the first edge index where two pulse edge arrays disagree '''
+    n = min(len(measured), len(expected))
+    differ = np.flatnonzero(measured[:n] != expected[:n])
+    if len(differ): return int(min(measured[differ[0]], expected[differ[0]]))
+    return int(measured[n] if len(measured) > n else expected[n])
+
+# abcdefg pattern -> hex digit (bin2ssd in seg7_pkg.vhd), -1 for any other pattern
+SEG7_DIGIT = np.full(128, -1, dtype=np.int64)
+SEG7_DIGIT[SEG7] = np.arange(16)
+
+class Seg7Monitor():
+    ''' Samples c/abcdefg of seg7ctrl once per digit, half a mux period after each c edge,
+        and checks the digits and the two-digit velocity they show against the model.
+        Wakeups scale with display updates (2 per mux period), not with clock cycles. '''
+    def __init__(self, dut, c, abcdefg, mux_count, period_ns=10):
+        self.dut = dut
+        self.c = c
+        self.abcdefg = abcdefg
+        self.period_ps = period_ns*1000
+        # abcdefg follows c one edge later: sample mid-digit, but at least 2 edges after the c edge
+        self.delay_ps = max(mux_count//2, 2)*self.period_ps
+        self.samples = []        # (edge, c, abcdefg)
+        self.mismatches = []
+        self.running = True
+        start_soon(profile(self.run()))
+
+    def stop(self):
+        self.running = False
+
+    async def run(self):
+        edge = Edge(self.c)
+        delay = Timer(self.delay_ps, 'ps')
+        while self.running:
+            await edge
+            await delay
+            await ReadOnly()
+            self.samples.append((get_sim_time('ps')//self.period_ps, read_value(self.c), read_value(self.abcdefg)))
+
+    def check(self, tick_edges, expected, first_edge):
+        ''' Raises if a digit differs from the velocity_reader model after first_edge.
+            tick_edges/expected are the velocity model (velocity is 0 before the first tick). '''
+        samples = np.array(self.samples, dtype=np.int64).reshape(-1, 3)
+        samples = samples[(samples[:, 0] >= first_edge + 2) & (samples[:, 1] >= 0)]
+        edges, c, pattern = samples[:, 0], samples[:, 1], samples[:, 2]
+        digit = np.where(pattern >= 0, SEG7_DIGIT[np.maximum(pattern, 0)], -1)
+        # abcdefg at edge k shows the velocity registered before edge k
+        tick = np.searchsorted(tick_edges, edges - 1, side='right') - 1
+        velocity = np.where(tick >= 0, np.asarray(expected, dtype=np.int64)[np.maximum(tick, 0)], 0)
+        nibble = np.where(c == 0, (velocity & 0xFF) >> 4, velocity & 0xF)
+        bad = np.flatnonzero(digit != nibble)
+        self.mismatches = list(zip(edges[bad].tolist(), c[bad].tolist(), nibble[bad].tolist(), digit[bad].tolist()))
+
+        # Two-digit value: a c=0 (d0, high nibble) digit followed by its c=1 digit within one tick
+        pair = np.flatnonzero((c[:-1] == 0) & (c[1:] == 1) & (tick[:-1] == tick[1:]))
+        shown = (digit[pair] << 4) | digit[pair + 1]
+        shown = np.where(shown >= 128, shown - 256, shown)
+        wrong = np.count_nonzero((digit[pair] < 0) | (digit[pair + 1] < 0) | (shown != velocity[pair]))
+
+        log = tb_logger(self.dut)
+        log.info("Seven-segment: {n} digits sampled, {p} displayed velocities, {m} digit mismatches, {w} wrong values"
+                 .format(n=len(edges), p=len(pair), m=len(self.mismatches), w=wrong))
+        for edge, sel, expected_digit, shown_digit in self.mismatches:
+            log.info("    edge {e}: c={c}, expected digit {x}, decoded {d}", e=edge, c=sel, x=expected_digit, d=shown_digit)
+        log.summary()
+        assert not self.mismatches, "Seven-segment digits differ from the velocity model at {n} samples".format(
+            n=len(self.mismatches))
+        assert wrong == 0, "{w} of {p} displayed velocities differ from the velocity model".format(w=wrong, p=len(pair))
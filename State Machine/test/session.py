@@ -0,0 +1,75 @@
+'''
+session.py : Scenario sessions, many short scenarios in one simulator launch.
+
+  Every launch pays for GHDL elaboration and simulator startup. With
+  TB_SCENARIOS set, a bench registers one cocotb test per scenario of a
+  queue instead of running its ordinary tests, so the startup is paid once
+  and results.xml gets one testcase per scenario (scenario_003_reverse, ...).
+
+  TB_SCENARIOS is a .json file with a list of scenarios, or "default" for the
+  built-in queue of the bench:
+
+    [{"kind": "rpm", "name": "slow", "rpm": 30, "steps": 100},
+     {"kind": "fault", "fault": "short_1"}]
+
+  kind selects the bench's scenario runner, the other keys are its
+  parameters. Each scenario starts with a reset pulse of the DUT and fresh
+  monitors and scoreboards; begin() also clears the profiler and the
+  per call site log counters left by the previous scenario.
+'''
+import json
+import os
+import re
+
+import cocotb
+
+from profiling import profiler
+from tb_log import tb_logger
+
+SCENARIOS = os.environ.get('TB_SCENARIOS')
+SESSION = bool(SCENARIOS)
+
+def load_scenarios(source, kinds, default=()):
+    ''' Scenario dicts of a .json file (or of default for "default"), checked against the runner kinds '''
+    if source == 'default':
+        scenarios = [dict(scenario) for scenario in default]
+    else:
+        with open(source) as f:
+            scenarios = json.load(f)
+    for i, scenario in enumerate(scenarios):
+        if scenario.get('kind') not in kinds:
+            raise ValueError("scenario {i}: kind {k!r} is not one of {s}".format(
+                i=i, k=scenario.get('kind'), s=', '.join(sorted(kinds))))
+        scenario.setdefault('name', scenario['kind'])
+    return scenarios
+
+def scenario_name(index, scenario):
+    return 'scenario_{i:03d}_{n}'.format(i=index, n=re.sub(r'\W', '_', scenario['name']))
+
+def register(module_globals, runners, default=()):
+    ''' Adds one cocotb test per queued scenario to a bench module, in queue order.
+        runners maps kinds to coroutine functions runner(dut, **parameters). '''
+    if not SESSION: return []
+    scenarios = load_scenarios(SCENARIOS, runners, default)
+    for i, scenario in enumerate(scenarios):
+        async def scenario_test(dut, scenario=scenario):
+            parameters = {k: v for k, v in scenario.items() if k not in ('kind', 'name')}
+            begin(dut, scenario)
+            await runners[scenario['kind']](dut, **parameters)
+            end(dut)
+        scenario_test.__name__ = scenario_test.__qualname__ = scenario_name(i, scenario)
+        scenario_test.__doc__ = "{k} scenario {n}".format(k=scenario['kind'], n=scenario['name'])
+        scenario_test.__module__ = module_globals['__name__']
+        module_globals[scenario_test.__name__] = cocotb.test()(scenario_test)
+    return scenarios
+
+def begin(dut, scenario):
+    ''' Clears the state the previous scenario left in the shared testbench objects '''
+    profiler.start()
+    tb_logger(dut).reset()
+    dut._log.info("Scenario {n} ({k}): {p}".format(n=scenario['name'], k=scenario['kind'], p=json.dumps(
+        {k: v for k, v in scenario.items() if k not in ('kind', 'name')})))
+
+def end(dut):
+    profiler.report(dut)
+    tb_logger(dut).summary()
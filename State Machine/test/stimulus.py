@@ -0,0 +1,82 @@
+'''
+stimulus.py : Stimulus plans shared by the testbenches.
+
+  A plan holds all input changes as arrays, so the same stimulus can be
+  driven into the DUT and handed to golden_model.py in one piece.
+
+  drive_timed is the time-warp engine: it sleeps with absolute Timer waits
+  between changes, so Python only wakes when an input actually changes.
+  drive_cycles counts clock edges instead and is kept as the reference.
+'''
+from cocotb.triggers import ClockCycles, Timer
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+class CyclePlan():
+    ''' Input changes written right after rising edge cycles[i].
+
+        values maps signal names to arrays of the same length as cycles,
+        end is the edge index where the plan is complete.
+    '''
+    def __init__(self, cycles, end, **values):
+        self.cycles = np.asarray(cycles, dtype=np.int64)
+        self.end = int(end)
+        self.values = {name: np.asarray(value, dtype=np.int64) for name, value in values.items()}
+
+    def __len__(self):
+        return len(self.cycles)
+
+    def sampled(self):
+        ''' Edge indices where each change is first sampled by the DUT '''
+        return self.cycles + 1
+
+    def changed(self, name):
+        ''' True for the rows where the signal gets a new value '''
+        value = self.values[name]
+        return np.concatenate(([True], value[1:] != value[:-1]))
+
+    def events(self, handles, period_ns):
+        ''' Flattens the plan to [(time ps, [(handle, value), ...]), ...].
+            Changes are applied mid-cycle, half a period after the edge. '''
+        period_ps = period_ns*1000
+        times = (self.cycles*period_ps + period_ps//2).tolist()
+        writes = [[] for _ in times]
+        for name, handle in handles.items():
+            values = self.values[name].tolist()
+            for i in np.flatnonzero(self.changed(name)).tolist():
+                writes[i].append((handle, values[i]))
+        return [(t, w) for t, w in zip(times, writes) if w]
+
+def with_reset(plan, start, values=0):
+    ''' plan preceded by reset written after edge start and released after edge start + 1.
+        The other signals of plan are written values during reset. '''
+    assert len(plan) == 0 or plan.cycles[0] > start + 1, "plan starts before the reset release"
+    return CyclePlan(np.concatenate(([start, start + 1], plan.cycles)), plan.end,
+                     reset=np.concatenate(([1, 0], np.zeros(len(plan), dtype=np.int64))),
+                     **{name: np.concatenate(([values, values], value)) for name, value in plan.values.items()})
+
+async def drive_timed(handles, plan, period_ns):
+    ''' Drives a CyclePlan with absolute Timer waits, waking only on input changes '''
+    for time, writes in plan.events(handles, period_ns):
+        now = get_sim_time('ps')
+        if time > now:
+            await Timer(time - now, 'ps')
+        for handle, value in writes:
+            handle.value = value
+    end = plan.end*period_ns*1000
+    now = get_sim_time('ps')
+    if end > now:
+        await Timer(end - now, 'ps')
+
+async def drive_cycles(clk, handles, plan, now):
+    ''' Drives a CyclePlan by counting clock cycles. now is the edge index we are at.
+        Only signals in handles are driven. '''
+    for i, cycle in enumerate(plan.cycles.tolist()):
+        if cycle > now:
+            await ClockCycles(clk, cycle - now)
+            now = cycle
+        for name, handle in handles.items():
+            handle.value = int(plan.values[name][i])
+    if plan.end > now:
+        await ClockCycles(clk, plan.end - now)
@@ -0,0 +1,141 @@
+'''
+tb_log.py : Rate-limited, lazily formatted logging for testbench hot loops.
+
+  TbLogger wraps a logger (dut._log) with the same info/debug/warning/error
+  calls. Messages are .format templates, formatted only when they are
+  actually emitted:
+
+    log = tb_logger(dut)
+    log.info("Duty cycle {d:.1f}%, period {p:.1f}us", d=duty, p=period)
+
+  Every call site (file and line, or key=) logs its first TB_LOG_BURST
+  messages (default 20), then only one in TB_LOG_SAMPLE (default 10).
+  summary() reports what was held back.
+
+  With TB_LOG_SINK=<file>.jsonl every call, held back or not, is also written
+  as a JSON line (sim time, level, site, template and fields) without
+  formatting it. Pretty-print the events afterwards with:
+    python tb_log.py events.jsonl [--site tb_pwm.py] [--level INFO] [--all]
+'''
+import argparse
+import atexit
+import json
+import logging
+import os
+import sys
+
+from cocotb.utils import get_sim_time
+
+BURST = int(os.environ.get('TB_LOG_BURST', 20))
+SAMPLE = max(int(os.environ.get('TB_LOG_SAMPLE', 10)), 1)
+
+def plain(value):
+    ''' JSON value for numpy scalars, exceptions and other objects '''
+    if hasattr(value, 'item'): return value.item()
+    return str(value)
+
+class EventSink():
+    ''' Buffered JSON lines file of log events '''
+    def __init__(self, filename):
+        self.file = open(filename, 'w', buffering=1 << 20)
+        atexit.register(self.close)
+
+    def write(self, level, site, msg, args, fields):
+        self.file.write(json.dumps({'t': get_sim_time('ns'), 'level': logging.getLevelName(level), 'site': site,
+                                    'msg': msg, 'args': args, 'fields': fields}, default=plain) + "\n")
+
+    def flush(self):
+        if not self.file.closed: self.file.flush()
+
+    def close(self):
+        if not self.file.closed: self.file.close()
+
+SINK = EventSink(os.environ['TB_LOG_SINK']) if os.environ.get('TB_LOG_SINK') else None
+
+class TbLogger():
+    ''' Drop-in for dut._log with lazy formatting and per call site burst + sampling '''
+    def __init__(self, log, burst=BURST, sample=SAMPLE, sink=SINK):
+        self.log = log
+        self.burst = burst
+        self.sample = sample
+        self.sink = sink
+        self.calls = {}      # calls per site
+
+    def debug(self, msg, *args, key=None, **fields):
+        self.emit(logging.DEBUG, msg, args, fields, key)
+
+    def info(self, msg, *args, key=None, **fields):
+        self.emit(logging.INFO, msg, args, fields, key)
+
+    def warning(self, msg, *args, key=None, **fields):
+        self.emit(logging.WARNING, msg, args, fields, key)
+
+    def error(self, msg, *args, key=None, **fields):
+        self.emit(logging.ERROR, msg, args, fields, key)
+
+    def emit(self, level, msg, args, fields, key):
+        if key is None:
+            caller = sys._getframe(2)
+            key = "{f}:{n}".format(f=os.path.basename(caller.f_code.co_filename), n=caller.f_lineno)
+        n = self.calls.get(key, 0) + 1
+        self.calls[key] = n
+        if self.sink: self.sink.write(level, key, msg, args, fields)
+        if n > self.burst and (n - self.burst) % self.sample: return
+        if not self.log.isEnabledFor(level): return
+        text = msg.format(*args, **fields) if args or fields else msg
+        if n == self.burst and self.sample > 1:
+            text += " (further messages from {k} sampled 1 in {s})".format(k=key, s=self.sample)
+        self.log.log(level, text, stacklevel=3)
+
+    def reset(self):
+        ''' Forgets the calls so far, every site gets a new burst '''
+        self.calls = {}
+
+    def held_back(self):
+        ''' {site: calls not logged} '''
+        held = {}
+        for key, n in self.calls.items():
+            logged = min(n, self.burst) + (n - self.burst)//self.sample if n > self.burst else n
+            if n > logged: held[key] = n - logged
+        return held
+
+    def summary(self):
+        ''' Logs how many messages each site held back, and flushes the sink '''
+        for key, n in sorted(self.held_back().items()):
+            self.log.info("    {n} messages from {k} not logged ({c} calls)".format(n=n, k=key, c=self.calls[key]))
+        if self.sink: self.sink.flush()
+
+loggers = {}     # TbLogger per logger object
+
+def tb_logger(dut_or_log):
+    ''' The TbLogger of a dut (its _log) or of a logger, shared by all callers '''
+    log = dut_or_log if isinstance(dut_or_log, logging.Logger) else dut_or_log._log
+    if log not in loggers:
+        loggers[log] = TbLogger(log)
+    return loggers[log]
+
+def main():
+    parser = argparse.ArgumentParser(description="Pretty-print a TB_LOG_SINK event file")
+    parser.add_argument('events', help="JSON lines file")
+    parser.add_argument('--site', help="only sites containing this text")
+    parser.add_argument('--level', default='DEBUG', help="lowest level shown")
+    parser.add_argument('--all', action='store_true', help="print the events, not only the per site counts")
+    args = parser.parse_args()
+
+    lowest = logging.getLevelName(args.level.upper())
+    counts = {}
+    with open(args.events) as f:
+        for line in f:
+            event = json.loads(line)
+            if args.site and args.site not in event['site']: continue
+            if logging.getLevelName(event['level']) < lowest: continue
+            counts[event['site']] = counts.get(event['site'], 0) + 1
+            if args.all:
+                text = event['msg'].format(*event['args'], **event['fields']) if event['args'] or event['fields'] else event['msg']
+                print("{t:>14.2f}ns {l:<7} {s:<24} {m}".format(t=event['t'], l=event['level'], s=event['site'], m=text))
+    print("{s:<32} {n:>10}".format(s='site', n='events'))
+    for site, n in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+        print("{s:<32} {n:>10}".format(s=site, n=n))
+
+if __name__ == '__main__':
+    main()
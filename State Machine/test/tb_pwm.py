@@ -20,223 +20,63 @@ tb_pwm.py V4.1 : Testbench for PWM module with fault injection.
           duty_cycle   : in std_logic_vector(7 downto 0);
           dir, en      : out std_logic);
     end entity pulse_width_modulator;
+
+  Monitoring modes (select with the environment variable TB_MONITOR):
+    live  : (default) one coroutine per check, errors reported as they occur
+    trace : one EdgeRecorder logs all edges, checks run as vectorized
+            NumPy passes when check() is called (end of test / per FIAT step)
+  The monitors and the error queue are in pwm_agent.py, shared with tb_system.
+  Set TB_ERROR_EXPORT to a .json or .csv file name to export the reported errors.
+  The trace checks also run on a finished GHW dump: python ghw_check.py --help
+  Set TB_PROFILE=1 to log per-coroutine wakeups and CPU time (see profiling.py).
+  Set TB_COVERAGE to a .json file name to collect functional coverage of the pwm
+  states, arcs and duty bins, and steer the random duties toward empty bins
+  (see functional_coverage.py).
+  Per-period log lines are rate limited per call site, TB_LOG_SINK keeps them
+  all as JSON lines (see tb_log.py).
+  Set TB_CAPTURE to an .npz file name to keep only en, dir, duty_cycle and reset
+  around each error and FIAT step (see capture.py).
+  Set TB_SCENARIOS=default (or a .json queue) to run duty sweeps and single fault
+  injections as separate scenarios in one launch instead (see session.py).
 '''
 import cocotb
 from cocotb import start_soon
-from cocotb.clock import Clock
 from cocotb.handle import Force, Freeze, Release
-from cocotb.triggers import ClockCycles, Edge, First, FallingEdge, RisingEdge
-from cocotb.triggers import ReadOnly, ReadWrite, Timer, with_timeout  
+from cocotb.triggers import ClockCycles, RisingEdge, Timer
 from cocotb.utils import get_sim_time
-from cocotb.result import SimTimeoutError
-from cocotb.queue import Queue 
 
+import os
 import random
-import numpy as np
-
-# Conversion to pico-seconds made easy
-ps_conv = {'fs': 0.001, 'ps': 1, 'ns': 1000, 'us': 1e6, 'ms':1e9}
-
-#design constants
-PERIOD_NS = 10
-PWM_TIMEOUT_MS = 12
-TOO_FAST_PWM_US= 143
 
-#check_types
-RESET_TYPE = "Reset"
-SHORT_CIRCUIT_TYPE = "Short circuit"
-TIMEOUT_TYPE = "Timeout"
-DIRECTION_TYPE = "Direction"
-DUTY_CYCLE_TYPE = "Duty cycle"
-REPORT_ERROR = "Report error"
-
-class MessageQueue(Queue):
-    ''' Message queue is used to store and pass assertion errors with text and traceback'''
-    # colouring \033[...m  see https://stackabuse.com/how-to-print-colored-text-in-python/
-    
-    def clear(self):
-        for i in range(self.qsize()): self.get_nowait()
-            
-    def put_message(self, error_type, message):
-        msg = (error_type, get_sim_time('ns'), message)
-        self.put_nowait(msg)
+from capture import make_capture
+from clock_control import ClockController
+from functional_coverage import PwmCoverage, report
+from profiling import profile, profiler
+from pwm_agent import DIRECTION_TYPE, DUTY_CYCLE_TYPE, REPORT_ERROR, RESET_TYPE, SHORT_CIRCUIT_TYPE, TIMEOUT_TYPE
+from pwm_agent import PERIOD_NS, PWM_TIMEOUT_MS, MessageQueue, make_monitor
+from session import SESSION, register
+from tb_log import tb_logger
 
-    def check_queue(self, dut):
-        ''' Checks that the message queue generated by assertion errors is empty'''    
-        if self.empty():
-            dut._log.info("\033[1;32m No errors in found!\x1b[0m")
-        else:
-            while not self.empty(): 
-                msg = self.get_nowait()
-                dut._log.info(
-                    "\033[1;31mError found: {error_type}\033[0m\033[1m @{time}ns\033[0m \n{exception}".format(
-                    error_type = msg[0],
-                    time = msg[1],
-                    exception = str(msg[2]).split('\n')[0])) #Print only first line    
-            raise msg[2]  # Provide traceback for the last error reported 
+ERROR_EXPORT = os.environ.get("TB_ERROR_EXPORT")   # .json or .csv file for the reported errors
+COVERAGE_FILE = os.environ.get("TB_COVERAGE")      # .json file for the functional coverage counters
 
-    def find_error(self, dut, error_type):
-        ''' Searches for a specific error in the queue and tosses the rest'''
-        if self.empty():
-            raise AssertionError("NO_QUEUE")
-        while (self.qsize() > 0):    
-            msg = self.get_nowait()
-            if msg[0] == error_type:
-                dut._log.info(
-                    "    Found error: {error_type} @ {time}ns... ".format(
-                        error_type = msg[0],
-                        time = msg[1])) 
-                self.clear()
-                return
-        #raise only if none of the queued messages are of the correct type 
-        raise AssertionError("{err} error sought, but not found!".format(err=error_type))
+def make_coverage(dut):
+    ''' Starts a PwmCoverage on the pwm ports, or returns None when TB_COVERAGE is not set '''
+    if not COVERAGE_FILE: return None
+    coverage = PwmCoverage(PERIOD_NS, len(dut.duty_cycle), get_sim_time('ps'))
+    coverage.start(dut.duty_cycle, dut.reset, dut.en)
+    return coverage
 
-class SignalEventMonitor():
-    """ Tracks a signal's last events.  """
-    def __init__(self, signal):
-        self.signal = signal
-        self.last_event = get_sim_time('ps')
-        self.last_rise = self.last_event
-        self.last_fall = self.last_event
-        start_soon(self.update())
-      
-    async def update(self):
-        while True:
-            await Edge(self.signal)
-            await ReadOnly()          # ReadOnly allows edge-edge measurment
-            self.last_event = get_sim_time('ps')
-            if self.signal == 1: self.last_rise = self.last_event
-            else: self.last_fall = self.last_event
-            
-    def stable_interval(self, units='ps'):
-        last_event_c = self.last_event/ps_conv[units]  # convert last_event to the prefix in use
-        stable = get_sim_time(units) - last_event_c    # calculate stable interval
-        return stable
-  
-class Monitor:
-    """ Contains and run all checks for signals in and out of DUT """
-    def __init__(self, dut, messages):
-        self.dut = dut
-        self.messages = messages
-        start_soon(self.run())
-        
-    async def run(self):
-        ''' start all checks '''
-        await Timer(1, 'ns')   # Settle uninitialized values
-        self.dut._log.info("Starting monitoring events")
-        self.en_mon  = SignalEventMonitor(self.dut.en)
-        self.duty_mon = SignalEventMonitor(self.dut.duty_cycle)
-        self.reset_mon = SignalEventMonitor(self.dut.reset)
-        start_soon(self.check_reset())
-        start_soon(self.check_short_circuit())
-        start_soon(self.check_timeout())
-        start_soon(self.check_direction())
-        start_soon(self.check_duty_cycle())    
-    
-    async def check_reset(self):
-        ''' Checks that PWM pulse (en) is deasserted when reset is applied '''
-        while True:
-            await FallingEdge(self.dut.reset) 
-            try: assert self.dut.en.value == 0, "PWM enable has not been deasserted during reset"
-            except AssertionError as e:
-                self.messages.put_message(RESET_TYPE, e)
-            self.dut._log.info("Completed: Reset test")
-
-    async def check_short_circuit(self):
-        ''' Checks that we are not short-circuiting the half-bridge by switching direction while pulsing '''
-        while True:
-            await Edge(self.dut.dir)
-            try: 
-                if self.dut.reset.value == 0:
-                    assert self.dut.en.value == 0, "HALF-BRIDGE SHORT CIRCUITED: en active when changing direction"
-                    assert self.en_mon.stable_interval('ns') > PERIOD_NS-1, (
-                        "SHORT CIRCUIT DANGER: en deactivated less than one cycle before dir change")
-                    wait_task = Timer(PERIOD_NS-1, 'ns')
-                    event_task = Edge(self.dut.en)
-                    result = await First(wait_task, event_task)
-                    assert result == wait_task, (
-                      "SHORT CICUIT DANGER: En was not stable for {per} {uni}"
-                      .format(per=PERIOD_NS, uni='ns'))
-            except AssertionError as e:
-                self.messages.put_message(SHORT_CIRCUIT_TYPE, e)
-
-    async def check_timeout(self):
-        ''' Checks that the PWM signal is actually driven within a reasonable timeframe'''
-        while True:
-            if self.dut.duty_cycle.value == 0 : 
-                await Edge(self.dut.duty_cycle)
-            try:
-                await with_timeout(Edge(self.dut.en), PWM_TIMEOUT_MS, 'ms')
-            except SimTimeoutError:
-                self.messages.put_message(TIMEOUT_TYPE, "PWM signal is static, TB timed out ")
-                
-    async def check_direction(self):
-        ''' Checks that the pwm drives the motor in the correct direction'''
-        while True:    
-            await Edge(self.dut.duty_cycle) 
-            await ClockCycles(self.dut.mclk, 2)   # Trigger two clock edges after duty cycle was changed
-            await ReadOnly()                      # Wait for all signals to settle (all delta delays)
-            try:
-                duty = int(self.dut.duty_cycle.value.signed_integer) # Numpy compatibility 
-                if np.int8(duty) > 0: 
-                    assert self.dut.dir.value == 1, (
-                      "DIR is not '1' within 2 clock cycles of positive duty cycle: {DU} = {D}"
-                      .format(DU=np.int8(duty), D=self.dut.duty_cycle.value))
-                if np.int8(duty) < 0:  
-                    assert self.dut.dir.value == 0, (
-                      "DIR is not '0' within 2 clock cycles of negative duty cycle: {DU} = {D}"
-                      .format(DU=np.int8(duty), D=self.dut.duty_cycle.value))
-            except AssertionError as e:
-                self.messages.put_message(DIRECTION_TYPE, e)
-                
-    async def check_duty_cycle(self):
-        ''' Checks that pwm pulses are not happening too fast for the PMOD module '''
-        await RisingEdge(self.dut.en)
-        while True:
-            # Wait until we have a full period after reset
-            if self.dut.reset.value == 1: 
-                 await FallingEdge(self.dut.reset)
-                 await RisingEdge(self.dut.en)
-            await RisingEdge(self.dut.en)
-            
-            # Find the interval/period
-            start = self.en_mon.last_rise/ps_conv['us']
-            interval =  get_sim_time('us') - start
-            
-            try:
-                # Trigger only when duty cycle has been stable for the last period
-                if self.duty_mon.stable_interval('us') > interval:  
-                    assert interval > TOO_FAST_PWM_US, (
-                      "PWM period too short!: {iv:.2f}us, f={f:.3f}kHz   Minimum period: {per} us, ({maxf:.2f}kHz) "
-                      .format(iv=interval, f=(1000/interval), per=TOO_FAST_PWM_US, maxf=(1000/TOO_FAST_PWM_US))) 
-                      
-                    # Calculate duty cycle   
-                    mid = self.en_mon.last_fall/ps_conv['us']
-                    high = mid-start
-                    measured_duty = np.int8((high*100)/interval)
-                    set_duty = np.int8(self.dut.duty_cycle.value.signed_integer)*100/128
-                    
-                    # Report duty cycle and check correspondens betweem input and output
-                    sign = "-" if self.dut.dir.value == 0 else " "
-                    self.dut._log.info(
-                      "Duty cycles: Set dc: {S:.1f}%, Measured dc: {Sig}{M:.1f}%, period = {P:.1f}us, f = {F:.2f}kHz"
-                      .format(S=set_duty, Sig = sign, M = measured_duty, P = interval, F = 1000/interval)) 
-                    abs_duty = abs(set_duty)
-                    deviation = np.int8(abs(abs_duty - measured_duty))
-                    assert deviation < 5, (                         
-                      "Set and measured duty cycle deviates by more than 5% ({D}%) "
-                      .format(D=deviation))
-            except AssertionError as e:
-                self.messages.put_message(DUTY_CYCLE_TYPE, e)
-      
 class StimuliGenerator():
-    ''' Generates all stimuli used in the ordinary tests '''
-    def __init__(self, dut):
+    ''' Generates all stimuli used in the ordinary tests.
+        With a PwmCoverage, random duties are picked from the least covered bins. '''
+    def __init__(self, dut, coverage=None):
         self.dut = dut
+        self.coverage = coverage
         self.dut._log.info("Starting clock")
-        start_soon(Clock(self.dut.mclk, PERIOD_NS, 'ns').start())
+        self.clock = ClockController(self.dut.mclk, PERIOD_NS)
         self.dut.duty_cycle.value = 0
-        start_soon(self.reset_module())
+        start_soon(profile(self.reset_module()))
 
     async def reset_module(self):
         self.dut._log.info("Resetting module... ")
@@ -257,8 +97,13 @@ class StimuliGenerator():
         await self.random_duties(3)
         self.dut._log.info("Random duty tests 2/2 complete ")
     
+    @staticmethod
+    def duty_value(duty_cycle):
+        ''' duty_cycle port value for a duty cycle in percent '''
+        return int((duty_cycle*128)/100)
+
     def set_duty(self, duty_cycle):
-        self.dut.duty_cycle.value= int((duty_cycle*128)/100) 
+        self.dut.duty_cycle.value= self.duty_value(duty_cycle) 
     
     async def fixed_duty_tests(self):
         self.set_duty(50)
@@ -271,7 +116,8 @@ class StimuliGenerator():
     async def random_duties(self, tests):    
         duties = list(range(-90+1,-10)) + list(range(10+1,90))
         for x in range(tests):
-            random_duty = random.choice(duties)
+            candidates = self.coverage.steer(duties, self.duty_value) if self.coverage else duties
+            random_duty = random.choice(candidates)
             duties.remove(random_duty)
             self.set_duty(random_duty)
             for i in range(2): 
@@ -279,58 +125,100 @@ class StimuliGenerator():
         interval = random.randint(1,300)
         await Timer(interval, units='us')
 
-@cocotb.test()
+    async def duty_sweep(self, duties, pulses=2):
+        ''' Applies each (nonzero) duty cycle in percent for a number of en pulses '''
+        for duty in duties:
+            self.set_duty(duty)
+            for i in range(pulses):
+                await RisingEdge(self.dut.en)
+
+def capture_pwm(dut, messages, test):
+    ''' WaveCapture of the pwm ports around every error, or None when TB_CAPTURE is not set '''
+    capture = make_capture({'en': dut.en, 'dir': dut.dir, 'duty_cycle': dut.duty_cycle, 'reset': dut.reset},
+                           test, signed=('duty_cycle',))
+    if capture: capture.watch(messages)
+    return capture
+
+@cocotb.test(skip=SESSION)
 async def test_sequencer(dut):
     ''' Starts monitoring tasks and stimuli generators '''
+    profiler.start()
     messages = MessageQueue()
-    stimuli = StimuliGenerator(dut)
-    monitor = Monitor(dut, messages)
+    coverage = make_coverage(dut)
+    stimuli = StimuliGenerator(dut, coverage)
+    monitor = make_monitor(dut, messages)
+    capture = capture_pwm(dut, messages, 'test_sequencer')
     dut._log.info("*** STARTING ORDINARY TESTS ***")
-    await stimuli.run()  
+    await profile(stimuli.run())
+    monitor.check()
+    profiler.report(dut)
+    if capture: capture.save()
+    if coverage:
+        coverage.save(COVERAGE_FILE)
+        dut._log.info("\n".join(report(coverage.counts)))
+    if ERROR_EXPORT: messages.export(ERROR_EXPORT)
+    tb_logger(dut).summary()
     messages.check_queue(dut)
     dut._log.info("*** ORDINARY TESTS DONE! ***")
 
 # run after test_sequencer when using GHDL 4.0.0dev due to release not working
-@cocotb.test()
+@cocotb.test(skip=SESSION)
 async def fiat_sequencer(dut):
     ''' Starts monitoring tasks and stimuli generators '''
+    profiler.start()
     messages = MessageQueue()
-    fiatMonitor = Monitor(dut, messages)
+    fiatMonitor = make_monitor(dut, messages)
     fiatStimuli = StimuliGenerator(dut)
-    fiat = FaultInjector(dut, messages)  
+    capture = capture_pwm(dut, messages, 'fiat_sequencer')
+    fiat = FaultInjector(dut, messages, fiatMonitor, fiatStimuli.clock, capture)  
     
     # Inject Faults to check that the testbench responds to faults
-    await fiat.run()
+    await profile(fiat.run())
+    profiler.report(dut)
+    tb_logger(dut).summary()
+    if capture: capture.save()
     
 class FaultInjector():
     """ Contain tests to verify that each assertion will trigger """
-    def __init__(self, dut, messages):
+    # To test ordinary reporting: change <fault>_TYPE to REPORT_ERROR in the list
+    FAULTS = [
+        ('reset', RESET_TYPE),
+        ('short_1', SHORT_CIRCUIT_TYPE),
+        ('short_2', SHORT_CIRCUIT_TYPE),
+        ('short_3', SHORT_CIRCUIT_TYPE),
+        ('direction', DIRECTION_TYPE),
+        ('timeout', TIMEOUT_TYPE),
+        ('too_fast_pwm', DUTY_CYCLE_TYPE),
+        ('duty', DUTY_CYCLE_TYPE)]
+
+    def __init__(self, dut, messages, monitor, clock, capture=None):
         self.dut = dut
         self.messages = messages
+        self.monitor = monitor
+        self.clock = clock
+        self.capture = capture
         
     async def run(self):
         ''' run all FIAT tests '''
         self.dut._log.info("*** FAULT INJECTION RUNNING ***")
         
-        # To test ordinary reporting: change <fault>_TYPE to REPORT_ERROR in the list
-        fiat_methods = [  
-            (self.reset(), RESET_TYPE), 
-            (self.short_1(), SHORT_CIRCUIT_TYPE),
-            (self.short_2(), SHORT_CIRCUIT_TYPE),
-            (self.short_3(), SHORT_CIRCUIT_TYPE),
-            (self.direction(), DIRECTION_TYPE),
-            #Timeout can be omitted for demonstration purposes 
-            #self.timeout(), TIMEOUT_TYPE),  
-            (self.too_fast_pwm(), DUTY_CYCLE_TYPE),
-            (self.duty(), DUTY_CYCLE_TYPE)]
-        for each in fiat_methods: 
-            await each[0]   
-            if each[1] != REPORT_ERROR: 
-                self.messages.find_error(self.dut, each[1])
-            else: 
-                self.messages.check_queue(self.dut) 
+        for fault, error_type in self.FAULTS:
+            await self.inject(fault, error_type)
         self.dut._log.info("\x1b[1;32m Injected faults managed! \x1b[0m")
         self.dut._log.info("*** FAULT INJECTION COMPLETE ***")
+
+    async def inject(self, fault, error_type):
+        ''' Runs one FIAT method and checks that an error of its type was reported during it.
+            Errors of other types in the same window are not checked. '''
+        start = get_sim_time('ns')
+        window = self.capture.open() if self.capture else None
+        await profile(getattr(self, fault)())
+        if window: self.capture.close(window)
+        self.monitor.check()
+        if error_type != REPORT_ERROR: 
+            self.messages.find_error(self.dut, error_type, start, get_sim_time('ns'))
+        else: 
+            self.messages.check_queue(self.dut, start, get_sim_time('ns')) 
         
     def release(self):  
         ''' Releases all Forced values. '''
@@ -392,13 +280,11 @@ class FaultInjector():
         
     async def timeout(self):
         ''' Prevents pulsing although a nonzero duty cycle'''
-        self.dut._log.info("Injecting error: Timout -- this may take minutes...")
+        self.dut._log.info("Injecting error: Timout (clock paused while the DUT is held static)")
         await self.disable_reset()
         self.dut.duty_cycle.value = Force(0x50)
-        # Stopping clock might be useful to reduce time spent here.
-        # Requires a pointer/handle to the process. 
         self.dut.en.value = Force(0)
-        await Timer(PWM_TIMEOUT_MS+1, 'ms')
+        await self.clock.hold(PWM_TIMEOUT_MS+1, 'ms')
         self.release()
         
     async def direction(self):
@@ -436,4 +322,30 @@ class FaultInjector():
             await ClockCycles(self.dut.mclk, 8001)
             self.dut.en.value = Force(0);
             await ClockCycles(self.dut.mclk, 8001)
-        self.release()
\ No newline at end of file
+        self.release()
+
+# Scenario session (TB_SCENARIOS, see session.py): duty sweeps and single fault
+# injections back to back, each after a reset with its own monitor and error queue
+SESSION_SCENARIOS = [
+    {'kind': 'duties', 'name': 'half', 'duties': [50, -50]},
+    {'kind': 'duties', 'name': 'extremes', 'duties': [89, -89, 11, -11]},
+    {'kind': 'duties', 'name': 'reversals', 'duties': [30, -30, 30, -30], 'pulses': 1},
+] + [{'kind': 'fault', 'name': fault, 'fault': fault} for fault, _ in FaultInjector.FAULTS]
+
+async def duties_scenario(dut, duties, pulses=2):
+    messages = MessageQueue()
+    stimuli = StimuliGenerator(dut)
+    monitor = make_monitor(dut, messages)
+    await Timer(20, 'ns')
+    await profile(stimuli.duty_sweep(duties, pulses))
+    monitor.check()
+    messages.check_queue(dut)
+
+async def fault_scenario(dut, fault):
+    messages = MessageQueue()
+    monitor = make_monitor(dut, messages)
+    stimuli = StimuliGenerator(dut)
+    await Timer(20, 'ns')
+    await FaultInjector(dut, messages, monitor, stimuli.clock).inject(fault, dict(FaultInjector.FAULTS)[fault])
+
+register(globals(), {'duties': duties_scenario, 'fault': fault_scenario}, SESSION_SCENARIOS)
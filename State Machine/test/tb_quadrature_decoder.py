@@ -1,7 +1,22 @@
-import cocotb 
+import cocotb
 from cocotb import start_soon
 from cocotb.clock import Clock
 from cocotb.triggers import *
+from cocotb.utils import get_sim_time
+
+import numpy as np
+
+import golden_model
+from profiling import profile, profiler
+from quadrature import QuadratureDriver, quadrature_plan, rotations_plan
+from scoreboard import PulseScoreboard
+from session import SESSION, register
+from stimulus import CyclePlan
+
+PERIOD_NS = 10
+
+# Encoder inputs of quadrature_decoder
+ENCODER = ('sa', 'sb')
 
 async def reset_dut(dut):
     await FallingEdge(dut.mclk)
@@ -9,46 +24,79 @@ async def reset_dut(dut):
     await RisingEdge(dut.mclk)
     dut.reset.value = 0
 
-@cocotb.test()
+def rotation_plan(start):
+    ''' 100 forward rotations with 2 cycle steps, then a few steps ending in an
+        illegal 10 -> 01 jump. start is the edge index where stimuli begin. '''
+    steps = start + 5 + 2*np.arange(4*100)
+    last = steps[-1]
+    cycles = np.concatenate((steps, last + 2*np.arange(1, 5)))
+    sa = np.concatenate((np.tile([0, 0, 1, 1], 100), [0, 1, 1, 0]))
+    sb = np.concatenate((np.tile([0, 1, 1, 0], 100), [1, 1, 0, 1]))
+    return CyclePlan(cycles, cycles[-1] + 20000, sa=sa, sb=sb)
+
+def random_plan(start, rng, steps=2000):
+    ''' Random walk: runs of 1 to 40 steps in one direction, 1 to 8 cycles apart with
+        jitter, and about one illegal jump every 100 steps '''
+    runs = rng.integers(1, 41, steps)
+    direction = np.repeat(rng.choice([-1, 1], steps), runs)[:steps]
+    illegal = np.flatnonzero(rng.random(steps) < 0.01)
+    return quadrature_plan(start + 3, steps, rng.integers(1, 9, steps), direction, jitter=1,
+                           illegal=illegal, rng=rng, tail=100, names=ENCODER)
+
+async def run_plan(dut, plan):
+    ''' Resets the decoder, drives plan from the release and checks the pulses against the golden model '''
+    dut.sa.value = 0
+    dut.sb.value = 0
+    await reset_dut(dut)
+    now = round(get_sim_time('ns')/PERIOD_NS)   # edge index of the reset release
+    plan = plan(now)
+    scoreboard = PulseScoreboard(dut, dut.pos_inc, dut.pos_dec, PERIOD_NS)
+    await profile(QuadratureDriver(dut, ENCODER, PERIOD_NS).drive(plan))
+    profiler.report(dut)
+
+    inc, dec = golden_model.decode_quadrature(
+        plan.sampled(), plan.values['sa'], plan.values['sb'], now + 1, sync_stages=0)
+    scoreboard.check(inc, dec)
+
+@cocotb.test(skip=SESSION)
 async def test(dut):
     dut._log.info("Hello!")
+    profiler.start()
 
-    start_soon(Clock(dut.mclk, 10, units="ns").start())
-    await reset_dut(dut)
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    await run_plan(dut, rotation_plan)
 
-    await ClockCycles(dut.mclk, 5)
-    for i in range(100): 
-        dut.sa.value = 0
-        dut.sb.value = 0
-        await ClockCycles(dut.mclk, 2)
-        dut._log.info("11111111111111")
-        dut.sa.value = 0
-        dut.sb.value = 1
-        await ClockCycles(dut.mclk, 2)
-        dut._log.info("222222222222222222222")
-        dut.sa.value = 1
-        dut.sb.value = 1
-        await ClockCycles(dut.mclk, 2)
-        dut._log.info("3333333333333333")
-        dut.sa.value = 1
-        dut.sb.value = 0
-        await ClockCycles(dut.mclk, 2)
+    dut._log.info("End")
 
-    dut.sa.value = 0
-    dut.sb.value = 1
-    await ClockCycles(dut.mclk, 2)
+@cocotb.test(skip=SESSION)
+async def random_walk_test(dut):
+    ''' Random direction changes, step rates, jitter and illegal jumps '''
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    rng = np.random.default_rng(cocotb.RANDOM_SEED)
+    await run_plan(dut, lambda now: random_plan(now, rng))
 
-    dut.sa.value = 1
-    dut.sb.value = 1
-    await ClockCycles(dut.mclk, 2)
+# Scenario session (TB_SCENARIOS, see session.py): short encoder profiles back to back
+SESSION_SCENARIOS = [
+    {'kind': 'rotations', 'name': 'forward', 'rotations': 25},
+    {'kind': 'rotations', 'name': 'reverse', 'rotations': 25, 'direction': -1},
+    # One step per cycle: pos_inc stays high for 100 back-to-back pulses
+    {'kind': 'rotations', 'name': 'every_cycle', 'rotations': 25, 'step_cycles': 1},
+    {'kind': 'rotations', 'name': 'illegal', 'rotations': 25, 'step_cycles': 3, 'jitter': 1, 'illegal': 10},
+    {'kind': 'random', 'name': 'random_walk', 'steps': 500},
+]
 
-    dut.sa.value = 1
-    dut.sb.value = 0
-    await ClockCycles(dut.mclk, 2)
+def scenario_rng(seed):
+    return np.random.default_rng(cocotb.RANDOM_SEED if seed is None else seed)
 
-    dut.sa.value = 0
-    dut.sb.value = 1
-    await ClockCycles(dut.mclk, 20000)
+async def rotations_scenario(dut, seed=None, **options):
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    rng = scenario_rng(seed)
+    await run_plan(dut, lambda now: rotations_plan(now + 3, rng, tail=10, names=ENCODER, **options))
 
-    dut._log.info("End")
+async def random_scenario(dut, steps=2000, seed=None):
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    rng = scenario_rng(seed)
+    await run_plan(dut, lambda now: random_plan(now, rng, steps))
 
+register(globals(), {'rotations': rotations_scenario, 'random': random_scenario}, SESSION_SCENARIOS)
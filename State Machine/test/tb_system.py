@@ -1,50 +1,406 @@
 import cocotb
 from cocotb import start_soon
 from cocotb.clock import Clock
-from cocotb.triggers import * 
-      
+from cocotb.triggers import *
+from cocotb.utils import get_sim_time
+
+import os
+import time
+import numpy as np
+
+import cycle_model
+import golden_model
+import rom_tool
+from capture import make_capture
+from cycle_model import ROM_ENTRIES, ROM_FILE, rom_values
+from edge_trace import EdgeRecorder, read_value
+from encoder_capture import EncoderCapture, StreamDecoder, replay
+from scoreboard import PulseScoreboard, Seg7Monitor, VelocityScoreboard
+from motor_plant import MAX_RPM, MotorPlant
+from profiling import profile, profiler
+from pwm_agent import MessageQueue, TraceMonitor
+from quadrature import QuadratureDriver, quadrature_plan, rotations_plan, rpm_cycles, rpm_profile_plan
+from session import SESSION, register
+from stimulus import CyclePlan, drive_cycles, drive_timed, with_reset
+from time_scale import TimeScale
+
+PERIOD_NS = 10
+
+# Encoder inputs of top_level_system, and its pwm ports that are not named as in pulse_width_modulator
+ENCODER = ('SA', 'SB')
+PWM_NAMES = {'en': 'en_out', 'dir': 'dir_out'}
+
+# RPM test: encoder steps of the speed profile and illegal transitions among them
+RPM_STEPS = int(os.environ.get('RPM_STEPS', 600))
+RPM_ILLEGAL = int(os.environ.get('RPM_ILLEGAL', 5))
+
+# Scale of the slow counters (TIME_SCALE, the makefile passes the matching generics)
+scale = TimeScale()
+
+# Wall clock seconds spent driving main_plan, per driver
+wall_times = {}
+
+# Differential test: windows of a cycle_model exploration profile replayed in GHDL
+DIFF_SEED = int(os.environ.get('DIFF_SEED', 1))
+DIFF_PROFILE = int(os.environ.get('DIFF_PROFILE', 0))
+DIFF_CYCLES = int(os.environ.get('DIFF_CYCLES', 1_000_000))
+DIFF_WINDOWS = int(os.environ.get('DIFF_WINDOWS', 3))
+DIFF_WINDOW = int(os.environ.get('DIFF_WINDOW', 20*scale.ten_ms_count))
+DIFF_RELEASE = 3             # edges of reset at the start of each window
+DIFF_SIGNALS = ('pos_inc_int', 'pos_dec_int', 'velocity_internal', 'c', 'abcdefg', 'duty_cycle', 'dir_out', 'en_out')
+
+# Replay test: recorded encoder capture (.npy or .csv, see encoder_capture.py) driven into SA/SB
+ENCODER_CAPTURE = os.environ.get('ENCODER_CAPTURE')
+ENCODER_CAPTURE_UNIT = os.environ.get('ENCODER_CAPTURE_UNIT', 'ps')       # time unit of a .csv capture
+ENCODER_RESAMPLE = bool(int(os.environ.get('ENCODER_RESAMPLE', 0)))      # move changes to mid-cycle
+
 async def reset_dut(dut):
     await FallingEdge(dut.mclk)
     dut.reset.value = 1
     await RisingEdge(dut.mclk)
     dut.reset.value = 0
 
-@cocotb.test()
+def main_plan(start):
+    ''' The hand written sequence: reset, 100 rotations, one step back and an idle tail.
+        start is the edge index where the clock was started. '''
+    released = start + 1    # reset is deasserted after this edge
+    # Rotations every 84 cycles, steps 11 cycles apart, then one step back and one forward 1001 cycles apart
+    step_cycles = np.concatenate((np.tile([51, 11, 11, 11], 100), [1001, 1001]))
+    direction = np.concatenate((np.ones(400, dtype=np.int64), [-1, 1]))
+    return with_reset(quadrature_plan(released + 1000, len(step_cycles), step_cycles, direction,
+                                      tail=35000, names=ENCODER), start)
+
+def rpm_plan(start, rng):
+    ''' Full speed forward slowing down to 20 rpm, then reverse up to full speed, with
+        jitter and a few illegal transitions. Speeds are real rpm, scaled with TIME_SCALE. '''
+    rpm = np.concatenate((np.linspace(MAX_RPM, 20, RPM_STEPS//2), -np.linspace(20, MAX_RPM, RPM_STEPS//2)))
+    illegal = rng.choice(len(rpm), RPM_ILLEGAL, replace=False)
+    return with_reset(quadrature_plan(start + 1, len(rpm), rpm_cycles(rpm, PERIOD_NS*scale.factor), np.sign(rpm),
+                                      jitter=2, illegal=illegal, rng=rng, tail=2*scale.ten_ms_count,
+                                      names=ENCODER), start)
+
+def velocity_scoreboard(dut, plan, first_edge, capture=None):
+    ''' Computes the expected velocity for the whole plan and starts a scoreboard '''
+    ticks, velocity = expected_velocity(plan, first_edge)
+    return VelocityScoreboard(dut, dut.velocity_internal, ticks, velocity, PERIOD_NS,
+                              trigger=capture.trigger if capture else None)
+
+def seg7_monitor(dut):
+    ''' Seven-segment monitor sampling once per displayed digit '''
+    return Seg7Monitor(dut, dut.c, dut.abcdefg, scale.seg7_count, PERIOD_NS)
+
+def pwm_monitor(dut, messages):
+    ''' tb_pwm's checks on en_out/dir_out, as vectorized passes over one recording.
+        Only pwm_checks_test runs them, see there why. '''
+    return TraceMonitor(dut, messages, PWM_NAMES)
+
+def capture_system(dut, test):
+    ''' WaveCapture of the encoder and motor outputs, or None when TB_CAPTURE is not set '''
+    signals = {name: getattr(dut, name) for name in
+               ('reset', 'pos_inc_int', 'pos_dec_int', 'velocity_internal', 'en_out', 'dir_out')}
+    return make_capture(signals, test, signed=('velocity_internal',))
+
+def expected_velocity(plan, first_edge):
+    ''' Golden model velocity after each tick of a plan '''
+    inc, dec = golden_model.decode_quadrature(
+        plan.sampled(), plan.values['SA'], plan.values['SB'], first_edge)
+    n_ticks = golden_model.tick_count(first_edge, plan.end, scale.ten_ms_count)
+    return golden_model.velocity_reader(inc, dec, first_edge, n_ticks, scale.ten_ms_count)
+
+def first_edge(plan):
+    ''' The first edge where reset is deasserted '''
+    return int(plan.cycles[1]) + 1
+
+@cocotb.test(skip=SESSION)
 async def main_test(dut):
+    ''' Runs the main plan with the time-warp driver '''
     dut._log.info("Starting testing...")
-    start_soon(Clock(dut.mclk, 10, units="ns").start())
-    await reset_dut(dut)
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
 
-    await ClockCycles(dut.mclk, 1000)
-
-    for _ in range(100):
-        await ClockCycles(dut.mclk, 50)
-        await RisingEdge(dut.mclk)
-        dut.SA.value = 0
-        dut.SB.value = 1
-        await ClockCycles(dut.mclk, 10)
-        await RisingEdge(dut.mclk)
-        dut.SA.value = 1
-        dut.SB.value = 1
-        await ClockCycles(dut.mclk, 10)
-        await RisingEdge(dut.mclk)
-        dut.SA.value = 1
-        dut.SB.value = 0
-        await ClockCycles(dut.mclk, 10)
-        await RisingEdge(dut.mclk)
-        dut.SA.value = 0
-        dut.SB.value = 0
-    
-    await ClockCycles(dut.mclk, 1000)
-    await RisingEdge(dut.mclk)
-    dut.SA.value = 1
-    dut.SB.value = 0
-    await ClockCycles(dut.mclk, 1000)
-    await RisingEdge(dut.mclk)
-    dut.SA.value = 0
-    dut.SB.value = 0
+    plan = main_plan(start)
+    capture = capture_system(dut, 'main_test')
+    scoreboard = velocity_scoreboard(dut, plan, first_edge(plan), capture)
+    seg7 = seg7_monitor(dut)
+    encoder = QuadratureDriver(dut, ENCODER, PERIOD_NS)
+    wall = time.perf_counter()
+    await profile(encoder.drive(plan, reset=dut.reset))
+    wall_times['timed'] = time.perf_counter() - wall
+    seg7.stop()
+    profiler.report(dut)
+    if capture: capture.save()
 
-    await ClockCycles(dut.mclk, 35000)
-    
+    scoreboard.check()
+    seg7.check(scoreboard.tick_edges, scoreboard.expected, first_edge(plan))
     dut._log.info("Testing done. All tests passed")
 
+@cocotb.test(skip=SESSION)
+async def per_cycle_test(dut):
+    ''' Runs the same plan counting clock cycles, and reports the time-warp speedup of the driver.
+        The Clock coroutine still wakes Python every half period in both runs, so this is the
+        gain from the removed ClockCycles wakeups only, not the overall simulation speedup. '''
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    await reset_dut(dut)
+
+    plan = main_plan(start)
+    capture = capture_system(dut, 'per_cycle_test')
+    scoreboard = velocity_scoreboard(dut, plan, first_edge(plan), capture)
+    wall = time.perf_counter()
+    await profile(drive_cycles(dut.mclk, {'SA': dut.SA, 'SB': dut.SB}, plan, start + 1))
+    wall_times['cycles'] = time.perf_counter() - wall
+    profiler.report(dut)
+    if capture: capture.save()
+
+    scoreboard.check()
+    if 'timed' in wall_times:
+        dut._log.info("Stimulus driver wall time for main plan (Clock wakeups included in both): "
+                      "{c:.2f}s counting cycles, {t:.2f}s time-warped, driver speedup {s:.1f}x".format(
+            c=wall_times['cycles'], t=wall_times['timed'], s=wall_times['cycles']/wall_times['timed']))
+
+@cocotb.test(skip=(scale.factor == 1 or SESSION))
+async def self_test_sweep(dut):
+    ''' Runs the whole self-test ROM on a scaled time base (needs TIME_SCALE > 1) '''
+    dut._log.info("Self-test sweep at time scale 1/{f}".format(f=scale.factor))
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    rom = rom_values()
+    count = scale.self_test_count
+    plan = CyclePlan([start, start + 1], start + 1 + (len(rom) + 1)*count,
+                     reset=[1, 0], SA=[0, 0], SB=[0, 0])
+    capture = capture_system(dut, 'self_test_sweep')
+    scoreboard = velocity_scoreboard(dut, plan, first_edge(plan), capture)
+    recorder = EdgeRecorder({'en_out': dut.en_out, 'dir_out': dut.dir_out})
+    recorder.start()
+    seg7 = seg7_monitor(dut)
+    driver = start_soon(profile(drive_timed({'reset': dut.reset, 'SA': dut.SA, 'SB': dut.SB}, plan, PERIOD_NS)))
+
+    # Entry i is loaded at edge first_edge + (i+1)*count - 1; sample each mid-entry
+    errors = 0
+    for i, expected in enumerate(rom.tolist()):
+        sample = (first_edge(plan) + (i + 1)*count - 1 + count//2)*PERIOD_NS
+        await Timer(sample - get_sim_time('ns'), 'ns')
+        await ReadOnly()
+        measured = dut.duty_cycle.value.integer
+        if measured != expected:
+            errors += 1
+            if capture: capture.trigger()
+            dut._log.info("    ROM entry {i}: expected duty {x:08b}, measured {m:08b}".format(i=i, x=expected, m=measured))
+    await driver
+    recorder.stop()
+    seg7.stop()
+    profiler.report(dut)
+    if capture: capture.save()
+
+    # Every edge of en_out/dir_out against the expected sweep, model edge 0 is edge start
+    expected, table = rom_tool.expectations(rom, scale)
+    measured = recorded_cycles(recorder, start, len(expected['en_out']))
+    differ = rom_tool.compare(expected, measured, first_edge(plan) - start + 2, table)
+    for name, (n, k, entry) in differ.items():
+        dut._log.info("    {name}: {n} edges differ from the expected sweep, first at edge {k} (ROM entry {e})".format(
+            name=name, n=n, k=start + k, e=entry))
+
+    scoreboard.check()
+    seg7.check(scoreboard.tick_edges, scoreboard.expected, first_edge(plan))
+    assert errors == 0, "{n} self-test ROM entries differ from {f}".format(n=errors, f=ROM_FILE)
+    assert not differ, "en_out/dir_out differ from the expected self-test sweep"
+
+@cocotb.test(skip=(scale.factor == 1 or SESSION))
+async def closed_loop_test(dut):
+    ''' Runs the self-test with the motor plant driving SA/SB from en_out/dir_out (needs TIME_SCALE > 1) '''
+    dut._log.info("Closed loop self-test at time scale 1/{f}".format(f=scale.factor))
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    reset = CyclePlan([start, start + 1], start + 1 + (ROM_ENTRIES + 1)*scale.self_test_count, reset=[1, 0])
+    ticks = first_edge(reset) + scale.ten_ms_count*np.arange(
+        golden_model.tick_count(first_edge(reset), reset.end, scale.ten_ms_count), dtype=np.int64)
+    scoreboard = VelocityScoreboard(dut, dut.velocity_internal, ticks, period_ns=PERIOD_NS)
+    plant = MotorPlant(dut, dut.en_out, dut.dir_out, dut.SA, dut.SB, PERIOD_NS, scale.factor)
+    seg7 = seg7_monitor(dut)
+    wall = time.perf_counter()
+    await profile(drive_timed({'reset': dut.reset}, reset, PERIOD_NS))
+    plant.stop()
+    seg7.stop()
+    profiler.report(dut)
+
+    dut._log.info("Motor plant: {e} encoder edges, {w} wakeups, {s:.2f}s wall time".format(
+        e=len(plant.cycles), w=plant.wakeups, s=time.perf_counter() - wall))
+    _, velocity = expected_velocity(plant.plan(reset.end), first_edge(reset))
+    scoreboard.check(velocity)
+    seg7.check(ticks, velocity, first_edge(reset))
+
+@cocotb.test(skip=(scale.factor == 1 or SESSION), expect_fail=True)
+async def pwm_checks_test(dut):
+    ''' tb_pwm's checks on en_out/dir_out over the ROM entries up to the first negative duty
+        (needs TIME_SCALE > 1). Expected to fail: for a negative duty the next-state logic of
+        pwm.vhd goes REVERSE -> FORW_IDLE (cycle_model.pwm_states, rom_tool.py expect), so en
+        pulses every 3 cycles while dir toggles, which the short circuit and duty cycle checks
+        report. Kept out of the other tests so that they can pass on this known defect. '''
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    negative = np.flatnonzero(rom_tool.signed(rom_values()) < 0)
+    entries = int(negative[0]) + 1 if len(negative) else ROM_ENTRIES
+    dut._log.info("PWM checks on en_out/dir_out over {n} ROM entries".format(n=entries))
+    plan = CyclePlan([start, start + 1], start + 1 + (entries + 1)*scale.self_test_count,
+                     reset=[1, 0], SA=[0, 0], SB=[0, 0])
+    messages = MessageQueue()
+    pwm = pwm_monitor(dut, messages)
+    await profile(drive_timed({'reset': dut.reset, 'SA': dut.SA, 'SB': dut.SB}, plan, PERIOD_NS))
+    profiler.report(dut)
+
+    pwm.check()
+    messages.check_queue(dut)
+
+@cocotb.test(skip=(scale.factor == 1 or SESSION))
+async def rpm_test(dut):
+    ''' Drives an RPM profile through zero speed with jitter and illegal transitions (needs TIME_SCALE > 1) '''
+    dut._log.info("RPM profile of {n} steps at time scale 1/{f}".format(n=RPM_STEPS, f=scale.factor))
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    plan = rpm_plan(start, np.random.default_rng(cocotb.RANDOM_SEED))
+    scoreboard = velocity_scoreboard(dut, plan, first_edge(plan))
+    pulses = PulseScoreboard(dut, dut.pos_inc_int, dut.pos_dec_int, PERIOD_NS)
+    seg7 = seg7_monitor(dut)
+    encoder = QuadratureDriver(dut, ENCODER, PERIOD_NS)
+    await profile(encoder.drive(plan, reset=dut.reset))
+    seg7.stop()
+    profiler.report(dut)
+
+    pulses.check(*golden_model.decode_quadrature(plan.sampled(), plan.values['SA'], plan.values['SB'], first_edge(plan)))
+    scoreboard.check()
+    seg7.check(scoreboard.tick_edges, scoreboard.expected, first_edge(plan))
+
+def window_plan(sa, sb, origin, release):
+    ''' CyclePlan sampling sa[k], sb[k] at edge origin + k, with reset held for the first release edges '''
+    changed = np.flatnonzero((sa[1:] != sa[:-1]) | (sb[1:] != sb[:-1])) + 1
+    edges = np.union1d([0, release], changed)
+    return CyclePlan(origin - 1 + edges, origin + len(sa),
+                     reset=(edges < release).astype(np.int64), SA=sa[edges], SB=sb[edges])
+
+def recorded_cycles(recorder, origin, n):
+    ''' Recorded values mid-cycle after edges origin .. origin + n - 1 '''
+    t = (origin + np.arange(n, dtype=np.int64))*PERIOD_NS*1000 + PERIOD_NS*500
+    return {name: recorder.signal(name).value_at(t) for name in recorder.names}
+
+def seg7_counter(c, release):
+    ''' seg7ctrl's counter is not reset, recover its value at the window start from the first c toggle '''
+    count = scale.seg7_count
+    toggles = np.flatnonzero(c[release:] == 1)
+    first = int(toggles[0]) if len(toggles) else len(c) - release
+    return (count - 1 - first) % count
+
+def compare_cycles(dut, window, expected, measured, release):
+    ''' Logs the first differing edge of each signal, returns the number of differing signals '''
+    differ = 0
+    for name in DIFF_SIGNALS:
+        diff = np.flatnonzero(expected[name][release:].astype(np.int64) != measured[name][release:])
+        if len(diff):
+            differ += 1
+            k = int(diff[0]) + release
+            dut._log.info("    window at {w}, {name}: {d} edges differ, first at edge {k}: expected {x}, measured {m}".format(
+                w=window, name=name, d=len(diff), k=k, x=expected[name][k], m=measured[name][k]))
+    return differ
+
+@cocotb.test(skip=(scale.factor == 1 or SESSION))
+async def differential_test(dut):
+    ''' Replays random windows of a cycle_model profile and compares every cycle with the model (needs TIME_SCALE > 1) '''
+    dut._log.info("Differential test: {w} windows of {n} cycles, profile {p} seed {s}".format(
+        w=DIFF_WINDOWS, n=DIFF_WINDOW, p=DIFF_PROFILE, s=DIFF_SEED))
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    _, sa, sb = cycle_model.profile_stimulus(DIFF_SEED, DIFF_PROFILE, DIFF_CYCLES)
+    model = cycle_model.SystemModel(scale)
+    starts = np.random.default_rng([DIFF_SEED, DIFF_PROFILE]).integers(0, DIFF_CYCLES - DIFF_WINDOW + 1, DIFF_WINDOWS)
+    differ = 0
+    for window in np.sort(starts).tolist():
+        w_sa, w_sb = sa[window:window + DIFF_WINDOW], sb[window:window + DIFF_WINDOW]
+        # Model edge 0 is DUT edge origin, its inputs are written mid-cycle before it
+        origin = get_sim_time('ps')//(PERIOD_NS*1000) + 2
+        await Timer((origin - 1)*PERIOD_NS*1000 + PERIOD_NS*500 - get_sim_time('ps'), 'ps')
+        enabled = read_value(dut.self_test_inst.en) == 1
+        recorder = EdgeRecorder({name: getattr(dut, name) for name in DIFF_SIGNALS}, signed=('velocity_internal',))
+        recorder.start()
+        await profile(drive_timed({'reset': dut.reset, 'SA': dut.SA, 'SB': dut.SB},
+                                  window_plan(w_sa, w_sb, origin, DIFF_RELEASE), PERIOD_NS))
+        recorder.stop()
+
+        measured = recorded_cycles(recorder, origin, DIFF_WINDOW)
+        wall = time.perf_counter()
+        expected = model.run(w_sa, w_sb, DIFF_RELEASE, seg7_counter(measured['c'], DIFF_RELEASE), enabled)
+        dut._log.info("Window at {w}: model {s:.3f}s".format(w=window, s=time.perf_counter() - wall))
+        differ += compare_cycles(dut, window, expected, measured, DIFF_RELEASE)
+    profiler.report(dut)
+    assert differ == 0, "cycle_model differs from the DUT in {n} signal traces".format(n=differ)
+
+@cocotb.test(skip=not ENCODER_CAPTURE or SESSION)
+async def replay_test(dut):
+    ''' Replays a recorded encoder capture (ENCODER_CAPTURE) into SA/SB and checks the decoder pulses '''
+    dut._log.info("Replaying {f}".format(f=ENCODER_CAPTURE))
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    profiler.start()
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+
+    reset = CyclePlan([start, start + 1], start + 2, reset=[1, 0], SA=[0, 0], SB=[0, 0])
+    await profile(drive_timed({'reset': dut.reset, 'SA': dut.SA, 'SB': dut.SB}, reset, PERIOD_NS))
+    pulses = PulseScoreboard(dut, dut.pos_inc_int, dut.pos_dec_int, PERIOD_NS)
+    decoder = StreamDecoder(PERIOD_NS, first_edge(reset))
+    capture = EncoderCapture(ENCODER_CAPTURE, ENCODER_CAPTURE_UNIT)
+    wall = time.perf_counter()
+    driven = await profile(replay(dut.SA, dut.SB, capture, PERIOD_NS*1000, ENCODER_RESAMPLE, on_chunk=decoder.add))
+    # Let the last change through the synchronizer and the decoder
+    await ClockCycles(dut.mclk, 4)
+    profiler.report(dut)
+
+    dut._log.info("Replayed {n} SA/SB changes over {t:.0f} ns in {w:.2f}s wall time".format(
+        n=driven, t=get_sim_time('ns') - start*PERIOD_NS, w=time.perf_counter() - wall))
+    pulses.check(*decoder.finish())
+
+# Scenario session (TB_SCENARIOS, see session.py): encoder profiles back to back, each
+# after its own reset pulse and checked by its own scoreboards. Speeds are real rpm.
+SESSION_SCENARIOS = [
+    {'kind': 'rotations', 'name': 'forward', 'rotations': 10, 'step_cycles': 11},
+    {'kind': 'rotations', 'name': 'reverse', 'rotations': 10, 'step_cycles': 11, 'direction': -1},
+    {'kind': 'rotations', 'name': 'jitter', 'rotations': 10, 'step_cycles': 11, 'jitter': 3, 'illegal': 4},
+    {'kind': 'rpm', 'name': 'full_speed', 'rpm': MAX_RPM, 'steps': 200},
+    {'kind': 'rpm', 'name': 'reversal', 'rpm': [MAX_RPM, -MAX_RPM], 'steps': 400, 'jitter': 2},
+]
+
+async def encoder_scenario(dut, plan_of, seed=None):
+    ''' Reset pulse, then the encoder plan plan_of(start, rng) right after the release (no
+        settling time), checked against the golden model '''
+    start = round(get_sim_time('ns')/PERIOD_NS)
+    start_soon(profile(Clock(dut.mclk, PERIOD_NS, units="ns").start(), 'Clock'))
+    rng = np.random.default_rng(cocotb.RANDOM_SEED if seed is None else seed)
+    plan = with_reset(plan_of(start + 1, rng), start)
+    scoreboard = velocity_scoreboard(dut, plan, first_edge(plan))
+    pulses = PulseScoreboard(dut, dut.pos_inc_int, dut.pos_dec_int, PERIOD_NS)
+    seg7 = seg7_monitor(dut)
+    await profile(QuadratureDriver(dut, ENCODER, PERIOD_NS).drive(plan, reset=dut.reset))
+    seg7.stop()
+
+    pulses.check(*golden_model.decode_quadrature(plan.sampled(), plan.values['SA'], plan.values['SB'], first_edge(plan)))
+    scoreboard.check()
+    seg7.check(scoreboard.tick_edges, scoreboard.expected, first_edge(plan))
+
+async def rotations_scenario(dut, seed=None, **options):
+    ''' Whole rotations at a fixed step rate, ending one 10 ms tick after the last step '''
+    await encoder_scenario(dut, lambda start, rng: rotations_plan(
+        start, rng, tail=scale.ten_ms_count, names=ENCODER, **options), seed)
+
+async def rpm_scenario(dut, rpm=MAX_RPM, steps=200, seed=None, **options):
+    ''' A constant or linear rpm profile, ending one 10 ms tick after the last step '''
+    await encoder_scenario(dut, lambda start, rng: rpm_profile_plan(
+        start, rng, PERIOD_NS*scale.factor, rpm, steps, tail=scale.ten_ms_count, names=ENCODER, **options), seed)
+
+register(globals(), {'rotations': rotations_scenario, 'rpm': rpm_scenario}, SESSION_SCENARIOS)
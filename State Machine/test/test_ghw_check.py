@@ -0,0 +1,26 @@
+'''
+test_ghw_check.py : Runs the post-simulation checks (make check) on the committed dump.
+
+  usage:
+    python -m pytest test_ghw_check.py
+'''
+import logging
+import os
+import subprocess
+import sys
+
+from tb_log import tb_logger
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DUMP = os.path.join(TEST_DIR, 'top_level_system.ghw')
+
+def test_ghw_check_passes_on_committed_dump():
+    result = subprocess.run([sys.executable, 'ghw_check.py', DUMP, '--time-scale', '1'], cwd=TEST_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert result.returncode == 0, result.stdout
+    assert result.stdout.rstrip().endswith('PASSED'), result.stdout
+
+def test_tb_logger_of_plain_logger():
+    log = logging.getLogger('test_ghw_check')
+    assert tb_logger(log).log is log
+    assert tb_logger(log) is tb_logger(log)
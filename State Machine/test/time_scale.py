@@ -0,0 +1,61 @@
+'''
+time_scale.py : Scaled-time simulation of top_level_system.
+
+  With the default generics one self-test ROM entry lasts 300 000 000 cycles,
+  which makes a sweep through pwm_values.txt impossible to simulate.
+  TIME_SCALE (environment variable, default 1) divides the slow counters of
+  top_level_system; the testbenches read the same factor to scale the
+  thresholds and model parameters that depend on them.
+
+  The PWM period is not scaled: pwm.vhd compares the top 8 bits of its
+  14-bit counter with the duty cycle, so its period is fixed at 2**14 cycles
+  and the PMOD limits in tb_pwm (PWM_TIMEOUT_MS, TOO_FAST_PWM_US) stay valid.
+
+  usage (prints the GHDL generic overrides, used by the makefile):
+    python time_scale.py 1000
+'''
+import os
+import sys
+
+#design constants (top_level_system.vhd generics at TIME_SCALE = 1)
+SELF_TEST_COUNT = 300_000_000
+TEN_MS_COUNT = 1_000_000
+SEG7_COUNT = 50_000
+
+class TimeScale():
+    ''' Generic overrides and scaled counter limits for one scale factor '''
+    def __init__(self, factor=None):
+        if factor is None: factor = os.environ.get('TIME_SCALE', 1)
+        self.factor = int(factor)
+        assert self.factor >= 1, "TIME_SCALE must be a positive integer"
+
+    def scale(self, count):
+        ''' Scaled counter limit, never below one cycle '''
+        return max(count//self.factor, 1)
+
+    @property
+    def self_test_count(self):
+        ''' Cycles per self-test ROM entry '''
+        return self.scale(SELF_TEST_COUNT)
+
+    @property
+    def ten_ms_count(self):
+        ''' Cycles between velocity updates '''
+        return self.scale(TEN_MS_COUNT)
+
+    @property
+    def seg7_count(self):
+        ''' Cycles each seven-segment digit is shown '''
+        return self.scale(SEG7_COUNT)
+
+    def generics(self):
+        ''' Generic overrides for top_level_system '''
+        return {'SELF_TEST_COUNT': self.self_test_count,
+                'TEN_MS_COUNT': self.ten_ms_count,
+                'SEG7_COUNT': self.seg7_count}
+
+    def ghdl_args(self):
+        return ['-g{k}={v}'.format(k=k, v=v) for k, v in self.generics().items()]
+
+if __name__ == '__main__':
+    print(' '.join(TimeScale(sys.argv[1] if len(sys.argv) > 1 else None).ghdl_args()))
@@ -0,0 +1,158 @@
+'''
+vhdl_cache.py : Content-hash compile cache for GHDL analysis of src/*.vhd.
+
+  Every source file is keyed on the SHA-256 of its content and the VHDL
+  standard. Only changed files and the files that depend on them
+  (e.g. seg7_pkg -> seg7ctrl -> top_level_system) are re-analyzed; the
+  resulting library is shared by all testbenches, so an edit-run cycle
+  only pays for elaboration.
+
+  Only regression.py (and benchmark.py through it) uses the cache. A plain
+  `make` run still analyzes through cocotb's own GHDL rules: `ghdl -i` of
+  every source into sim_build, then `ghdl -m`, which only checks file
+  timestamps. Use `python regression.py --bench <tb> --seed <n>` for cached
+  edit-run cycles.
+
+  The cache only ever deletes its own files. A workdir without the manifest
+  must be empty or hold nothing but GHDL library files (*.cf, *.o).
+
+  usage:
+    python vhdl_cache.py [--workdir DIR] [--std 08] [sources ...]
+'''
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TEST_DIR, '..', 'src')
+CACHE_DIR = os.path.join(TEST_DIR, 'regression', 'shared')
+MANIFEST = 'vhdl_cache.json'
+
+# Design units declared by a file, and the units it refers to
+DECLARES = re.compile(r'^\s*(?:entity|package)\s+(\w+)\s+is\b', re.I | re.M)
+REFERENCES = re.compile(
+    r'^\s*use\s+work\.(\w+)|\bcomponent\s+(\w+)|\bentity\s+work\.(\w+)|^\s*architecture\s+\w+\s+of\s+(\w+)',
+    re.I | re.M)
+COMMENT = re.compile(r'--.*$', re.M)
+
+def sources():
+    return sorted(glob.glob(os.path.join(SRC_DIR, '*.vhd*')))
+
+def digest(text, std):
+    return hashlib.sha256((std + '\0' + text).encode()).hexdigest()
+
+def scan(path):
+    ''' Returns (declared units, referenced units) of a VHDL file, comments ignored '''
+    with open(path, encoding='latin-1') as f:
+        text = COMMENT.sub('', f.read())
+    declared = {name.lower() for name in DECLARES.findall(text)}
+    referenced = {next(g for g in groups if g).lower() for groups in REFERENCES.findall(text)}
+    return declared, referenced - declared
+
+def dependency_order(files):
+    ''' Sorts files so that every file comes after the files declaring what it uses.
+        files maps path -> (declared, referenced). Returns (order, depends_on). '''
+    owner = {unit: path for path, (declared, _) in files.items() for unit in declared}
+    depends_on = {path: sorted({owner[unit] for unit in referenced if unit in owner} - {path})
+                  for path, (_, referenced) in files.items()}
+    order, done = [], set()
+    def visit(path, stack=()):
+        if path in done: return
+        if path in stack: raise ValueError("Circular dependency through " + path)
+        for dep in depends_on[path]: visit(dep, stack + (path,))
+        done.add(path)
+        order.append(path)
+    for path in sorted(files): visit(path)
+    return order, depends_on
+
+def dependents(changed, depends_on):
+    ''' All files that (transitively) depend on any of the changed files '''
+    dirty = set(changed)
+    grew = True
+    while grew:
+        grew = False
+        for path, deps in depends_on.items():
+            if path not in dirty and dirty.intersection(deps):
+                dirty.add(path)
+                grew = True
+    return dirty
+
+def load_manifest(workdir, std):
+    try:
+        with open(os.path.join(workdir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('files', {}) if manifest.get('std') == std else {}
+
+def library_files(workdir):
+    return glob.glob(os.path.join(workdir, '*.cf')) + glob.glob(os.path.join(workdir, '*.o'))
+
+def check_workdir(workdir):
+    ''' Refuses a workdir that holds other files than a library of this cache '''
+    if not os.path.isdir(workdir) or os.path.isfile(os.path.join(workdir, MANIFEST)): return
+    others = set(os.listdir(workdir)) - {os.path.basename(path) for path in library_files(workdir)}
+    if others:
+        raise ValueError("{w} is not a vhdl_cache library (no {m}) and holds other files, e.g. {o}".format(
+            w=workdir, m=MANIFEST, o=sorted(others)[0]))
+
+def clear_library(workdir):
+    ''' Removes the GHDL library files and the manifest of workdir, nothing else '''
+    for path in library_files(workdir) + [os.path.join(workdir, MANIFEST)]:
+        if os.path.isfile(path): os.remove(path)
+
+def update(workdir=CACHE_DIR, paths=None, std='08', log=print):
+    ''' Brings the library in workdir up to date. Returns the list of analyzed files. '''
+    paths = [os.path.abspath(p) for p in (paths or sources())]
+    texts = {}
+    for path in paths:
+        with open(path, encoding='latin-1') as f: texts[path] = f.read()
+    hashes = {path: digest(texts[path], std) for path in paths}
+    files = {path: scan(path) for path in paths}
+    order, depends_on = dependency_order(files)
+
+    check_workdir(workdir)
+    cached = load_manifest(workdir, std)
+    if not cached or set(cached) - set(paths):
+        # New standard, no manifest or removed sources: start from an empty library
+        clear_library(workdir)
+        cached = {}
+    os.makedirs(workdir, exist_ok=True)
+
+    changed = [path for path in paths if cached.get(path) != hashes[path]]
+    dirty = dependents(changed, depends_on)
+    analyzed = [path for path in order if path in dirty]
+    for path in analyzed:
+        log("Analyzing " + os.path.basename(path))
+        result = subprocess.run(['ghdl', '-a', '--std=' + std, '--workdir=' + workdir, path],
+                                cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0:
+            # Forget the failed file so it is retried next time
+            cached.pop(path, None)
+            write_manifest(workdir, std, cached)
+            raise RuntimeError("ghdl -a {p} failed:\n{o}".format(p=path, o=result.stdout))
+        cached[path] = hashes[path]
+    write_manifest(workdir, std, cached)
+    return analyzed
+
+def write_manifest(workdir, std, files):
+    with open(os.path.join(workdir, MANIFEST), 'w') as f:
+        json.dump({'std': std, 'files': files}, f, indent=1, sort_keys=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', default=CACHE_DIR, help="library directory")
+    parser.add_argument('--std', default='08', help="VHDL standard")
+    parser.add_argument('sources', nargs='*', help="VHDL files (default: ../src/*.vhd)")
+    args = parser.parse_args(argv)
+    analyzed = update(args.workdir, args.sources or None, args.std)
+    print("{n} file(s) analyzed".format(n=len(analyzed)) if analyzed else "Library up to date")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())